@@ -47,6 +47,23 @@ class GreenReporter(ConsoleReporter):
         )
         self.outstream.write(output)
 
+    def add_success(self, task):
+        """Prints the time and memory of the stages the task ran"""
+        import instrument
+
+        stages = instrument.summary()
+        if stages:
+            self.outstream.write(Fore.GREEN + f"   {task.name}: {stages}\n" + Style.RESET_ALL)
+
+    def complete_run(self):
+        """Writes the stage records of the run"""
+        super().complete_run()
+        import instrument
+
+        file = instrument.write_run()
+        if file:
+            self.outstream.write(Fore.GREEN + f"   Stage timings written to {file}\n" + Style.RESET_ALL)
+
 
 if not in_slurm:
     DOIT_CONFIG = {
@@ -98,6 +115,21 @@ def copy_file(origin_path, destination_path, mkdir=True):
     return _copy_file
 
 
+def run_pipeline(*stages):
+    """Create a Python action running stages of the in-process pipeline.
+
+    The tasks share one pipeline, so frames loaded or computed by an earlier
+    task are passed on in memory instead of being read again.
+    """
+
+    def _run_pipeline():
+        import pipeline
+
+        pipeline.run(stages)
+
+    return _run_pipeline
+
+
 ##################################
 ## Begin rest of PyDoit tasks here
 ##################################
@@ -120,17 +152,18 @@ def task_pull_bloomberg():
     """Pulls treasury and swap yields from Bloomberg"""
     file_dep = [
         "./src/settings.py",
+        "./src/universe.py",
         "./src/pull_bloomberg.py",
+        "./data_manual/universe.csv",
     ]
     targets = [
-        DATA_DIR / 'bbg' / "raw_tyields.pkl",
-        DATA_DIR / 'bbg' / "raw_syields.pkl",
+        DATA_DIR / 'bbg' / "raw_tyields.parquet",
+        DATA_DIR / 'bbg' / "raw_syields.parquet",
     ]
 
     return {
         "actions": [
-            "ipython ./src/settings.py",
-            "ipython ./src/pull_bloomberg.py",
+            run_pipeline("raw_tyields", "raw_syields"),
         ],
         "targets": targets,
         "file_dep": file_dep,
@@ -145,16 +178,19 @@ def task_calc_swap_spreads():
     """Calculates the swap spreads"""
     file_dep = [
         "./src/settings.py",
+        "./src/universe.py",
         "./src/calc_swap_spreads.py",
+        "./src/calendars.py",
+        "./src/pipeline.py",
+        "./data_manual/universe.csv",
     ]
     targets = [
-        DATA_DIR / 'calc_spread' / 'calc_merged.pkl',
+        DATA_DIR / 'calc_spread' / 'calc_merged.parquet',
     ]
 
     return {
         "actions": [
-            "ipython ./src/settings.py",
-            "ipython ./src/calc_swap_spreads.py",
+            run_pipeline("calc"),
         ],
         "targets": targets,
         "file_dep": file_dep,
@@ -166,19 +202,73 @@ def task_calc_swap_spreads():
 ##############################$
 
 def task_supplementary():
-    """Runs the supplementary functions for plots and a table"""
+    """Runs the supplementary functions for plots and tables"""
     file_dep = [
         "./src/settings.py",
+        "./src/universe.py",
         "./src/supplementary.py",
+        "./src/bootstrap.py",
+        "./src/calendars.py",
+        "./src/pipeline.py",
+        "./data_manual/universe.csv",
     ]
     targets = [
         OUTPUT_DIR / 'table.txt',
+        OUTPUT_DIR / 'table_intervals.txt',
+    ]
+
+    return {
+        "actions": [
+            run_pipeline("table", "intervals", "replication"),
+        ],
+        "targets": targets,
+        "file_dep": file_dep,
+        "clean": [],
+    }
+
+
+def task_spread_stats():
+    """Computes the rolling, yearly and regime statistics of the spreads"""
+    file_dep = [
+        "./src/settings.py",
+        "./src/universe.py",
+        "./src/spread_stats.py",
+        "./src/pipeline.py",
+        "./data_manual/universe.csv",
+    ]
+    targets = [
+        OUTPUT_DIR / f"spread_stats_{name}.{ext}"
+        for name in ["summary", "yearly", "regime"]
+        for ext in ["tex", "csv"]
+    ] + [DATA_DIR / "stats" / "rolling_stats.parquet"]
+
+    return {
+        "actions": [
+            run_pipeline("stats"),
+        ],
+        "targets": targets,
+        "file_dep": file_dep,
+        "clean": [],
+    }
+
+
+def task_backtest():
+    """Backtests mean reversion trades on the spreads over a parameter grid"""
+    file_dep = [
+        "./src/settings.py",
+        "./src/universe.py",
+        "./src/backtest.py",
+        "./src/pipeline.py",
+        "./data_manual/universe.csv",
+    ]
+    targets = [
+        OUTPUT_DIR / "backtest_summary.csv",
+        OUTPUT_DIR / "backtest_best.tex",
     ]
 
     return {
         "actions": [
-            "ipython ./src/settings.py",
-            "ipython ./src/supplementary.py",
+            run_pipeline("backtest"),
         ],
         "targets": targets,
         "file_dep": file_dep,
@@ -192,7 +282,7 @@ def task_supplementary():
 
 def task_plot_figure():
     """Create the replicated, updated, and supplementary plots"""
-    files = ["plot_figure.py"]
+    files = ["plot_figure.py", "pipeline.py"]
     file_dep = [Path("./src") / x for x in files]
     file_output = ["replicated_swap_spread_arb_figure.png", 
                    'updated_swap_spread_arb_figure.png']
@@ -200,7 +290,7 @@ def task_plot_figure():
 
     return {
         "actions": [
-            "ipython ./src/plot_figure.py",
+            run_pipeline("figures"),
         ],
         "targets": targets,
         "file_dep": file_dep,
@@ -0,0 +1,261 @@
+"""
+Vectorized backtest of mean reversion trades on the arbitrage spreads.
+
+On every date a tenor whose spread deviates from its trailing mean by more
+than the entry threshold opens a trade against the deviation: short the spread
+when it is wide, long when it is narrow. Every trade is held for a fixed number
+of days and sized 1 / holding, so overlapping trades add up to a position
+between -1 and 1 spread unit. The deviation is measured as a z-score against
+the trailing mean and standard deviation ('zscore' rule), or in bps from the
+trailing mean ('level' rule). Transaction costs are charged in bps on every
+change of the position.
+
+The positions of all parameter combinations come from one cumulative sum of
+the entry signals, the daily PnL from one broadcasted product with the spread
+changes, and the metrics of every cost from sums of the gross PnL and the
+turnover, so no loop runs over days. Tenors are independent and can be
+sharded across a process pool.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from settings import config
+from spread_stats import _window_sums
+from universe import spread_tenors
+
+output_dir = Path(config("OUTPUT_DIR"))
+
+LOOKBACKS = (21, 63, 126, 252)
+ENTRIES = {'zscore': (1.0, 1.5, 2.0, 2.5, 3.0), 'level': (2.0, 5.0, 10.0, 20.0)}
+HOLDINGS = (5, 10, 21, 63)
+COSTS = (0.5, 1.0, 2.0)
+DAYS_PER_YEAR = 252
+PARAMS = ['lookback', 'entry', 'holding', 'cost']
+
+def deviations(spread, lookbacks, rule = 'zscore'):
+    """Deviation of a spread from its trailing mean for every lookback
+
+    :param spread: Spreads in bps, NaN where missing
+    :type spread: np.ndarray
+    :param lookbacks: Trailing window lengths in observations
+    :type lookbacks: list
+    :param rule: 'zscore' or 'level'
+    :type rule: str, default = 'zscore'
+
+    :return: Array of shape (lookback, date), NaN until a window is full
+    :rtype: np.ndarray
+    """
+    if rule not in ENTRIES:
+        raise ValueError(f'rule must be one of {list(ENTRIES)}, not {rule}')
+    valid = ~np.isnan(spread)
+    center = np.nanmean(spread) if valid.any() else 0.0
+    x = np.where(valid, spread - center, 0)[:, None]
+    count = _window_sums(valid[:, None].astype(np.float64), lookbacks)[..., 0]
+    s1 = _window_sums(x, lookbacks)[..., 0]
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean = s1 / count
+        full = count >= np.asarray(lookbacks)[:, None]
+        deviation = np.where(full & valid, spread - center - mean, np.nan)
+        if rule == 'level':
+            return deviation
+        s2 = _window_sums(x * x, lookbacks)[..., 0]
+        std = np.sqrt(np.maximum(s2 - s1 * s1 / count, 0) / (count - 1))
+        return deviation / std
+
+def positions(signals, holdings):
+    """Positions of trades opened on the signals and held for a number of
+    days, from one cumulative sum
+
+    :param signals: Entry signals in {-1, 0, 1}, of shape (..., date)
+    :type signals: np.ndarray
+    :param holdings: Holding periods in days
+    :type holdings: list
+
+    :return: Array of shape (..., holding, date)
+    :rtype: np.ndarray
+    """
+    n = signals.shape[-1]
+    csum = np.zeros(signals.shape[:-1] + (n + 1,))
+    np.cumsum(signals, axis = -1, out = csum[..., 1:])
+    ends = np.arange(1, n + 1)
+    holdings = np.asarray(holdings)
+    starts = np.maximum(ends[None, :] - holdings[:, None], 0)
+    return (csum[..., None, ends] - csum[..., starts]) / holdings[:, None]
+
+def backtest_tenor(spread, lookbacks = LOOKBACKS, entries = None, holdings = HOLDINGS,
+                   costs = COSTS, rule = 'zscore', keep_pnl = False):
+    """Backtests every parameter combination on one spread
+
+    :param spread: Spreads in bps, NaN where missing
+    :type spread: np.ndarray
+    :param lookbacks: Trailing window lengths
+    :type lookbacks: list
+    :param entries: Entry thresholds, defaults to ENTRIES[rule]
+    :type entries: list
+    :param holdings: Holding periods in days
+    :type holdings: list
+    :param costs: Transaction costs in bps per unit of position traded
+    :type costs: list
+    :param rule: 'zscore' or 'level'
+    :type rule: str, default = 'zscore'
+    :param keep_pnl: If set to True, the daily net PnL of every combination
+    is also returned
+    :type keep_pnl: bool, default = False
+
+    :return: Metrics of shape (lookback, entry, holding, cost) per metric,
+    and the PnL of shape (lookback, entry, holding, cost, date) if kept
+    :rtype: tuple(dict, np.ndarray)
+    """
+    entries = ENTRIES[rule] if entries is None else entries
+    # Missing spreads keep the last one, so a gap is marked to market on the next valid date
+    filled = pd.Series(spread).ffill().to_numpy()
+    change = np.nan_to_num(np.diff(filled, prepend = np.nan))
+
+    dev = deviations(spread, lookbacks, rule)
+    threshold = np.asarray(entries, dtype = np.float64)[None, :, None]
+    with np.errstate(invalid = 'ignore'):
+        signals = (np.where(dev[:, None] < -threshold, 1, 0)
+                   - np.where(dev[:, None] > threshold, 1, 0)).astype(np.int8)
+    pos = positions(signals, holdings)
+
+    # The position held over the previous day earns the spread change
+    gross = np.zeros_like(pos)
+    gross[..., 1:] = pos[..., :-1] * change[1:]
+    turnover = np.abs(np.diff(pos, axis = -1, prepend = 0))
+
+    costs = np.asarray(costs, dtype = np.float64)
+    n = len(spread)
+    g, u = gross.sum(-1)[..., None], turnover.sum(-1)[..., None]
+    gg, gu, uu = (gross * gross).sum(-1)[..., None], (gross * turnover).sum(-1)[..., None], \
+        (turnover * turnover).sum(-1)[..., None]
+    total = g - costs * u
+    mean = total / n
+    var = np.maximum((gg - 2 * costs * gu + costs ** 2 * uu) / n - mean ** 2, 0)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        sharpe = np.where(var > 0, mean / np.sqrt(var) * np.sqrt(DAYS_PER_YEAR), np.nan)
+
+    # One cost at a time keeps a single (lookback, entry, holding, date) PnL in memory
+    drawdown = np.empty(total.shape)
+    pnl = np.empty(total.shape + (n,)) if keep_pnl else None
+    for c, cost in enumerate(costs):
+        net = gross - cost * turnover
+        cum = np.cumsum(net, axis = -1)
+        drawdown[..., c] = (cum - np.maximum.accumulate(np.maximum(cum, 0), axis = -1)).min(axis = -1)
+        if keep_pnl:
+            pnl[..., c, :] = net
+
+    metrics = {
+        'pnl_bps': total,
+        'annual_pnl_bps': mean * DAYS_PER_YEAR,
+        'annual_vol_bps': np.sqrt(var * DAYS_PER_YEAR),
+        'sharpe': sharpe,
+        'max_drawdown_bps': drawdown,
+        'trades': np.broadcast_to(np.abs(signals).sum(-1)[:, :, None, None], total.shape),
+        'exposure': np.broadcast_to((pos != 0).mean(-1)[..., None], total.shape),
+    }
+    return metrics, pnl
+
+def _backtest_args(args):
+    return backtest_tenor(*args)[0]
+
+def parameter_grid(lookbacks = LOOKBACKS, entries = None, holdings = HOLDINGS, costs = COSTS,
+                   rule = 'zscore'):
+    """Parameter combinations in the order of the backtest metrics
+
+    :rtype: pd.MultiIndex
+    """
+    entries = ENTRIES[rule] if entries is None else entries
+    return pd.MultiIndex.from_tuples(list(product(lookbacks, entries, holdings, costs)), names = PARAMS)
+
+def run_backtest(calc_df, lookbacks = LOOKBACKS, entries = None, holdings = HOLDINGS,
+                 costs = COSTS, rule = 'zscore', tenors = None, curve = None,
+                 max_workers = None, top = 5):
+    """Backtests every parameter combination on every tenor
+
+    :param calc_df: DataFrame containing the arbitrage calculations
+    :type calc_df: pd.DataFrame
+    :param lookbacks: Trailing window lengths
+    :type lookbacks: list
+    :param entries: Entry thresholds, z-scores or bps depending on rule,
+    defaults to ENTRIES[rule]
+    :type entries: list
+    :param holdings: Holding periods in days
+    :type holdings: list
+    :param costs: Transaction costs in bps per unit of position traded
+    :type costs: list
+    :param rule: 'zscore' or 'level'
+    :type rule: str, default = 'zscore'
+    :param tenors: Tenor labels, defaults to every tenor of the curve
+    :type tenors: list
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+    :param max_workers: Number of processes the tenors are sharded across,
+    defaults to BACKTEST_MAX_WORKERS, and to the number of cores if that is 0.
+    1 runs in this process.
+    :type max_workers: int
+    :param top: Number of combinations with the highest Sharpe ratio per
+    tenor whose daily PnL is returned
+    :type top: int, default = 5
+
+    :return: Metrics with one row per tenor and parameter combination, and
+    the daily net PnL in bps of the top combinations with (tenor, lookback,
+    entry, holding, cost) columns
+    :rtype: tuple(pd.DataFrame, pd.DataFrame)
+    """
+    entries = ENTRIES[rule] if entries is None else entries
+    tenors = spread_tenors(curve) if tenors is None else tenors
+    max_workers = config('BACKTEST_MAX_WORKERS') if max_workers is None else max_workers
+    max_workers = min(max_workers or os.cpu_count() or 1, len(tenors))
+
+    spreads = calc_df[[f'Arb_Swap_{tenor}' for tenor in tenors]].to_numpy(np.float64)
+    args = [(spreads[:, k], lookbacks, entries, holdings, costs, rule) for k in range(len(tenors))]
+    if max_workers <= 1:
+        results = [_backtest_args(x) for x in args]
+    else:
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            results = list(executor.map(_backtest_args, args))
+
+    grid = parameter_grid(lookbacks, entries, holdings, costs, rule)
+    frames = [pd.DataFrame({name: values.ravel() for name, values in result.items()}, index = grid)
+              for result in results]
+    summary = pd.concat(frames, keys = tenors, names = ['tenor'])
+
+    pnl = {}
+    for k, tenor in enumerate(tenors):
+        best = summary.loc[tenor, 'sharpe'].dropna().nlargest(top).index
+        if not len(best):
+            continue
+        lookback_set = sorted({x[0] for x in best})
+        metrics, daily = backtest_tenor(spreads[:, k], lookback_set, entries, holdings, costs, rule,
+                                        keep_pnl = True)
+        for lookback, entry, holding, cost in best:
+            pnl[(tenor, lookback, entry, holding, cost)] = daily[
+                lookback_set.index(lookback), list(entries).index(entry),
+                list(holdings).index(holding), list(costs).index(cost)]
+    pnl = pd.DataFrame(pnl, index = calc_df.index)
+    if len(pnl.columns):
+        pnl.columns.names = ['tenor'] + PARAMS
+    return summary, pnl
+
+def backtest_main(calc_df):
+    """Backtests the default parameter grid and saves the metrics to
+    OUTPUT_DIR/backtest_summary.csv and the best combinations of every tenor
+    to OUTPUT_DIR/backtest_best.tex
+
+    :param calc_df: DataFrame containing the arbitrage calculations
+    :type calc_df: pd.DataFrame
+
+    :return: The metrics and the PnL of the top combinations
+    :rtype: tuple(pd.DataFrame, pd.DataFrame)
+    """
+    summary, pnl = run_backtest(calc_df)
+    summary.to_csv(os.path.join(output_dir, 'backtest_summary.csv'))
+    best = summary.loc[summary.groupby(level = 'tenor', sort = False)['sharpe'].idxmax().dropna()]
+    with open(os.path.join(output_dir, 'backtest_best.tex'), 'w') as table:
+        table.write(best.to_latex(float_format = '%.2f'))
+    return summary, pnl
@@ -0,0 +1,280 @@
+"""
+Benchmarks the pipeline stages on synthetic yield curves.
+
+Every stage is timed (best of several repeats) and memory profiled (peak
+traced allocation) on each configured size. The results of each run are
+appended to OUTPUT_DIR/benchmarks/benchmarks.csv together with the git
+commit, and compared with the previous run so regressions are visible.
+
+The startup cost of the modules is measured separately, each imported in a
+fresh interpreter, and checked against IMPORT_TARGET_RATIO times the import of
+the libraries every module needs, measured in the same run so the budget holds
+on slow machines, and against loading the Bloomberg client or the plotting
+stack.
+
+Usage:
+```
+python ./src/benchmarks.py 25y_daily 25y_hourly --repeat 3
+python ./src/benchmarks.py --imports
+```
+"""
+
+import os
+import gc
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+from instrument import _git_commit
+from settings import config
+from synthetic import synthetic_yields
+from universe import govt_tickers, govt_rename, swap_tickers
+
+output_dir = Path(config("OUTPUT_DIR"))
+
+## Sizes from 25 years of daily data to 25 years of minutely data
+SIZES = {
+    'tiny': dict(start = '2023-01-01', end = '2023-03-31', freq = 'B'),
+    '25y_daily': dict(start = '2000-01-01', end = '2024-12-31', freq = 'B'),
+    '25y_hourly': dict(start = '2000-01-01', end = '2024-12-31', freq = 'h'),
+    '25y_15min': dict(start = '2000-01-01', end = '2024-12-31', freq = '15min'),
+    '25y_minutely': dict(start = '2000-01-01', end = '2024-12-31', freq = 'min'),
+}
+
+STAGES = ['fetch_bdh', 'clean_raw_tyields', 'clean_raw_syields', 'calc_swap_spreads',
+          'sup_table', 'replication_df', 'plot_figure', 'get_spreads']
+
+def _stage_calls(raw_t, raw_s, work_dir):
+    """The stage functions with their arguments. Later stages use the outputs
+    of earlier ones, which are computed lazily and shared.
+    """
+    from pull_bloomberg import fetch_bdh, clean_raw_tyields, clean_raw_syields
+    from fake_blp import FakeBlp
+    from calc_swap_spreads import calc_swap_spreads
+    from supplementary import sup_table, replication_df
+    from plot_figure import plot_figure
+    from store import save_frame
+    from query import get_spreads
+
+    cache = {}
+    def t_df():
+        if 't' not in cache:
+            cache['t'] = clean_raw_tyields(raw_t, save_data = False)
+        return cache['t']
+    def s_df():
+        if 's' not in cache:
+            cache['s'] = clean_raw_syields(raw_s, save_data = False)
+        return cache['s']
+    def calc_df():
+        if 'calc' not in cache:
+            cache['calc'] = calc_swap_spreads(t_df(), s_df())
+        return cache['calc']
+    def calc_file():
+        if 'file' not in cache:
+            cache['file'] = os.path.join(work_dir, 'calc_merged.parquet')
+            save_frame(calc_df(), cache['file'])
+        return cache['file']
+    def query_window():
+        # A one year window ending at the last date
+        end = pd.Timestamp(calc_df().index[-1])
+        return get_spreads(['2', '10'], end - pd.DateOffset(years = 1), end, file = calc_file())
+
+    def pull():
+        # Daily swap yields over the dates of the size, from a simulated terminal
+        source = FakeBlp(latency = config('BBG_SIM_LATENCY'), failure_rate = config('BBG_SIM_FAILURE_RATE'))
+        return fetch_bdh(swap_tickers(), pd.Timestamp(raw_s.index[0]), pd.Timestamp(raw_s.index[-1]),
+                         source = source, backoff = 0)
+
+    return {
+        'fetch_bdh': pull,
+        'clean_raw_tyields': lambda: clean_raw_tyields(raw_t, save_data = False),
+        'clean_raw_syields': lambda: clean_raw_syields(raw_s, save_data = False),
+        'calc_swap_spreads': lambda: calc_swap_spreads(t_df(), s_df()),
+        'sup_table': lambda: sup_table(calc_df(), os.path.join(work_dir, 'table.txt')),
+        'replication_df': lambda: replication_df(t_df(), s_df()),
+        'plot_figure': lambda: plot_figure(calc_df(), os.path.join(work_dir, 'figure.png')),
+        'get_spreads': query_window,
+    }
+
+## Libraries imported by every module, whose import time is the baseline
+BASELINE_IMPORT = 'numpy, pandas, pyarrow.parquet'
+## Startup budget of a module as a multiple of the baseline
+IMPORT_TARGET_RATIO = 2.0
+## Modules which are only imported when a pull or a plot is performed
+HEAVY_MODULES = ['xbbg', 'blpapi', 'matplotlib']
+IMPORT_MODULES = ['settings', 'calc_swap_spreads', 'pull_bloomberg', 'supplementary',
+                  'plot_figure', 'pipeline', 'stream_spreads']
+
+def import_time(module, repeat = 3):
+    """Measures the import of a module in a fresh interpreter
+
+    :param module: Module name
+    :type module: str
+    :param repeat: Number of imports, the fastest is reported
+    :type repeat: int, default = 3
+
+    :return: Seconds of the fastest import and the heavy modules it loaded
+    :rtype: tuple(float, list)
+    """
+    code = ('import sys, time; start = time.perf_counter(); '
+            f'import {module}; print(time.perf_counter() - start); '
+            f'print(",".join(x for x in {HEAVY_MODULES!r} if x in sys.modules))')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.abspath(__file__)),
+                                         env.get('PYTHONPATH', '')])
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True,
+                             check = True, env = env).stdout.splitlines()
+        times.append(float(out[0]))
+    heavy = out[1].split(',') if len(out) > 1 and out[1] else []
+    return min(times), heavy
+
+def check_imports(modules = IMPORT_MODULES, target = IMPORT_TARGET_RATIO, repeat = 3):
+    """Prints the import time of each module and flags the modules above the
+    target or loading a heavy module
+
+    :param modules: Module names
+    :type modules: list
+    :param target: Import time budget as a multiple of the BASELINE_IMPORT time
+    :type target: float, default = IMPORT_TARGET_RATIO
+    :param repeat: Number of imports of each module
+    :type repeat: int, default = 3
+
+    :return: Import time, its ratio to the baseline and heavy modules of each
+    module
+    :rtype: pd.DataFrame
+    """
+    baseline, _ = import_time(BASELINE_IMPORT, repeat)
+    print(f'{"baseline":>18}: {baseline:9.4f}s')
+    rows = []
+    for module in modules:
+        seconds, heavy = import_time(module, repeat)
+        flag = '  SLOW' if seconds > target * baseline else ''
+        flag += f'  LOADS {",".join(heavy)}' if heavy else ''
+        print(f'{module:>18}: {seconds:9.4f}s{flag}')
+        rows.append({'module': module, 'seconds': seconds, 'ratio': seconds / baseline, 'heavy': heavy})
+    return pd.DataFrame(rows)
+
+def measure(func, repeat = 3):
+    """Times a function and measures its peak traced memory
+
+    :param func: Function without arguments
+    :type func: callable
+    :param repeat: Number of timed calls, the fastest is reported
+    :type repeat: int, default = 3
+
+    :return: Seconds of the fastest call and peak memory in MB
+    :rtype: tuple(float, float)
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak / 2 ** 20
+
+def run_benchmarks(sizes = ('25y_daily',), stages = STAGES, repeat = 3, nan_density = 0.02,
+                   dtype = 'float', results_file = None):
+    """Runs the benchmarks and appends the results to the results file
+
+    :param sizes: Keys of SIZES to run
+    :type sizes: tuple
+    :param stages: Stages to run
+    :type stages: list
+    :param repeat: Number of timed calls of each stage
+    :type repeat: int, default = 3
+    :param nan_density: Share of missing cells in the synthetic data
+    :type nan_density: float, default = 0.02
+    :param dtype: Type of the raw synthetic data, 'float' or 'object'
+    :type dtype: str, default = 'float'
+    :param results_file: CSV file the results are appended to, defaults to
+    OUTPUT_DIR/benchmarks/benchmarks.csv
+    :type results_file: str
+
+    :return: The results of this run
+    :rtype: pd.DataFrame
+    """
+    if results_file is None:
+        results_file = os.path.join(output_dir, 'benchmarks', 'benchmarks.csv')
+    run_id = pd.Timestamp.now().strftime('%Y-%m-%dT%H:%M:%S')
+    commit = _git_commit()
+    t_tickers = [govt_rename().get(t, t) for t in govt_tickers()]
+    rows = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            params = SIZES[size]
+            raw_t = synthetic_yields(t_tickers, nan_density = nan_density, seed = 1, dtype = dtype, **params)
+            raw_s = synthetic_yields(swap_tickers(), nan_density = nan_density, seed = 2, dtype = dtype, **params)
+            calls = _stage_calls(raw_t, raw_s, work_dir)
+            for stage in stages:
+                seconds, peak_mb = measure(calls[stage], repeat)
+                print(f'{size:>14} {stage:>18}: {seconds:9.4f}s {peak_mb:9.1f}MB')
+                rows.append({
+                    'run_id': run_id, 'commit': commit, 'size': size, 'rows': len(raw_t),
+                    'stage': stage, 'seconds': seconds, 'peak_mb': peak_mb,
+                })
+    results = pd.DataFrame(rows)
+
+    os.makedirs(os.path.dirname(results_file), exist_ok = True)
+    if os.path.exists(results_file):
+        previous = pd.read_csv(results_file)
+        compare_runs(previous, results)
+        pd.concat([previous, results]).to_csv(results_file, index = False)
+    else:
+        results.to_csv(results_file, index = False)
+    return results
+
+def compare_runs(previous, results, threshold = 1.2):
+    """Prints the timing ratio of each stage against its latest earlier run
+    and flags regressions
+
+    :param previous: Earlier results
+    :type previous: pd.DataFrame
+    :param results: Results of this run
+    :type results: pd.DataFrame
+    :param threshold: Ratio above which a stage is flagged
+    :type threshold: float, default = 1.2
+
+    :return: Results with the earlier timings and the ratios
+    :rtype: pd.DataFrame
+    """
+    last = previous.groupby(['size', 'stage']).tail(1)[['size', 'stage', 'seconds', 'peak_mb']]
+    merged = results.merge(last, on = ['size', 'stage'], how = 'left', suffixes = ('', '_prev'))
+    merged['ratio'] = merged['seconds'] / merged['seconds_prev']
+    for row in merged.dropna(subset = ['ratio']).itertuples():
+        flag = '  REGRESSION' if row.ratio > threshold else ''
+        print(f'{row.size:>14} {row.stage:>18}: {row.seconds_prev:9.4f}s -> {row.seconds:9.4f}s '
+              f'(x{row.ratio:.2f}){flag}')
+    return merged
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the pipeline stages.')
+    parser.add_argument('sizes', nargs = '*', help = f'Any of {", ".join(SIZES)}, defaults to 25y_daily')
+    parser.add_argument('--stages', nargs = '*', default = STAGES, choices = STAGES)
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--nan-density', type = float, default = 0.02)
+    parser.add_argument('--dtype', default = 'float', choices = ['float', 'object'])
+    parser.add_argument('--imports', action = 'store_true', help = 'Only measure the import times')
+    args = parser.parse_args()
+    unknown = [x for x in args.sizes if x not in SIZES]
+    if unknown:
+        parser.error(f'unknown sizes {unknown}')
+    if args.imports:
+        check_imports(repeat = args.repeat)
+    else:
+        run_benchmarks(args.sizes or ['25y_daily'], args.stages, args.repeat, args.nan_density, args.dtype)
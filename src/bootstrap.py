@@ -0,0 +1,216 @@
+"""
+Block bootstrap of the mean spreads.
+
+Spreads are strongly autocorrelated, so the standard error of their mean is
+estimated by resampling blocks of consecutive dates rather than single dates:
+
+ - 'moving': blocks of a fixed length starting at uniformly drawn dates
+   (Kunsch)
+ - 'stationary': blocks of geometrically distributed length with the given
+   mean, wrapping around the end of the sample (Politis and Romano)
+
+The block length defaults to the automatic choice of Politis and White (2004,
+corrected by Patton, Politis and White 2009), taking the longest over the
+tenors. Rows are resampled jointly for every tenor, which keeps their
+correlation. The replicates are generated in batches of integer index arrays,
+each turned into counts of every date, so the means of all tenors in a batch
+come from one matrix product. Each batch draws from its own child of a
+SeedSequence, so the replicates only depend on the seed and the batch size,
+not on the number of processes the batches are spread across.
+"""
+
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from settings import config
+
+METHODS = ['stationary', 'moving']
+## Replicates drawn per batch, an (batch x date) index array at a time
+BATCH = 250
+
+def _flat_top(t):
+    t = np.abs(t)
+    return np.where(t <= 0.5, 1.0, np.where(t <= 1, 2 * (1 - t), 0.0))
+
+def optimal_block(x, method = 'stationary'):
+    """Block length of Politis and White for the mean of a series
+
+    :param x: Series, NaN where missing
+    :type x: np.ndarray
+    :param method: One of METHODS
+    :type method: str, default = 'stationary'
+
+    :rtype: int
+    """
+    x = np.asarray(x, dtype = np.float64)
+    x = x[~np.isnan(x)]
+    n = len(x)
+    if n < 8:
+        return 1
+    k_n = max(5, int(np.ceil(np.sqrt(np.log10(n)))))
+    m_max = min(int(np.ceil(np.sqrt(n))) + k_n, n - 1)
+    b_max = int(np.ceil(min(3 * np.sqrt(n), n / 3)))
+
+    x = x - x.mean()
+    size = 1 << int(2 * n - 1).bit_length()
+    spectrum = np.fft.rfft(x, size)
+    cov = np.fft.irfft(spectrum * np.conj(spectrum), size)[:m_max + 1] / n
+    if cov[0] <= 0:
+        return 1
+    rho = cov[1:] / cov[0]
+
+    # Smallest lag after which k_n autocorrelations in a row are insignificant
+    small = np.abs(rho) < 2 * np.sqrt(np.log10(n) / n)
+    runs = np.convolve(small, np.ones(k_n, dtype = int), 'valid') == k_n
+    m_hat = np.flatnonzero(runs)[0] if runs.any() else m_max
+    big_m = min(2 * max(m_hat, 1), m_max)
+
+    lags = np.arange(1, big_m + 1)
+    weights = _flat_top(lags / big_m)
+    g = 2 * np.sum(weights * lags * cov[lags])
+    s0 = cov[0] + 2 * np.sum(weights * cov[lags])
+    d = (2 if method == 'stationary' else 4 / 3) * s0 ** 2
+    if d <= 0:
+        return 1
+    block = (2 * g ** 2 / d) ** (1 / 3) * n ** (1 / 3)
+    return int(np.clip(np.ceil(block), 1, b_max))
+
+def block_indices(n, reps, block, method, rng):
+    """Row indices of block bootstrap resamples
+
+    :param n: Number of rows
+    :type n: int
+    :param reps: Number of resamples
+    :type reps: int
+    :param block: Block length, the mean length for 'stationary'
+    :type block: int
+    :param method: One of METHODS
+    :type method: str
+    :param rng: Random generator
+    :type rng: np.random.Generator
+
+    :return: Array of shape (reps, n)
+    :rtype: np.ndarray
+    """
+    if method not in METHODS:
+        raise ValueError(f'method must be one of {METHODS}, not {method}')
+    block = int(min(max(block, 1), n))
+    steps = np.arange(n)
+    if method == 'moving':
+        blocks = -(-n // block)
+        starts = rng.integers(0, n - block + 1, (reps, blocks))
+        return (starts[:, :, None] + steps[:block]).reshape(reps, -1)[:, :n]
+    # Geometric block lengths drawn until every resample is covered, each
+    # block adding the shift from its first row to its start to the rows
+    draw = -(-2 * n // block) + 8
+    lengths = np.minimum(rng.geometric(1 / block, (reps, draw)), n)
+    ends = np.cumsum(lengths, axis = 1)
+    while (ends[:, -1] < n).any():
+        lengths = np.concatenate([lengths, np.minimum(rng.geometric(1 / block, (reps, draw)), n)], axis = 1)
+        ends = np.cumsum(lengths, axis = 1)
+    firsts = ends - lengths
+    shifts = np.diff(rng.integers(0, n, firsts.shape) - firsts, axis = 1, prepend = 0)
+    rows, cols = np.nonzero(firsts < n)
+    idx = np.zeros((reps, n), dtype = np.int64)
+    idx[rows, firsts[rows, cols]] = shifts[rows, cols]
+    np.cumsum(idx, axis = 1, out = idx)
+    idx += steps
+    # Blocks wrap around the end of the sample
+    idx[idx >= n] -= n
+    return idx
+
+def _batch_means(values, valid, reps, block, method, seed):
+    """Means of every column over reps resamples, from the counts of every row
+    """
+    n = len(values)
+    idx = block_indices(n, reps, block, method, np.random.default_rng(seed))
+    idx += np.arange(reps)[:, None] * n
+    counts = np.bincount(idx.ravel(), minlength = reps * n).reshape(reps, n).astype(np.float64)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return (counts @ values) / (counts @ valid)
+
+def bootstrap_means(values, reps = 10000, block = None, method = 'stationary', seed = 0,
+                    max_workers = 1, batch = BATCH):
+    """Block bootstrap replicates of the column means
+
+    :param values: Array of shape (date x column), NaN where missing
+    :type values: np.ndarray
+    :param reps: Number of replicates
+    :type reps: int, default = 10000
+    :param block: Block length, defaults to the longest optimal_block of the
+    columns
+    :type block: int
+    :param method: One of METHODS
+    :type method: str, default = 'stationary'
+    :param seed: Seed of the SeedSequence the batches draw from
+    :type seed: int, default = 0
+    :param max_workers: Number of processes the batches are spread across, the
+    number of cores if 0. 1 runs in this process.
+    :type max_workers: int, default = 1
+    :param batch: Replicates per batch
+    :type batch: int, default = BATCH
+
+    :return: The replicates of shape (reps x column) and the block length
+    :rtype: tuple(np.ndarray, int)
+    """
+    values = np.asarray(values, dtype = np.float64)
+    if reps < 1:
+        raise ValueError(f'reps must be positive, not {reps}')
+    if method not in METHODS:
+        raise ValueError(f'method must be one of {METHODS}, not {method}')
+    if not block:
+        block = max([optimal_block(values[:, j], method) for j in range(values.shape[1])], default = 1)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0)
+    valid = valid.astype(np.float64)
+
+    sizes = [min(batch, reps - start) for start in range(0, reps, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(filled, valid, size, block, method, s) for size, s in zip(sizes, seeds)]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(args))
+    if max_workers <= 1:
+        parts = [_batch_means(*x) for x in args]
+    else:
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            parts = list(executor.map(_batch_means, *zip(*args)))
+    return np.concatenate(parts), block
+
+def bootstrap_intervals(values, reps = None, block = None, method = None, alpha = 0.05,
+                        seed = None, max_workers = None):
+    """Bootstrap standard errors and percentile intervals of the column means
+
+    :param values: Array of shape (date x column), NaN where missing
+    :type values: np.ndarray
+    :param reps: Number of replicates, defaults to BOOTSTRAP_REPS
+    :type reps: int
+    :param block: Block length, defaults to BOOTSTRAP_BLOCK, and to the
+    automatic choice if that is 0
+    :type block: int
+    :param method: One of METHODS, defaults to BOOTSTRAP_METHOD
+    :type method: str
+    :param alpha: One minus the confidence level of the intervals
+    :type alpha: float, default = 0.05
+    :param seed: Seed, defaults to BOOTSTRAP_SEED
+    :type seed: int
+    :param max_workers: Number of processes, defaults to BOOTSTRAP_MAX_WORKERS,
+    and to the number of cores if that is 0
+    :type max_workers: int
+
+    :return: The standard errors, lower and upper bounds per column, and the
+    block length
+    :rtype: tuple(np.ndarray, np.ndarray, np.ndarray, int)
+    """
+    reps = config('BOOTSTRAP_REPS') if reps is None else reps
+    block = config('BOOTSTRAP_BLOCK') if block is None else block
+    method = config('BOOTSTRAP_METHOD') if method is None else method
+    seed = config('BOOTSTRAP_SEED') if seed is None else seed
+    max_workers = config('BOOTSTRAP_MAX_WORKERS') if max_workers is None else max_workers
+    means, block = bootstrap_means(values, reps, block, method, seed, max_workers)
+    with warnings.catch_warnings():
+        # Columns without valid spreads get NaN bounds
+        warnings.simplefilter('ignore', RuntimeWarning)
+        se = np.nanstd(means, axis = 0, ddof = 1)
+        lower, upper = np.nanquantile(means, [alpha / 2, 1 - alpha / 2], axis = 0)
+    return se, lower, upper, block
@@ -3,53 +3,189 @@ Responsible for calculating the spreads, and saving them.
 """
 
 import pandas as pd
-from pull_bloomberg import *
+import numpy as np
+import os
+import tempfile
+from universe import curve_calendar, load_universe, spread_pairs
+from calendars import CALENDAR_VERSION, align_index, asof_chunks, asof_positions, take
+from stage_cache import cached
+from instrument import instrumented
 from pathlib import Path
 from settings import config
 
+data_dir = Path(config("DATA_DIR"))
 output_dir = Path(config("OUTPUT_DIR"))
 
-def calc_swap_spreads(treasury_df, swap_df):
-    """Combines the treasury and swap data and calculates the spreads
+## Increase when the output of calc_swap_spreads changes, invalidating cached results
+SPREAD_VERSION = 3
+
+def _column_positions(df, names):
+    """Positions of the columns whose first level label is in names
+    """
+    labels = list(df.columns.get_level_values(0))
+    return [labels.index(name) for name in names]
+
+def _quoted(df, names, chunk_size = 1_000_000):
+    """Dates of a frame on which any of the named columns has a value, as a
+    frame without columns
+    """
+    labels = set(df.columns.get_level_values(0))
+    cols = _column_positions(df, [name for name in dict.fromkeys(names) if name in labels])
+    keep = np.zeros(len(df), dtype = bool)
+    for lo in range(0, len(df), chunk_size):
+        keep[lo:lo + chunk_size] = df.iloc[lo:lo + chunk_size, cols].notna().to_numpy().any(axis = 1)
+    return pd.DataFrame(index = df.index[keep])
+
+def _align_index(treasury_df, swap_df, curve = None):
+    """Business days of the curve's calendar from 2000 onwards on which either
+    frame quotes a yield of the curve, see calendars.py
+    """
+    curve = config('CURVE') if curve is None else curve
+    universe = load_universe()
+    rows = universe[universe['curve'] == curve]
+    quoted = [_quoted(treasury_df, rows['govt']), _quoted(swap_df, rows['swap'].dropna())]
+    return align_index(quoted, curve_calendar(curve), start = '2000-01-01')
+
+def _align(treasury_df, swap_df, curve = None):
+    """Dates of _align_index with the row of the as-of value of every column
+    of each frame
+    """
+    index = _align_index(treasury_df, swap_df, curve)
+    return index, asof_positions(treasury_df, index), asof_positions(swap_df, index)
+
+def _spread_columns(tenors, nlevels):
+    """Column labels of the spread output, padded to the levels of the inputs
+    """
+    names = [f'Arb_Swap_{x}' for x in tenors] + [f'tswap_{x}_rf' for x in tenors]
+    if nlevels > 1:
+        return pd.MultiIndex.from_tuples([(name,) + ('',) * (nlevels - 1) for name in names])
+    return pd.Index(names)
+
+@instrumented
+def calc_swap_spreads(treasury_df, swap_df, curve = None):
+    """Combines the treasury and swap data and calculates the spreads for
+    every tenor pair of the curve in one vectorized operation
 
     :param treasury_df: DataFrame containing the treasury yield data
     :type treasury_df: pd.DataFrame
     :param swap_df: DataFrame containing the swap yield data
     :type swap_df: pd.DataFrame
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
     :return: The merged data frame containing the clean and calculated data
     :rtype: pd.DataFrame
     """
 
-    s_years = [1,2,3,5,10,20,30]
-    merged_df = pd.merge(swap_df, treasury_df, left_index = True, right_index = True, how = 'inner')
-    for i in s_years:
-        merged_df[f'Arb_Swap_{i}'] = 100 * (-merged_df[f'GT{i} Govt'] + merged_df[f'USSO{i} CMPN Curncy'])
-        merged_df[f'tswap_{i}_rf'] = merged_df[f'USSO{i} CMPN Curncy'] * 100
-
-    merged_df['Year'] = pd.to_datetime(merged_df.index).year
-    merged_df = merged_df[merged_df['Year'] >= 2000]
+    pairs = spread_pairs(curve)
+    index, t_rows, s_rows = _align(treasury_df, swap_df, curve)
+    s_cols = _column_positions(swap_df, pairs['swap'])
+    t_cols = _column_positions(treasury_df, pairs['govt'])
+    swaps = take(swap_df.iloc[:, s_cols].to_numpy(float), s_rows[:, s_cols])
+    govts = take(treasury_df.iloc[:, t_cols].to_numpy(float), t_rows[:, t_cols])
 
-    arb_list = [f'Arb_Swap_{x}' for x in s_years]
-    tswap_list = [f'tswap_{x}_rf' for x in s_years]
-    merged_df = merged_df[arb_list + tswap_list]
+    values = 100 * np.concatenate([swaps - govts, swaps], axis = 1)
+    merged_df = pd.DataFrame(values, index = index,
+                             columns = _spread_columns(pairs['tenor'], swap_df.columns.nlevels))
     merged_df = merged_df.dropna(how='all')
 
     return merged_df
 
-def swap_main():
-    """Calculates the spreads and saves them.
+def _memmap(shape, dtype, mmap_dir, name):
+    """Creates a writable memory-mapped array. Without a directory the array is
+    backed by an anonymous temporary file which is removed once it is released.
     """
-    swap_df = clean_raw_syields(pull_raw_syields())
-    treasury_df = clean_raw_tyields(pull_raw_tyields())
+    if mmap_dir is None:
+        return np.memmap(tempfile.TemporaryFile(), dtype = dtype, mode = 'w+', shape = shape)
+    os.makedirs(mmap_dir, exist_ok = True)
+    return np.memmap(os.path.join(mmap_dir, name), dtype = dtype, mode = 'w+', shape = shape)
 
-    arb_df = calc_swap_spreads(treasury_df, swap_df)
+def calc_swap_spreads_mmap(treasury_df, swap_df, curve = None, dtype = np.float64,
+                           mmap_dir = None, chunk_size = 1_000_000):
+    """Calculates the same spreads as calc_swap_spreads without building the
+    intermediate merged data frame. The swap and treasury yields are aligned
+    chunk by chunk into a single memory-mapped (date x 2 tenor) matrix,
+    all spreads are computed in one vectorized pass into a second memory-mapped
+    matrix, and the result is returned as a data frame viewing that matrix.
 
-    file_dir = os.path.join(data_dir , 'calc_spread')
-    file = os.path.join(file_dir, 'calc_merged.pkl')
-    
-    if not os.path.exists(file_dir):
-        os.makedirs(file_dir)
-    arb_df.to_pickle(file)
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+    :param dtype: Floating point type of the matrices, np.float32 halves the
+    memory used
+    :type dtype: np.dtype, default = np.float64
+    :param mmap_dir: Directory keeping the yields.dat and spreads.dat files,
+    defaults to None which uses temporary files
+    :type mmap_dir: str
+    :param chunk_size: Number of dates copied or computed at a time
+    :type chunk_size: int
+    :return: The data frame containing the calculated data
+    :rtype: pd.DataFrame
+    """
+
+    pairs = spread_pairs(curve)
+    s_cols = _column_positions(swap_df, pairs['swap'])
+    t_cols = _column_positions(treasury_df, pairs['govt'])
+    k = len(pairs)
+
+    # The yields are aligned chunk by chunk, so only the rows of one chunk of
+    # the inputs are held in memory at a time
+    index = _align_index(treasury_df, swap_df, curve)
+    yields = _memmap((len(index), 2 * k), dtype, mmap_dir, 'yields.dat')
+    for df, cols, out in [(swap_df, s_cols, slice(0, k)), (treasury_df, t_cols, slice(k, 2 * k))]:
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        for lo, hi, values in asof_chunks(df, index, cols, chunk_size = chunk_size, dtype = dtype):
+            yields[lo:hi, out] = values
+
+    # A row only has spreads when at least one swap yield is present
+    keep = np.zeros(len(index), dtype = bool)
+    for lo in range(0, len(index), chunk_size):
+        keep[lo:lo + chunk_size] = ~np.isnan(yields[lo:lo + chunk_size, :k]).all(axis = 1)
+    rows = np.flatnonzero(keep)
+
+    spreads = _memmap((len(rows), 2 * k), dtype, mmap_dir, 'spreads.dat')
+    for lo in range(0, len(rows), chunk_size):
+        block = yields[rows[lo:lo + chunk_size]]
+        np.subtract(block[:, :k], block[:, k:], out = spreads[lo:lo + chunk_size, :k])
+        spreads[lo:lo + chunk_size, k:] = block[:, :k]
+        spreads[lo:lo + chunk_size] *= 100
+    spreads.flush()
+
+    columns = _spread_columns(pairs['tenor'], swap_df.columns.nlevels)
+    return pd.DataFrame(spreads, index = index[rows], columns = columns, copy = False)
+
+def cached_swap_spreads(treasury_df, swap_df, curve = None, target = None, **load_kwargs):
+    """Calculates the spreads, reusing the stage cache when they were already
+    calculated from the same yields and tenor pairs
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+    :param target: File the spreads are also written to
+    :type target: str
+    :param load_kwargs: Column and date selection of the returned spreads
+    :return: The data frame containing the calculated data
+    :rtype: pd.DataFrame
+    """
+    pairs = spread_pairs(curve)
+    return cached('calc_swap_spreads', SPREAD_VERSION, [treasury_df, swap_df],
+                  lambda: calc_swap_spreads(treasury_df, swap_df, curve),
+                  params = {'pairs': pairs.to_dict('list'), 'calendar': curve_calendar(curve) or config('CALENDAR'),
+                            'calendar_version': CALENDAR_VERSION,
+                            'tolerance': str(pd.Timedelta(config('ALIGN_TOLERANCE')))},
+                  target = target, **load_kwargs)
+
+def swap_main():
+    """Calculates the spreads and saves them.
+    """
+    from pipeline import Pipeline
+    Pipeline().run(['calc'])
 
 
 if __name__ == '__main__':
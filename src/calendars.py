@@ -0,0 +1,335 @@
+"""
+Holiday calendars and as-of alignment of the treasury and swap yields.
+
+Two US calendars are available, besides 'weekdays' without holidays:
+
+ - 'sifma': full closes recommended by SIFMA for the bond market, including
+   Good Friday, with holidays falling on a Saturday observed on the Friday
+   except New Year's and Veterans Day, and special closes (9/11, national
+   days of mourning, Hurricane Sandy). Good Fridays with an early close,
+   when the jobs report came out that day, are business days
+ - 'nyfed': holidays of the Federal Reserve Bank of New York, which publishes
+   SOFR, with holidays falling on a Saturday not observed
+
+Holidays are computed from their rules once for HOLIDAY_YEARS and stored in
+calendar_dir, DATA_DIR/calendars by default, and the business-day index of
+each calendar is cached in memory, so every stage of a run reuses it.
+
+The yields of several frames are aligned on the dates of any frame which are
+business days of CALENDAR, and the dates every frame quotes even if the
+calendar has them as holidays, within the span the frames have in common. Each
+column takes its last valid value at or before the date, as in an as-of join,
+unless that value is older than ALIGN_TOLERANCE, so a print missing in one
+market does not drop the date from the other.
+"""
+
+import os
+from functools import lru_cache, reduce
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, Holiday, GoodFriday, USMartinLutherKingJr,
+                                    USPresidentsDay, USMemorialDay, USLaborDay, USColumbusDay,
+                                    USThanksgivingDay, nearest_workday, sunday_to_monday)
+from settings import config
+from store import save_frame, load_frame, load_metadata
+
+data_dir = Path(config("DATA_DIR"))
+## Directory of the stored holidays
+calendar_dir = data_dir / 'calendars'
+
+## Increase when the rules change, invalidating the stored holidays
+CALENDAR_VERSION = 2
+HOLIDAY_YEARS = (1950, 2075)
+
+def _fixed(name, month, day, observance, start_date = None):
+    return Holiday(name, month = month, day = day, observance = observance, start_date = start_date)
+
+class SifmaCalendar(AbstractHolidayCalendar):
+    rules = [
+        _fixed("New Year's Day", 1, 1, sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        _fixed('Juneteenth', 6, 19, nearest_workday, '2022-01-01'),
+        _fixed('Independence Day', 7, 4, nearest_workday),
+        USLaborDay,
+        USColumbusDay,
+        _fixed('Veterans Day', 11, 11, sunday_to_monday),
+        USThanksgivingDay,
+        _fixed('Christmas Day', 12, 25, nearest_workday),
+    ]
+
+class NYFedCalendar(AbstractHolidayCalendar):
+    rules = [
+        _fixed("New Year's Day", 1, 1, sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        USMemorialDay,
+        _fixed('Juneteenth', 6, 19, sunday_to_monday, '2022-01-01'),
+        _fixed('Independence Day', 7, 4, sunday_to_monday),
+        USLaborDay,
+        USColumbusDay,
+        _fixed('Veterans Day', 11, 11, sunday_to_monday),
+        USThanksgivingDay,
+        _fixed('Christmas Day', 12, 25, sunday_to_monday),
+    ]
+
+SPECIAL_CLOSES = {
+    'sifma': {
+        '2001-09-11': 'September 11', '2001-09-12': 'September 11',
+        '2004-06-11': 'Reagan day of mourning', '2007-01-02': 'Ford day of mourning',
+        '2012-10-30': 'Hurricane Sandy', '2018-12-05': 'Bush day of mourning',
+    },
+}
+
+## Holidays of the rules on which the market was open with an early close
+EARLY_CLOSES = {
+    'sifma': {
+        '1996-04-05': 'Good Friday', '2007-04-06': 'Good Friday', '2010-04-02': 'Good Friday',
+        '2012-04-06': 'Good Friday', '2015-04-03': 'Good Friday', '2021-04-02': 'Good Friday',
+        '2023-04-07': 'Good Friday',
+    },
+}
+
+CALENDARS = {'sifma': SifmaCalendar, 'nyfed': NYFedCalendar, 'weekdays': None}
+
+def _holiday_file(calendar):
+    return os.path.join(calendar_dir, f'{calendar}.parquet')
+
+def _compute_holidays(calendar):
+    rules = CALENDARS[calendar]
+    start, end = f'{HOLIDAY_YEARS[0]}-01-01', f'{HOLIDAY_YEARS[1]}-12-31'
+    names = rules().holidays(start, end, return_name = True) if rules is not None else pd.Series(dtype = object)
+    special = pd.Series(SPECIAL_CLOSES.get(calendar, {}), dtype = object)
+    special.index = pd.to_datetime(special.index)
+    names = pd.concat([names, special]).sort_index()
+    names = names[~names.index.duplicated()]
+    early = pd.to_datetime(list(EARLY_CLOSES.get(calendar, {})))
+    names = names[~pd.DatetimeIndex(names.index).isin(early)]
+    return pd.DataFrame({'holiday': names.to_numpy(dtype = str)}, index = pd.DatetimeIndex(names.index).date)
+
+@lru_cache(maxsize = None)
+def _load_holidays(calendar):
+    if calendar not in CALENDARS:
+        raise ValueError(f'calendar must be one of {list(CALENDARS)}, not {calendar}')
+    file = _holiday_file(calendar)
+    if os.path.exists(file) and load_metadata(file).get('version') == CALENDAR_VERSION:
+        return load_frame(file)['holiday']
+    df = _compute_holidays(calendar)
+    save_frame(df, file, metadata = {'version': CALENDAR_VERSION}, compact = False)
+    return df['holiday']
+
+def holidays(calendar = None):
+    """Holidays of a calendar, computed on the first use and then loaded from
+    calendar_dir
+
+    :param calendar: One of CALENDARS, defaults to CALENDAR
+    :type calendar: str
+
+    :return: Name of the holiday of every date
+    :rtype: pd.Series
+    """
+    return _load_holidays(config('CALENDAR') if calendar is None else calendar)
+
+@lru_cache(maxsize = None)
+def _business_days(calendar):
+    """Business days of HOLIDAY_YEARS as sorted datetime64[D] values
+    """
+    days = pd.bdate_range(f'{HOLIDAY_YEARS[0]}-01-01', f'{HOLIDAY_YEARS[1]}-12-31').to_numpy('datetime64[D]')
+    closed = pd.to_datetime(holidays(calendar).index).to_numpy('datetime64[D]')
+    return days[~np.isin(days, closed)]
+
+def business_days(start = None, end = None, calendar = None):
+    """Business days of a calendar
+
+    :param start: First date, inclusive
+    :type start: date like
+    :param end: Last date, inclusive
+    :type end: date like
+    :param calendar: One of CALENDARS, defaults to CALENDAR
+    :type calendar: str
+
+    :rtype: pd.Index
+    """
+    calendar = config('CALENDAR') if calendar is None else calendar
+    days = _business_days(calendar)
+    lo = 0 if start is None else np.searchsorted(days, np.datetime64(pd.Timestamp(start).date()))
+    hi = len(days) if end is None else np.searchsorted(days, np.datetime64(pd.Timestamp(end).date()), 'right')
+    return pd.Index(days[lo:hi].astype(object))
+
+def is_business_day(day, calendar = None):
+    """Whether a date is a business day of a calendar
+
+    :param day: Date or timestamp
+    :type day: date like
+    :param calendar: One of CALENDARS, defaults to CALENDAR
+    :type calendar: str
+
+    :rtype: bool
+    """
+    calendar = config('CALENDAR') if calendar is None else calendar
+    days = _business_days(calendar)
+    day = np.datetime64(pd.Timestamp(day).date())
+    pos = np.searchsorted(days, day)
+    return bool(pos < len(days) and days[pos] == day)
+
+def previous_business_day(before = None, calendar = None):
+    """Last business day strictly before a date, e.g. the last date with
+    closing prints
+
+    :param before: Date, defaults to today
+    :type before: date like
+    :param calendar: One of CALENDARS, defaults to CALENDAR
+    :type calendar: str
+
+    :rtype: pd.Timestamp
+    """
+    calendar = config('CALENDAR') if calendar is None else calendar
+    before = pd.Timestamp('today' if before is None else before).normalize()
+    days = _business_days(calendar)
+    return pd.Timestamp(days[np.searchsorted(days, np.datetime64(before.date())) - 1])
+
+def _stamps(index):
+    return pd.to_datetime(pd.Index(index)).to_numpy('datetime64[ns]')
+
+def align_index(frames, calendar = None, start = None):
+    """Dates of any of the frames which are business days, or which every
+    frame quotes, within the span of dates the frames have in common
+
+    :param frames: Frames indexed by date or timestamp
+    :type frames: list
+    :param calendar: One of CALENDARS, defaults to CALENDAR
+    :type calendar: str
+    :param start: First date, inclusive
+    :type start: date like
+
+    :return: The dates, of the type of the first frame's index
+    :rtype: pd.Index
+    """
+    calendar = config('CALENDAR') if calendar is None else calendar
+    stamps = [_stamps(df.index) for df in frames]
+    if any(len(x) == 0 for x in stamps):
+        return frames[0].index[:0]
+    lo = max(x.min() for x in stamps)
+    hi = min(x.max() for x in stamps)
+    if start is not None:
+        lo = max(lo, pd.Timestamp(start).to_datetime64())
+    union = np.unique(np.concatenate(stamps))
+    union = union[(union >= lo) & (union <= hi)]
+    days = union.astype('datetime64[D]')
+    # Dates every market quotes were open there, whatever the calendar says
+    quoted = reduce(np.intersect1d, [x.astype('datetime64[D]') for x in stamps])
+    union = union[np.isin(days, _business_days(calendar)) | np.isin(days, quoted)]
+    if pd.Index(frames[0].index).inferred_type == 'date':
+        return pd.Index(pd.DatetimeIndex(union).date)
+    return pd.DatetimeIndex(union)
+
+def asof_positions(df, index, tolerance = None):
+    """Rows of a frame holding the last valid value of every column at or
+    before each date, as in an as-of join
+
+    :param df: Frame indexed by date or timestamp
+    :type df: pd.DataFrame
+    :param index: Dates to align to
+    :type index: pd.Index
+    :param tolerance: Largest age of a value, defaults to ALIGN_TOLERANCE
+    :type tolerance: pd.Timedelta or str
+
+    :return: Array of shape (date x column), -1 where no value is recent enough
+    :rtype: np.ndarray
+    """
+    tolerance = pd.Timedelta(config('ALIGN_TOLERANCE') if tolerance is None else tolerance)
+    source, target = _stamps(df.index), _stamps(index)
+    order = np.argsort(source, kind = 'stable')
+    source = source[order]
+    rows = np.arange(len(df))[:, None]
+    last = np.maximum.accumulate(np.where(df.notna().to_numpy()[order], rows, -1), axis = 0)
+    at = np.searchsorted(source, target, 'right') - 1
+    positions = np.where(at[:, None] >= 0, last[np.maximum(at, 0)], -1)
+    stale = target[:, None] - source[np.maximum(positions, 0)] > tolerance.to_timedelta64()
+    return np.where((positions >= 0) & ~stale, order[np.maximum(positions, 0)], -1)
+
+def asof_chunks(df, index, columns = None, tolerance = None, chunk_size = 1_000_000, dtype = np.float64):
+    """As-of values of a frame sorted by date, one chunk of dates at a time,
+    reading only the rows of the frame up to each chunk. The last valid value
+    of every column is carried from one chunk to the next, so no array spans
+    the whole frame, and the values are the same as take(asof_positions(...))
+
+    :param df: Frame indexed by date or timestamp, sorted by date
+    :type df: pd.DataFrame
+    :param index: Sorted dates to align to
+    :type index: pd.Index
+    :param columns: Positions of the columns, defaults to every column
+    :type columns: list
+    :param tolerance: Largest age of a value, defaults to ALIGN_TOLERANCE
+    :type tolerance: pd.Timedelta or str
+    :param chunk_size: Number of dates per chunk
+    :type chunk_size: int
+    :param dtype: Floating point type of the values
+    :type dtype: np.dtype, default = np.float64
+
+    :return: Generator of the first and last positions in index and the
+    values of shape (date x column) of every chunk
+    :rtype: generator
+    """
+    tolerance = pd.Timedelta(config('ALIGN_TOLERANCE') if tolerance is None else tolerance).to_timedelta64()
+    source, target = _stamps(df.index), _stamps(index)
+    columns = list(range(df.shape[1])) if columns is None else list(columns)
+    cols = np.arange(len(columns))
+    carry = np.full((1, len(cols)), np.nan, dtype = dtype)
+    carry_stamps = np.full((1, len(cols)), np.datetime64('NaT'), dtype = 'datetime64[ns]')
+    row = 0
+    for lo in range(0, len(target), chunk_size):
+        dates = target[lo:lo + chunk_size]
+        end = np.searchsorted(source, dates[-1], 'right')
+        block = np.concatenate([carry, df.iloc[row:end, columns].to_numpy(dtype)])
+        valid = ~np.isnan(block)
+        quoted = np.broadcast_to(source[row:end, None], (end - row, len(cols)))
+        stamps = np.where(valid, np.concatenate([carry_stamps, quoted]), np.datetime64('NaT'))
+        last = np.maximum.accumulate(np.where(valid, np.arange(len(block))[:, None], -1), axis = 0)
+        at = last[np.searchsorted(source[row:end], dates, 'right')]
+        found = at >= 0
+        age = dates[:, None] - stamps[np.maximum(at, 0), cols]
+        yield lo, lo + len(dates), np.where(found & (age <= tolerance), block[np.maximum(at, 0), cols], np.nan)
+        final = last[-1]
+        carry = np.where(final >= 0, block[np.maximum(final, 0), cols], np.nan)[None].astype(dtype)
+        carry_stamps = np.where(final >= 0, stamps[np.maximum(final, 0), cols], np.datetime64('NaT'))[None]
+        row = end
+
+def take(values, positions):
+    """Values at as-of positions, NaN where there are none
+
+    :param values: Array of shape (row x column)
+    :type values: np.ndarray
+    :param positions: Rows of every column for each date, from asof_positions
+    :type positions: np.ndarray
+
+    :return: Array of shape (date x column)
+    :rtype: np.ndarray
+    """
+    values = np.asarray(values, dtype = np.float64)
+    cols = np.arange(values.shape[1])
+    return np.where(positions >= 0, values[np.maximum(positions, 0), cols], np.nan)
+
+def align_frames(frames, calendar = None, tolerance = None, start = None):
+    """Aligns frames on the business days of a calendar with as-of joins,
+    instead of keeping only the dates in all of them
+
+    :param frames: Frames indexed by date or timestamp
+    :type frames: list
+    :param calendar: One of CALENDARS, defaults to CALENDAR
+    :type calendar: str
+    :param tolerance: Largest age of a value, defaults to ALIGN_TOLERANCE
+    :type tolerance: pd.Timedelta or str
+    :param start: First date, inclusive
+    :type start: date like
+
+    :return: Frames sharing one index
+    :rtype: list
+    """
+    index = align_index(frames, calendar, start)
+    return [pd.DataFrame(take(df.to_numpy(np.float64), asof_positions(df, index, tolerance)),
+                         index = index, columns = df.columns) for df in frames]
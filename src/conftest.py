@@ -0,0 +1,16 @@
+"""
+Fixtures shared by the tests
+"""
+import pytest
+import calendars
+
+@pytest.fixture(autouse = True, scope = 'session')
+def calendar_dir(tmp_path_factory):
+    """Stores the holidays computed by the tests in a temporary directory
+    instead of DATA_DIR/calendars
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(calendars, 'calendar_dir', tmp_path_factory.mktemp('calendars'))
+        calendars._load_holidays.cache_clear()
+        calendars._business_days.cache_clear()
+        yield calendars.calendar_dir
@@ -0,0 +1,199 @@
+"""
+Offline stand-ins for `xbbg.blp` used to exercise and time the Bloomberg
+pulls without a terminal.
+
+ - `FakeBlp` serves deterministic synthetic histories
+ - `RecordingBlp` wraps the real client and captures its `bdh` responses to disk
+ - `ReplayBlp` serves the captured responses back
+
+The synthetic and replayed sources simulate the terminal with a configurable
+latency per request and injected failures, either a fixed number per request
+or at random with a given rate.
+"""
+
+import os
+import re
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+from store import save_frame, load_frame
+from synthetic import synthetic_yields
+
+## First date of the synthetic histories
+ORIGIN = '1990-01-01'
+
+class SimulatedBlp:
+    """Base of the offline sources. Subclasses implement `response`, and
+    `bdh` adds the bookkeeping, latency and failures around it.
+
+    :param failures: Number of times each (ticker, start date) request fails
+    before succeeding
+    :type failures: int, default = 0
+    :param latency: Seconds each request sleeps for
+    :type latency: float, default = 0
+    :param error: Exception type raised by failing requests
+    :type error: type, default = ConnectionError
+    :param failure_rate: Probability of any request failing, on top of the
+    fixed failures
+    :type failure_rate: float, default = 0
+    :param jitter: Maximum seconds added at random to the latency
+    :type jitter: float, default = 0
+    :param seed: Seed of the random failures and jitter
+    :type seed: int, default = 0
+    """
+
+    def __init__(self, failures = 0, latency = 0, error = ConnectionError,
+                 failure_rate = 0, jitter = 0, seed = 0):
+        self.failures = failures
+        self.latency = latency
+        self.error = error
+        self.failure_rate = failure_rate
+        self.jitter = jitter
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._failed = {}
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def response(self, tickers, flds, start_date, end_date):
+        """Data of a successful request, with (ticker, field) columns indexed by date
+        """
+        raise NotImplementedError
+
+    def bdh(self, tickers, flds = None, start_date = None, end_date = 'today', **kwargs):
+        """Mimics `xbbg.blp.bdh`, returning (ticker, field) columns indexed by date
+        """
+        flds = ['PX_LAST'] if flds is None else flds
+        if isinstance(tickers, str):
+            tickers = [tickers]
+        if isinstance(flds, str):
+            flds = [flds]
+        key = (tuple(tickers), str(pd.Timestamp(start_date).date()))
+        with self._lock:
+            self.calls.append((list(tickers), pd.Timestamp(start_date), pd.Timestamp(end_date)))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            failed = self._failed.get(key, 0)
+            if failed < self.failures:
+                self._failed[key] = failed + 1
+            fail = failed < self.failures or self._rng.random() < self.failure_rate
+            wait = self.latency + self.jitter * self._rng.random()
+        try:
+            if wait:
+                time.sleep(wait)
+            if fail:
+                raise self.error(f'Simulated failure {failed + 1} for {key}')
+            return self.response(tickers, flds, start_date, end_date)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+class FakeBlp(SimulatedBlp):
+    """Serves deterministic synthetic `bdh` responses. Every ticker follows
+    its own seeded `synthetic_yields` walk from ORIGIN, so the same request
+    always returns the same values regardless of how it is split into
+    chunks. See SimulatedBlp for the parameters.
+    """
+
+    @staticmethod
+    def history(ticker, start_date, end_date):
+        """Synthetic yield history of a ticker on business days, the window of
+        its `synthetic_yields` walk from ORIGIN
+
+        :param ticker: Ticker name
+        :type ticker: str
+        :param start_date: First date
+        :type start_date: date like
+        :param end_date: Last date
+        :type end_date: date like
+
+        :return: Yields indexed by date
+        :rtype: pd.Series
+        """
+        # The walk always starts on ORIGIN so overlapping requests agree
+        end = max(pd.Timestamp(end_date), pd.Timestamp(ORIGIN))
+        walk = synthetic_yields([ticker], ORIGIN, end)[(ticker, 'PX_LAST')]
+        window = walk.loc[pd.Timestamp(start_date).date():pd.Timestamp(end_date).date()]
+        return window.rename(ticker)
+
+    def response(self, tickers, flds, start_date, end_date):
+        frames = {(ticker, fld): self.history(ticker, start_date, end_date)
+                  for ticker in tickers for fld in flds}
+        if not frames or len(next(iter(frames.values()))) == 0:
+            return pd.DataFrame()
+        return pd.DataFrame(frames)
+
+def recording_file(record_dir, ticker):
+    """Path of the recorded responses of a ticker
+    """
+    return os.path.join(record_dir, re.sub(r'[^\w.-]', '_', ticker) + '.parquet')
+
+class RecordingBlp:
+    """Forwards `bdh` requests to a client and records the responses, one
+    file per ticker merging every response received for it
+
+    :param source: Client providing `bdh`, e.g. `xbbg.blp`
+    :type source: object
+    :param record_dir: Directory of the recordings
+    :type record_dir: str
+    """
+
+    def __init__(self, source, record_dir):
+        self.source = source
+        self.record_dir = record_dir
+        self._lock = threading.Lock()
+
+    def bdh(self, tickers, flds = None, start_date = None, end_date = 'today', **kwargs):
+        """Calls `bdh` on the client and records its response
+        """
+        flds = ['PX_LAST'] if flds is None else flds
+        df = self.source.bdh(tickers = tickers, flds = flds, start_date = start_date,
+                             end_date = end_date, **kwargs)
+        if df.empty:
+            return df
+        with self._lock:
+            for ticker in df.columns.get_level_values(0).unique():
+                file = recording_file(self.record_dir, ticker)
+                recorded = df[[ticker]]
+                if os.path.exists(file):
+                    recorded = recorded.combine_first(load_frame(file))
+                save_frame(recorded.sort_index(), file, compact = False)
+        return df
+
+class ReplayBlp(SimulatedBlp):
+    """Serves the responses captured by RecordingBlp. A request returns the
+    recorded dates of its window, and like Bloomberg leaves out tickers and
+    fields without data. See SimulatedBlp for the remaining parameters.
+
+    :param record_dir: Directory of the recordings
+    :type record_dir: str
+    """
+
+    def __init__(self, record_dir, **kwargs):
+        super().__init__(**kwargs)
+        self.record_dir = record_dir
+        self._recorded = {}
+
+    def recorded(self, ticker):
+        """Recorded responses of a ticker, None if it was never recorded
+        """
+        if ticker not in self._recorded:
+            file = recording_file(self.record_dir, ticker)
+            self._recorded[ticker] = load_frame(file) if os.path.exists(file) else None
+        return self._recorded[ticker]
+
+    def response(self, tickers, flds, start_date, end_date):
+        start, end = pd.Timestamp(start_date).date(), pd.Timestamp(end_date).date()
+        frames = []
+        for ticker in tickers:
+            df = self.recorded(ticker)
+            if df is not None:
+                columns = [(ticker, fld) for fld in flds if (ticker, fld) in df.columns]
+                frames.append(df.loc[start:end, columns].dropna(how = 'all'))
+        frames = [df for df in frames if not df.empty]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, axis = 1)
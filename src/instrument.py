@@ -0,0 +1,237 @@
+"""
+Timing and memory instrumentation of the pipeline stages.
+
+The stage functions are wrapped with `instrumented`, which records the wall
+and CPU time of every call and its peak memory above the memory in use when
+it started. PROFILE_MEMORY selects how memory is measured:
+
+ - 'rss': peak resident memory of the process, reset at the start of every
+   call through /proc/self/clear_refs, which costs nothing but is only
+   available on Linux. Resetting the peak affects anything else reading it,
+   so it is only done with PROFILE_RESET_RSS, and no memory is measured
+   otherwise
+ - 'tracemalloc': peak memory allocated through Python, including numpy
+   arrays, which is portable and more precise but slows the stages down
+ - 'off': no memory measurement
+
+With PROFILE_CPROFILE the outermost instrumented call is also profiled with
+cProfile and its statistics are dumped to OUTPUT_DIR/profiles. The last
+PROFILE_MAX_RECORDS records of a run are written as JSON to
+OUTPUT_DIR/profiles/run-<time>.json, and the doit reporter prints a summary
+after each task, so a regressed stage stands out. Stages may run in several
+threads, each measuring its own nested calls.
+"""
+
+import os
+import json
+import time
+import functools
+import threading
+import subprocess
+import tracemalloc
+from datetime import datetime
+from collections import deque
+from pathlib import Path
+
+from settings import config
+
+output_dir = Path(config("OUTPUT_DIR"))
+
+## Latest calls recorded since the start of the run
+RECORDS = deque(maxlen = config('PROFILE_MAX_RECORDS'))
+## Number of calls recorded and summarized since the start of the run
+_recorded = 0
+_summarized = 0
+_lock = threading.Lock()
+## Per thread, the peak memory of the calls being measured, outermost first,
+## and the depths of those peaks at which this module started tracing
+_local = threading.local()
+_profiling = False
+_run_start = datetime.now()
+
+MEMORY_MODES = ['rss', 'tracemalloc', 'off']
+
+def _stacks():
+    """Peak memory and tracing stacks of the current thread
+    """
+    if not hasattr(_local, 'peaks'):
+        _local.peaks, _local.tracing = [], []
+    return _local.peaks, _local.tracing
+
+def _profile_dir():
+    return os.path.join(output_dir, 'profiles')
+
+def _rss():
+    """Current and peak resident memory of the process in bytes, None where
+    /proc is not available
+    """
+    try:
+        with open('/proc/self/status') as f:
+            status = dict(line.split(':', 1) for line in f)
+        return int(status['VmRSS'].split()[0]) * 1024, int(status['VmHWM'].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _reset_rss_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _memory(mode):
+    """Current and peak memory, the peak being reset at the same time
+    """
+    if mode == 'tracemalloc':
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return current, peak
+    memory = _rss()
+    if memory is None or not _reset_rss_peak():
+        return None
+    return memory
+
+def _start_peak(mode):
+    """Starts measuring the peak memory of a call, passing the peak so far
+    to the enclosing call
+
+    :return: The memory in use
+    :rtype: int
+    """
+    if mode == 'off':
+        return None
+    _peaks, _tracing = _stacks()
+    if mode == 'tracemalloc' and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _tracing.append(len(_peaks))
+    memory = _memory(mode)
+    if memory is None:
+        _peaks.append(None)
+        return None
+    current, peak = memory
+    if _peaks and _peaks[-1] is not None:
+        _peaks[-1] = max(_peaks[-1], peak)
+    _peaks.append(current)
+    return current
+
+def _stop_peak(mode):
+    """Peak memory of the call, including its nested calls
+    """
+    if mode == 'off':
+        return None
+    _peaks, _tracing = _stacks()
+    peak = _peaks.pop()
+    memory = _memory(mode)
+    if peak is not None and memory is not None:
+        peak = max(peak, memory[1])
+        if _peaks and _peaks[-1] is not None:
+            _peaks[-1] = max(_peaks[-1], peak)
+    if _tracing and _tracing[-1] == len(_peaks):
+        # Stopped by the call which started it, tracing started by other
+        # code such as the benchmarks is left running
+        _tracing.pop()
+        tracemalloc.stop()
+    return peak if memory is not None else None
+
+def instrumented(func = None, name = None):
+    """Decorator recording the time and memory of every call of a stage
+
+    :param func: Stage function
+    :type func: callable
+    :param name: Name of the stage, defaults to the function name
+    :type name: str
+    """
+    if func is None:
+        return functools.partial(instrumented, name = name)
+    stage = func.__name__ if name is None else name
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global _profiling, _recorded
+        memory = config('PROFILE_MEMORY')
+        if memory not in MEMORY_MODES:
+            raise ValueError(f'PROFILE_MEMORY must be one of {MEMORY_MODES}, not {memory}')
+        if memory == 'rss' and not config('PROFILE_RESET_RSS'):
+            memory = 'off'
+        base = _start_peak(memory)
+        profiler = None
+        if config('PROFILE_CPROFILE') and not _profiling:
+            import cProfile
+            profiler, _profiling = cProfile.Profile(), True
+        start, cpu = time.perf_counter(), time.process_time()
+        try:
+            if profiler is not None:
+                return profiler.runcall(func, *args, **kwargs)
+            return func(*args, **kwargs)
+        finally:
+            record = {
+                'stage': stage,
+                'start': datetime.now().isoformat(timespec = 'milliseconds'),
+                'seconds': time.perf_counter() - start,
+                'cpu_seconds': time.process_time() - cpu,
+                'peak_mb': None,
+                'profile': None,
+            }
+            peak = _stop_peak(memory)
+            if peak is not None:
+                record['peak_mb'] = (peak - base) / 2 ** 20
+            if profiler is not None:
+                _profiling = False
+                os.makedirs(_profile_dir(), exist_ok = True)
+                file = os.path.join(_profile_dir(), f'{stage}-{_run_start:%Y%m%d-%H%M%S}-{_recorded}.prof')
+                profiler.dump_stats(file)
+                record['profile'] = file
+            with _lock:
+                RECORDS.append(record)
+                _recorded += 1
+    return wrapper
+
+def summary(records = None):
+    """One line summary of recorded calls, slowest first
+
+    :param records: Records, defaults to the calls not summarized yet that
+    are still in RECORDS, which are then marked as summarized
+    :type records: list
+
+    :rtype: str
+    """
+    global _summarized
+    if records is None:
+        with _lock:
+            new = min(_recorded - _summarized, len(RECORDS))
+            records, _summarized = list(RECORDS)[len(RECORDS) - new:], _recorded
+    parts = []
+    for record in sorted(records, key = lambda x: -x['seconds']):
+        part = f"{record['stage']} {record['seconds']:.2f}s"
+        if record['peak_mb'] is not None:
+            part += f" {record['peak_mb']:.0f}MB"
+        parts.append(part)
+    return ', '.join(parts)
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True,
+                              text = True, check = True).stdout.strip()
+    except Exception:
+        return ''
+
+def write_run(file = None):
+    """Writes the records of the run as JSON
+
+    :param file: Path of the JSON file, defaults to
+    OUTPUT_DIR/profiles/run-<start time>.json
+    :type file: str
+
+    :return: Path of the file, None if nothing was recorded
+    :rtype: str
+    """
+    if not RECORDS:
+        return None
+    file = os.path.join(_profile_dir(), f'run-{_run_start:%Y%m%d-%H%M%S}.json') if file is None else file
+    os.makedirs(os.path.dirname(file), exist_ok = True)
+    run = {'start': _run_start.isoformat(timespec = 'seconds'), 'commit': _git_commit(),
+           'stages': list(RECORDS)}
+    with open(file, 'w') as f:
+        json.dump(run, f, indent = 1)
+    return file
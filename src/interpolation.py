@@ -0,0 +1,233 @@
+"""
+Interpolation of the treasury and swap curves onto a common tenor grid.
+
+The yields of a curve at the maturities of its instruments (the `years` column
+of the universe) are interpolated onto a grid of maturities for every date at
+once, with one of:
+
+ - 'linear': piecewise linear
+ - 'pchip': monotone piecewise cubic (Fritsch-Carlson slopes)
+ - 'nelson_siegel': Nelson-Siegel curve with a fixed decay, fitted by least
+   squares
+
+Grid values outside the maturities observed on a date are NaN, except for
+Nelson-Siegel which is defined everywhere. Dates are grouped by their pattern
+of missing yields, and the interpolation weights of each grid and pattern are
+computed once and cached, so a full history costs one matrix product per
+pattern.
+"""
+
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from calendars import align_frames
+from settings import config
+from store import save_frame
+from universe import curve_calendar, load_universe, spread_pairs
+
+data_dir = Path(config("DATA_DIR"))
+
+METHODS = ['linear', 'pchip', 'nelson_siegel']
+## Decay of the Nelson-Siegel loadings per year (0.0609 per month, Diebold and Li)
+NS_DECAY = 0.0609 * 12
+
+def _nelson_siegel_loadings(years, decay = NS_DECAY):
+    """Level, slope and curvature loadings at some maturities
+    """
+    x = decay * np.maximum(np.asarray(years, dtype = np.float64), 1e-8)
+    slope = (1 - np.exp(-x)) / x
+    return np.stack([np.ones_like(x), slope, slope - np.exp(-x)], axis = 1)
+
+@lru_cache(maxsize = 1024)
+def _plan(method, years, grid):
+    """Interpolation from the points at `years` to `grid`, for one pattern of
+    available points. Linear and Nelson-Siegel interpolation are linear maps
+    given by a (grid x point) weight matrix. Monotone cubic interpolation
+    depends on the yields through its slopes, so its plan holds the interval
+    and the Hermite basis of every grid maturity.
+    """
+    x, g = np.array(years), np.array(grid)
+    m = len(x)
+    if method == 'nelson_siegel':
+        if m < 3:
+            return {'weights': np.full((len(g), m), np.nan)}
+        fit = np.linalg.lstsq(_nelson_siegel_loadings(x), np.eye(m), rcond = None)[0]
+        return {'weights': _nelson_siegel_loadings(g) @ fit}
+
+    inside = (g >= x[0]) & (g <= x[-1]) if m >= 2 else np.zeros(len(g), dtype = bool)
+    k = np.clip(np.searchsorted(x, g, 'right') - 1, 0, max(m - 2, 0))
+    h = np.diff(x) if m >= 2 else np.ones(1)
+    t = (g - x[k]) / h[k] if m >= 2 else np.zeros(len(g))
+    if method == 'linear':
+        weights = np.zeros((len(g), m))
+        rows = np.flatnonzero(inside)
+        weights[rows, k[rows]] = 1 - t[rows]
+        weights[rows, k[rows] + 1] = t[rows]
+        weights[~inside] = np.nan
+        return {'weights': weights}
+    basis = np.stack([(1 + 2 * t) * (1 - t) ** 2, t * (1 - t) ** 2,
+                      t ** 2 * (3 - 2 * t), t ** 2 * (t - 1)])
+    return {'k': k, 'h': h, 'basis': basis, 'inside': inside}
+
+def _pchip_slopes(y, h):
+    """Monotone slopes at the points of the rows of y, as in scipy's PCHIP
+    """
+    delta = np.diff(y, axis = 1) / h
+    d = np.zeros_like(y)
+    if y.shape[1] == 2:
+        return np.repeat(delta, 2, axis = 1)
+    w1, w2 = 2 * h[1:] + h[:-1], h[1:] + 2 * h[:-1]
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        interior = (w1 + w2) / (w1 / delta[:, :-1] + w2 / delta[:, 1:])
+    same_sign = delta[:, :-1] * delta[:, 1:] > 0
+    d[:, 1:-1] = np.where(same_sign, interior, 0)
+    for end, (h0, h1, d0, d1) in [(0, (h[0], h[1], delta[:, 0], delta[:, 1])),
+                                  (-1, (h[-1], h[-2], delta[:, -1], delta[:, -2]))]:
+        edge = ((2 * h0 + h1) * d0 - h0 * d1) / (h0 + h1)
+        edge = np.where(np.sign(edge) != np.sign(d0), 0, edge)
+        overshoot = (np.sign(d0) != np.sign(d1)) & (np.abs(edge) > 3 * np.abs(d0))
+        d[:, end] = np.where(overshoot, 3 * d0, edge)
+    return d
+
+def _apply(plan, y):
+    """Interpolates the rows of y, which share their pattern of available points
+    """
+    if 'weights' in plan:
+        return y @ plan['weights'].T
+    k, h, (h00, h10, h01, h11) = plan['k'], plan['h'], plan['basis']
+    if y.shape[1] < 2:
+        return np.full((len(y), len(k)), np.nan)
+    d = _pchip_slopes(y, h)
+    out = (h00 * y[:, k] + h10 * h[k] * d[:, k] + h01 * y[:, k + 1] + h11 * h[k] * d[:, k + 1])
+    out[:, ~plan['inside']] = np.nan
+    return out
+
+def interpolate(values, years, grid, method = 'linear'):
+    """Interpolates curves, one per row, onto a grid of maturities
+
+    :param values: Yields of shape (date x maturity), NaN where missing
+    :type values: np.ndarray
+    :param years: Maturities of the columns in years
+    :type years: list
+    :param grid: Maturities to interpolate to, in years
+    :type grid: list
+    :param method: One of METHODS
+    :type method: str, default = 'linear'
+
+    :return: Yields of shape (date x grid)
+    :rtype: np.ndarray
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown interpolation method {method}, expected one of {METHODS}')
+    values = np.asarray(values, dtype = np.float64)
+    order = np.argsort(years, kind = 'stable')
+    values, years = values[:, order], np.asarray(years, dtype = np.float64)[order]
+    grid = tuple(float(x) for x in grid)
+
+    out = np.full((len(values), len(grid)), np.nan)
+    valid = ~np.isnan(values)
+    # Dates sorted by their pattern of available points, one group per pattern
+    codes = np.ascontiguousarray(np.packbits(valid, axis = 1))
+    codes = codes.view(np.dtype((np.void, codes.shape[1]))).ravel()
+    order = np.argsort(codes, kind = 'stable')
+    bounds = np.flatnonzero(codes[order][1:] != codes[order][:-1]) + 1
+    for rows in np.split(order, bounds):
+        cols = np.flatnonzero(valid[rows[0]])
+        if len(rows) and len(cols):
+            plan = _plan(method, tuple(years[cols]), grid)
+            out[rows] = _apply(plan, values[np.ix_(rows, cols)])
+    return out
+
+def _curve_values(df, names):
+    """Columns of a frame by first level label, NaN for missing ones
+    """
+    labels = list(df.columns.get_level_values(0))
+    values = np.full((len(df), len(names)), np.nan)
+    for j, name in enumerate(names):
+        if name in labels:
+            values[:, j] = df.iloc[:, labels.index(name)].to_numpy(np.float64)
+    return values
+
+def grid_label(years):
+    """Tenor label of a grid maturity, e.g. '10' or '0.5'
+    """
+    return f'{years:g}'
+
+def common_grid_yields(treasury_df, swap_df, grid = None, method = None, curve = None):
+    """Interpolates the government and swap curves onto a common grid, using
+    every government yield of the curve, including the bills and tenors
+    without a swap
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+    :param grid: Maturities in years, defaults to the swap maturities of the curve
+    :type grid: list
+    :param method: One of METHODS, defaults to INTERP_METHOD
+    :type method: str
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+
+    :return: Government and swap yields with one column per grid label, on
+    the business days of the curve's calendar on which either frame quotes,
+    see calendars.py
+    :rtype: tuple(pd.DataFrame, pd.DataFrame)
+    """
+    curve = config('CURVE') if curve is None else curve
+    method = config('INTERP_METHOD') if method is None else method
+    universe = load_universe()
+    govts = universe[universe['curve'] == curve]
+    swaps = spread_pairs(curve)
+    grid = list(swaps['years']) if grid is None else list(grid)
+
+    treasury_df, swap_df = align_frames([treasury_df, swap_df], curve_calendar(curve))
+    index = treasury_df.index
+    columns = [grid_label(x) for x in grid]
+    frames = []
+    for df, rows, name in [(treasury_df, govts, 'govt'), (swap_df, swaps, 'swap')]:
+        values = interpolate(_curve_values(df, list(rows[name])), list(rows['years']), grid, method)
+        frames.append(pd.DataFrame(values, index = index, columns = columns))
+    return frames[0], frames[1]
+
+def interpolated_spreads(treasury_df, swap_df, grid = None, method = None, curve = None):
+    """Arbitrage spreads in bps on a common grid, in the layout of
+    calc_swap_spreads
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+    :param grid: Maturities in years, defaults to the swap maturities of the curve
+    :type grid: list
+    :param method: One of METHODS, defaults to INTERP_METHOD
+    :type method: str
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+
+    :return: `Arb_Swap_{label}` and `tswap_{label}_rf` columns
+    :rtype: pd.DataFrame
+    """
+    govts, swaps = common_grid_yields(treasury_df, swap_df, grid, method, curve)
+    labels = list(govts.columns)
+    values = 100 * np.concatenate([swaps.to_numpy() - govts.to_numpy(), swaps.to_numpy()], axis = 1)
+    columns = [f'Arb_Swap_{x}' for x in labels] + [f'tswap_{x}_rf' for x in labels]
+    return pd.DataFrame(values, index = govts.index, columns = columns).dropna(how = 'all')
+
+def interp_main(treasury_df, swap_df):
+    """Calculates the spreads on the common grid and saves them to
+    DATA_DIR/calc_spread/interp_spreads.parquet
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+
+    :rtype: pd.DataFrame
+    """
+    df = interpolated_spreads(treasury_df, swap_df)
+    save_frame(df, os.path.join(data_dir, 'calc_spread', 'interp_spreads.parquet'))
+    return df
@@ -0,0 +1,163 @@
+"""
+Arbitrage spreads of several curves computed together, e.g. US, SOFR, EUR,
+GBP and JPY.
+
+The government and swap yields of every curve of the instrument universe are
+stacked into (curve x date x tenor) arrays over one tenor grid, so every
+spread comes from a single broadcasted subtraction. Each curve is aligned on
+the business days of its own calendar (the `calendar` column of the universe,
+CALENDAR where it is empty) on which its yields are quoted, as in
+calc_swap_spreads, and the dates of the stacked arrays are the union of those
+of the curves, NaN where a curve has none. The spreads are returned in a long
+format with one row per date, curve and tenor, and in the wide format of
+calc_swap_spreads for one curve.
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from calc_swap_spreads import _align, _spread_columns
+from calendars import take
+from settings import config
+from store import save_frame
+from universe import load_universe
+
+data_dir = Path(config("DATA_DIR"))
+
+def curve_pairs(curves = None):
+    """Tenors of the curves which have both a government and a swap yield
+
+    :param curves: Curve names, defaults to every curve of the universe
+    :type curves: list
+
+    :return: Rows with the curve, tenor, years, govt and swap columns
+    :rtype: pd.DataFrame
+    """
+    df = load_universe().dropna(subset = ['swap'])
+    if curves is not None:
+        df = df[df['curve'].isin(curves)]
+    return df.reset_index(drop = True)
+
+def _positions(labels, names):
+    """Positions of names in labels, len(labels) for names which are missing
+    """
+    lookup = {label: i for i, label in enumerate(labels)}
+    return np.array([lookup.get(name, len(labels)) for name in names], dtype = np.intp)
+
+def stack_curves(treasury_df, swap_df, curves = None):
+    """Stacks the government and swap yields of the curves, each aligned on
+    its own calendar, on a common tenor grid. Tenors a curve does not have,
+    dates it is not aligned on, and yields missing from the frames, are NaN.
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+    :param curves: Curve names, defaults to every curve of the universe
+    :type curves: list
+
+    :return: The dates, curve names, tenor labels, maturities in years, and the
+    government and swap yields as (curve x date x tenor) arrays
+    :rtype: tuple(pd.Index, list, list, np.ndarray, np.ndarray, np.ndarray)
+    """
+    pairs = curve_pairs(curves)
+    curves = list(dict.fromkeys(pairs['curve'])) if curves is None else list(curves)
+    grid = pairs.drop_duplicates('tenor').sort_values('years', kind = 'stable')
+    tenors, years = list(grid['tenor']), grid['years'].to_numpy(np.float64)
+
+    # Column of every (curve, tenor) cell, the extra NaN column where there is none
+    cells = pairs.set_index(['curve', 'tenor'])
+    keys = pd.MultiIndex.from_product([curves, tenors])
+    govt_names = cells['govt'].reindex(keys).to_numpy()
+    swap_names = cells['swap'].reindex(keys).to_numpy()
+
+    aligned = [_align(treasury_df, swap_df, curve) for curve in curves]
+    index = aligned[0][0] if aligned else treasury_df.index[:0]
+    for curve_index, _, _ in aligned[1:]:
+        index = index.union(curve_index)
+
+    stacked = []
+    for df, k, names in [(treasury_df, 1, govt_names), (swap_df, 2, swap_names)]:
+        labels = list(df.columns.get_level_values(0))
+        pos = _positions(labels, names).reshape(len(curves), len(tenors))
+        values = np.append(df.to_numpy(np.float64), np.full((len(df), 1), np.nan), axis = 1)
+        out = np.full((len(curves), len(index), len(tenors)), np.nan)
+        for c, parts in enumerate(aligned):
+            rows = np.append(parts[k], np.full((len(parts[k]), 1), -1), axis = 1)
+            out[c, index.get_indexer(parts[0])] = take(values[:, pos[c]], rows[:, pos[c]])
+        stacked.append(out)
+    return index, curves, tenors, years, stacked[0], stacked[1]
+
+def curve_spreads(govts, swaps):
+    """Arbitrage spreads and swap rates in bps of stacked yields, in one
+    broadcasted operation
+
+    :param govts: Government yields, of any shape
+    :type govts: np.ndarray
+    :param swaps: Swap yields, of the same shape
+    :type swaps: np.ndarray
+
+    :return: The spreads and the swap rates
+    :rtype: tuple(np.ndarray, np.ndarray)
+    """
+    return 100 * (swaps - govts), 100 * swaps
+
+def calc_curve_spreads(treasury_df, swap_df, curves = None, wide_curve = None):
+    """Calculates the spreads of every curve together
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+    :param curves: Curve names, defaults to every curve of the universe
+    :type curves: list
+    :param wide_curve: Curve returned in the wide format, defaults to CURVE
+    :type wide_curve: str
+
+    :return: The long format, with one row per date, curve and tenor with a
+    swap yield, and the wide format of calc_swap_spreads for wide_curve
+    :rtype: tuple(pd.DataFrame, pd.DataFrame)
+    """
+    wide_curve = config('CURVE') if wide_curve is None else wide_curve
+    index, curves, tenors, years, govts, swaps = stack_curves(treasury_df, swap_df, curves)
+    spreads, rates = curve_spreads(govts, swaps)
+
+    # Long rows ordered by date, then curve and tenor
+    d, c, t = np.nonzero(~np.isnan(rates.transpose(1, 0, 2)))
+    long_df = pd.DataFrame({
+        'curve': pd.Categorical.from_codes(c, curves),
+        'tenor': pd.Categorical.from_codes(t, tenors),
+        'years': years[t],
+        'spread': spreads[c, d, t],
+        'swap': rates[c, d, t],
+    }, index = pd.Index(index[d], name = 'date'))
+
+    wide_df = None
+    if wide_curve in curves:
+        k = curves.index(wide_curve)
+        cols = _positions(tenors, curve_pairs([wide_curve])['tenor'])
+        values = np.concatenate([spreads[k][:, cols], rates[k][:, cols]], axis = 1)
+        keep = ~np.isnan(values).all(axis = 1)
+        wide_df = pd.DataFrame(values[keep], index = index[keep],
+                               columns = _spread_columns([tenors[i] for i in cols], swap_df.columns.nlevels))
+    return long_df, wide_df
+
+def curves_main(treasury_df, swap_df, curves = None):
+    """Calculates the spreads of every curve and saves the long format to
+    DATA_DIR/calc_spread/curve_spreads.parquet
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+    :param curves: Curve names, defaults to every curve of the universe
+    :type curves: list
+
+    :return: The long format spreads
+    :rtype: pd.DataFrame
+    """
+    long_df, _ = calc_curve_spreads(treasury_df, swap_df, curves)
+    save_frame(long_df, os.path.join(data_dir, 'calc_spread', 'curve_spreads.parquet'))
+    return long_df
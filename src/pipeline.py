@@ -0,0 +1,193 @@
+"""
+In-process runner of the pipeline stages.
+
+The stages (pull, clean, spreads, spreads of every curve, spreads on a common
+tenor grid, zero and forward spreads, table, intervals of the table means,
+statistics, backtest, scenarios, replication data and figures) form a DAG. Running a set of stages runs their dependencies
+first, in the same process, and passes the frames between stages in memory, so
+every dataset is loaded and cleaned once per run. With COMPACT_FRAMES the frames are held as float32
+CompactFrames between stages. The stages write the same files as the
+standalone scripts, which keeps the doit up-to-date checks working. A frame
+is released as soon as every stage depending on it has run.
+
+Usage:
+```
+python ./src/pipeline.py table figures
+```
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+from compact import compact, expand
+from settings import config, create_dirs
+
+data_dir = Path(config("DATA_DIR"))
+output_dir = Path(config("OUTPUT_DIR"))
+
+def _figures(calc_df, rep_df):
+    """Renders the spread figures and the supplementary figures together,
+    from the plotted tenors of the spreads of the calc stage
+    """
+    from plot_figure import figure_spec, supplementary_specs, render_figures
+    from universe import plot_tenors
+    arb_df = calc_df[[f'Arb_Swap_{tenor}' for tenor in plot_tenors()]]
+    if arb_df.columns.nlevels > 1:
+        arb_df = arb_df.droplevel(list(range(1, arb_df.columns.nlevels)), axis = 1)
+    end = pd.Timestamp(config("END_DATE")).date()
+    specs = [
+        figure_spec(arb_df, os.path.join(output_dir, 'replicated_swap_spread_arb_figure.png'), end),
+        figure_spec(arb_df, os.path.join(output_dir, 'updated_swap_spread_arb_figure.png')),
+    ]
+    specs += supplementary_specs(rep_df, os.path.join(output_dir, 'replication_figure.png'))
+    return render_figures(specs)
+
+def default_stages():
+    """The stages of the pipeline
+
+    :return: Mapping of the stage names to their function and the names of the
+    stages whose outputs are the arguments of the function
+    :rtype: dict
+    """
+    from pull_bloomberg import pull_raw_tyields, pull_raw_syields, clean_raw_tyields, clean_raw_syields
+    from calc_swap_spreads import cached_swap_spreads
+    from supplementary import sup_table, sup_intervals, replication_df
+    from spread_stats import stats_main
+    from multi_curve import curves_main
+    from interpolation import interp_main
+    from zero_curves import zero_main
+    from backtest import backtest_main
+    from scenarios import scenarios_main
+
+    calc_file = os.path.join(data_dir, 'calc_spread', 'calc_merged.parquet')
+    return {
+        'raw_tyields': (pull_raw_tyields, []),
+        'raw_syields': (pull_raw_syields, []),
+        'tyields': (clean_raw_tyields, ['raw_tyields']),
+        'syields': (clean_raw_syields, ['raw_syields']),
+        'calc': (lambda t_df, s_df: cached_swap_spreads(t_df, s_df, target = calc_file),
+                 ['tyields', 'syields']),
+        'curves': (curves_main, ['tyields', 'syields']),
+        'interp': (interp_main, ['tyields', 'syields']),
+        'zero': (zero_main, ['tyields', 'syields']),
+        'table': (sup_table, ['calc']),
+        'intervals': (sup_intervals, ['calc']),
+        'stats': (stats_main, ['calc']),
+        'backtest': (backtest_main, ['calc']),
+        'scenarios': (scenarios_main, ['tyields', 'syields']),
+        'replication': (replication_df, ['tyields', 'syields']),
+        'figures': (_figures, ['calc', 'replication']),
+    }
+
+class Pipeline:
+    """Runs stages of a DAG and keeps their outputs in memory until no stage
+    needs them anymore.
+
+    :param stages: Mapping of the stage names to their function and
+    dependencies, defaults to default_stages()
+    :type stages: dict
+    :param compact: If set to True, the numeric frames are kept in memory as
+    CompactFrames between stages, see compact.py. Defaults to COMPACT_FRAMES
+    :type compact: bool
+    """
+
+    def __init__(self, stages = None, compact = None):
+        create_dirs()
+        self.stages = default_stages() if stages is None else stages
+        self.compact = config('COMPACT_FRAMES') if compact is None else compact
+        self.results = {}
+        self.done = set()
+        self.timings = {}
+        self._pinned = set()
+
+    def order(self, targets):
+        """Stages needed for the targets, dependencies first
+
+        :param targets: Stage names
+        :type targets: list
+
+        :rtype: list
+        """
+        order, visiting = [], set()
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f'Cycle in the pipeline at stage {name}')
+            if name not in self.stages:
+                raise KeyError(f'Unknown stage {name}')
+            visiting.add(name)
+            for dep in self.stages[name][1]:
+                visit(dep)
+            visiting.discard(name)
+            order.append(name)
+        for name in targets:
+            visit(name)
+        return order
+
+    def _release(self):
+        """Drops the outputs which every dependent stage has consumed, except
+        the targets of the running calls
+        """
+        for name in list(self.results):
+            dependents = [x for x, (_, deps) in self.stages.items() if name in deps]
+            if name not in self._pinned and dependents and all(x in self.done for x in dependents):
+                del self.results[name]
+
+    def run(self, targets = None):
+        """Runs the target stages and the dependencies they still need
+
+        :param targets: Stage names, defaults to every stage
+        :type targets: list
+
+        :return: Outputs of the targets
+        :rtype: dict
+        """
+        targets = list(self.stages) if targets is None else list(targets)
+        pinned = set(targets) - self._pinned
+        self._pinned |= pinned
+        try:
+            for name in self.order(targets):
+                if name in self.results or (name in self.done and name not in targets):
+                    continue
+                func, deps = self.stages[name]
+                self.done.discard(name)
+                # Dependencies released after an earlier run are recomputed
+                missing = [x for x in deps if x not in self.results]
+                if missing:
+                    self.run(missing)
+                start = time.perf_counter()
+                output = func(*[expand(self.results[x]) for x in deps])
+                self.results[name] = compact(output) if self.compact else output
+                self.timings[name] = time.perf_counter() - start
+                self.done.add(name)
+                self._release()
+            return {name: expand(self.results[name]) for name in targets}
+        finally:
+            self._pinned -= pinned
+
+## Shared by the doit tasks, which run in one process
+PIPELINE = None
+
+def run(targets = None):
+    """Runs stages with the shared pipeline
+
+    :param targets: Stage names, defaults to every stage
+    :type targets: list
+
+    :return: Outputs of the targets
+    :rtype: dict
+    """
+    global PIPELINE
+    if PIPELINE is None:
+        PIPELINE = Pipeline()
+    return PIPELINE.run(targets)
+
+
+if __name__ == '__main__':
+    run(sys.argv[1:] or None)
+    for name, seconds in PIPELINE.timings.items():
+        print(f'{name:>12}: {seconds:8.3f}s')
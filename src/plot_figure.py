@@ -1,85 +1,181 @@
 """
 Functions to plot the replicated, updated, and supplementary plots, and save them.
+
+Figures are described by plain specs (lines, labels and the output path) and
+rendered with the object-oriented Matplotlib API on Agg canvases, so they can
+be fanned out to a process pool. Long series are decimated to the pixel width
+of the figure before plotting.
 """
 
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from calc_swap_spreads import *
-from supplementary import *
+from settings import config
+from instrument import instrumented
+from universe import plot_tenors, spread_pairs
 
 output_dir = Path(config("OUTPUT_DIR"))
 
-def plot_figure(arb_df, savePath, end=None):
+FIGSIZE = (6.4, 4.8)
+DPI = 100
+
+def decimate(series, width):
+    """Reduces a series to the points visible at a given pixel width. The
+    series is split into `width` buckets and the first, last, minimum and
+    maximum point of each bucket is kept, so peaks and troughs survive.
+
+    :param series: Series to decimate, without missing values
+    :type series: pd.Series
+    :param width: Width of the plot in pixels
+    :type width: int
+
+    :return: The kept points, in their original order
+    :rtype: pd.Series
+    """
+    n = len(series)
+    if width <= 0 or n <= 4 * width:
+        return series
+    values = series.to_numpy(np.float64)
+    size = -(-n // width)
+    padded = np.pad(values, (0, size * width - n), mode = 'edge').reshape(width, size)
+    starts = np.arange(width) * size
+    keep = np.concatenate([starts, starts + size - 1,
+                           starts + padded.argmin(axis = 1), starts + padded.argmax(axis = 1)])
+    keep = np.unique(np.minimum(keep, n - 1))
+    return series.iloc[keep]
+
+def _line(series, label, width, **kwargs):
+    """Line of a figure spec with the series decimated to the figure width
+    """
+    if isinstance(series, pd.DataFrame):
+        # Selecting a ticker of (ticker, field) columns gives a single column frame
+        series = series.iloc[:, 0]
+    series = decimate(series, width)
+    return {'x': pd.to_datetime(series.index).to_numpy(), 'y': series.to_numpy(np.float64),
+            'label': label, **kwargs}
+
+def render_figure(spec):
+    """Draws a figure spec on an Agg canvas and saves it
+
+    :param spec: Figure spec with 'lines', 'title', 'xlabel', 'ylabel' and
+    'path' keys, each line being a dict with 'x', 'y', 'label' and optional
+    Matplotlib line properties
+    :type spec: dict
+
+    :return: Path of the saved figure
+    :rtype: str
+    """
+    # Matplotlib is only imported once a figure is drawn
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize = spec.get('figsize', FIGSIZE), dpi = spec.get('dpi', DPI))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    for line in spec['lines']:
+        line = dict(line)
+        ax.plot(line.pop('x'), line.pop('y'), **line)
+    ax.set_title(spec['title'])
+    ax.set_xlabel(spec['xlabel'])
+    ax.set_ylabel(spec['ylabel'])
+    ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.15), ncol=5)
+    ax.grid(axis = 'y')
+    fig.savefig(spec['path'], bbox_inches='tight')
+    return spec['path']
+
+@instrumented
+def render_figures(specs, max_workers=None):
+    """Renders figure specs, in this process unless several processes are
+    requested, which only pays off for many figures
+
+    :param specs: Figure specs, see render_figure
+    :type specs: list
+    :param max_workers: Number of processes, defaults to PLOT_MAX_WORKERS, and
+    to the number of cores if that is 0. 1 renders in this process.
+    :type max_workers: int
+
+    :return: Paths of the saved figures
+    :rtype: list
+    """
+    max_workers = config("PLOT_MAX_WORKERS") if max_workers is None else max_workers
+    max_workers = min(max_workers or os.cpu_count() or 1, len(specs))
+    if max_workers <= 1:
+        return [render_figure(spec) for spec in specs]
+    with ProcessPoolExecutor(max_workers = max_workers) as executor:
+        return list(executor.map(render_figure, specs))
+
+def figure_spec(arb_df, savePath, end=None, curve=None):
+    """Spec of the arbitrage spread plot, see plot_figure
+    """
+    start = pd.Timestamp(config("START_DATE")).date()
+    width = int(FIGSIZE[0] * DPI)
+    lines = []
+    for tenor in plot_tenors(curve):
+        series = arb_df[f'Arb_Swap_{tenor}'].loc[start:end].dropna()
+        lines.append(_line(series, f'{tenor}Y', width))
+    return {'lines': lines, 'title': 'Treasury-Swap', 'xlabel': 'Dates',
+            'ylabel': 'Arbitrage Spread (bps)', 'path': savePath}
+
+def supplementary_specs(replication_df, savePath, curve=None):
+    """Specs of the supplementary plots, one per tenor, see plot_supplementary
+    """
+    pairs = spread_pairs(curve).set_index('tenor')
+    width = int(FIGSIZE[0] * DPI)
+    specs = []
+    for year in plot_tenors(curve):
+        govt, swap = pairs.loc[year, 'govt'], pairs.loc[year, 'swap']
+        lines = [
+            _line(np.log(100 * replication_df[govt].dropna()), f'{year}Y Treasury', width, linewidth=1),
+            _line(np.log(100 * replication_df[swap].dropna()), f'{year}Y Swap', width, linewidth=1),
+        ]
+        specs.append({'lines': lines, 'title': 'Treasury and Swap Rates', 'xlabel': 'Dates',
+                      'ylabel': 'Log Rates', 'path': f'{savePath[:-4]}{year}.png'})
+    return specs
+
+@instrumented
+def plot_figure(arb_df, savePath, end=None, curve=None):
     """Creating and saving the plot generated using the data provided.
 
     :param arb_df: DataFrame containing the arbitrage calculations per year
     :type arb_df: pd.DataFrame
     :param savePath: Path for saving the plot
     :type savePath: str
-    :param end: end date for the plot, defaults to None which then means using 
+    :param end: end date for the plot, defaults to None which then means using
     the last date in arb_df
     :type end: pd.Timestamp
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
 
     :return: void
     """
-    start = pd.Timestamp(config("START_DATE")).date()
-    for year in [1,20,2,30,3,5,10]:
-        label = f'{year}Y'
-        if end:
-            plt.plot(arb_df[f'Arb_Swap_{year}'].loc[start:end].dropna(), label = label)
-        else:
-            plt.plot(arb_df[f'Arb_Swap_{year}'].loc[start:].dropna(), label = label)
-    plt.title('Treasury-Swap')
-    plt.xlabel('Dates')
-    plt.ylabel('Arbitrage Spread (bps)')
-    plt.legend(loc='upper center', bbox_to_anchor=(0.5, -0.15), ncol=5)
-    plt.grid(axis = 'y')
-    plt.savefig(savePath, bbox_inches='tight')
-    plt.close()
-
-def plot_supplementary(replication_df, savePath):
+    render_figure(figure_spec(arb_df, savePath, end, curve))
+
+@instrumented
+def plot_supplementary(replication_df, savePath, curve=None, max_workers=None):
     """Creating and saving the supplementary plot generated using the data provided.
 
     :param replication_df: DataFrame containing the cleaned treasury and swap data
     :type replication_df: pd.DataFrame
     :param savePath: Path for saving the plot
     :type savePath: str
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+    :param max_workers: Number of rendering processes, see render_figures
+    :type max_workers: int
 
     :return: void
     """
-    for year in [1,20,2,30,3,5,10]:
-        plt.plot(np.log(100 * replication_df[f'GT{year} Govt'].dropna()), label = f'{year}Y Treasury', linewidth=1)
-        plt.plot(np.log(100 * replication_df[f'USSO{year} CMPN Curncy'].dropna()), label = f'{year}Y Swap', linewidth=1)
-        plt.title('Treasury and Swap Rates')
-        plt.xlabel('Dates')
-        plt.ylabel('Log Rates')
-        plt.legend(loc='upper center', bbox_to_anchor=(0.5, -0.15), ncol=5)
-        plt.grid(axis = 'y')
-        plt.savefig("".join([x for x in savePath[:len(savePath) - 4]]+[f"{year}", ".png"]), bbox_inches='tight')
-        plt.close()
+    render_figures(supplementary_specs(replication_df, savePath, curve), max_workers)
 
 def plot_main():
     """
     Main function that creates and saves the replicated, updated, and supplementary plots
     """
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    file_dir = os.path.join(data_dir, '/calc_spread')
-    file = os.path.join(file_dir, '/calc_merged.pkl')
-    if os.path.exists(file):
-        arb_df = pd.read_pickle(file)
-    else:
-        t_df, s_df = bloom_main()
-        arb_df = calc_swap_spreads(t_df, s_df)
-    end = pd.Timestamp(config("END_DATE")).date()
-
-    rep_df = supplementary_main()
-
-    plot_figure(arb_df, os.path.join(output_dir, 'replicated_swap_spread_arb_figure.png'), end)
-    plot_figure(arb_df, os.path.join(output_dir, 'updated_swap_spread_arb_figure.png'))
-    
-    plot_supplementary(rep_df, os.path.join(output_dir, 'replication_figure.png'))
+    from pipeline import Pipeline
+    Pipeline().run(['table', 'figures'])
 
 if __name__ == '__main__':
     plot_main()
\ No newline at end of file
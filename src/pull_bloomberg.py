@@ -3,139 +3,485 @@ Pulls data from Bloomberg or local files. Cleans if required.
 """
 
 import pandas as pd
-from xbbg import blp
+import pyarrow as pa
+import pyarrow.compute as pc
 import numpy as np
 from datetime import timedelta
 import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from settings import config
+from store import save_frame, load_frame
+from stage_cache import cached
+from instrument import instrumented
+from universe import govt_tickers, govt_rename, swap_tickers
+from calendars import previous_business_day
 
 data_dir = Path(config("DATA_DIR"))
 
-def pull_raw_tyields(override_download = False):
-    """Pull raw treasury yield data
+START_DATE = '2000-01-01'
 
-    :param override_download: If set to True, downloaded data is ignored
-    :type override_download: bool, default = False
+## Source of the pulls, created on the first pull so that using local data
+## never loads xbbg and blpapi
+blp = None
 
-    :return: Raw treasury yield data
-    :rtype: pd.DataFrame
+SOURCES = ['bloomberg', 'record', 'replay', 'synthetic']
+
+def data_source(name = None, record_dir = None, latency = None, failure_rate = None):
+    """Creates the object serving the `bdh` requests of the pulls
+
+     - 'bloomberg': the `xbbg.blp` client
+     - 'record': the `xbbg.blp` client, with every response recorded to disk
+     - 'replay': the recorded responses, served without a terminal
+     - 'synthetic': deterministic synthetic yields, see fake_blp.FakeBlp
+
+    :param name: One of SOURCES, defaults to BBG_SOURCE
+    :type name: str
+    :param record_dir: Directory of the recordings, defaults to
+    DATA_DIR/bbg/recordings
+    :type record_dir: str
+    :param latency: Seconds each replayed or synthetic request takes,
+    defaults to BBG_SIM_LATENCY
+    :type latency: float
+    :param failure_rate: Probability of a replayed or synthetic request
+    failing, defaults to BBG_SIM_FAILURE_RATE
+    :type failure_rate: float
+
+    :return: Object providing `bdh`
+    :rtype: object
     """
-    file_dir = os.path.join(data_dir, 'bbg')
-    file = os.path.join(file_dir, 'raw_tyields.pkl')
-    if os.path.exists(file) and not override_download:
-        print('Loading local treasury yield data.')
-        df = pd.read_pickle(file)
-    else:
-        print('Fetching treasury yield data from Bloomberg')
-        TODAY = pd.to_datetime('today').normalize() - timedelta(days=1)
-        months = [1, 2, 3, 4, 6, 12]
-        years = [2, 3, 5, 7, 10, 20, 30]
-        t_list = [f'GB{x} Govt' for x in months] + [f'GT{x} Govt' for x in years]
+    name = config('BBG_SOURCE') if name is None else name
+    record_dir = os.path.join(data_dir, 'bbg', 'recordings') if record_dir is None else record_dir
+    latency = config('BBG_SIM_LATENCY') if latency is None else latency
+    failure_rate = config('BBG_SIM_FAILURE_RATE') if failure_rate is None else failure_rate
+    if name not in SOURCES:
+        raise ValueError(f'Unknown data source {name}, expected one of {SOURCES}')
+    if name in ('bloomberg', 'record'):
+        from xbbg import blp as client
+        if name == 'bloomberg':
+            return client
+        from fake_blp import RecordingBlp
+        os.makedirs(record_dir, exist_ok = True)
+        return RecordingBlp(client, record_dir)
+    from fake_blp import FakeBlp, ReplayBlp
+    if name == 'replay':
+        return ReplayBlp(record_dir, latency = latency, failure_rate = failure_rate)
+    return FakeBlp(latency = latency, failure_rate = failure_rate)
+
+def _bloomberg():
+    """The source of the pulls, created on first use
+    """
+    global blp
+    if blp is None:
+        blp = data_source()
+    return blp
+
+def _bdh_with_retry(source, tickers, flds, start_date, end_date, retries, backoff):
+    """Calls `bdh` on a source, retrying failures with exponential backoff
+    """
+    for attempt in range(retries + 1):
         try:
-            df = blp.bdh(
-                tickers = t_list,
-                flds = ['PX_LAST',],
-                start_date = '2000-01-01',
-                end_date = TODAY
+            return source.bdh(
+                tickers = tickers,
+                flds = flds,
+                start_date = start_date,
+                end_date = end_date
             )
         except Exception as e:
-            print(f'Failed Bloomberg data pull.  See error below.')
-            raise e
-        df = df.rename(columns = {'GB12 Govt': 'GT1 Govt'})
-        if not os.path.exists(file_dir):
-            os.makedirs(file_dir)
-        df.to_pickle(file)
+            if attempt == retries:
+                raise e
+            wait = backoff * 2 ** attempt
+            print(f'Bloomberg request for {tickers} from {start_date.date()} failed ({e}). '
+                  f'Retrying in {wait:.1f}s.')
+            time.sleep(wait)
+
+def fetch_bdh(tickers, start_date, end_date, flds = None, source = None,
+              tickers_per_chunk = 1, chunk_days = None, max_workers = None,
+              retries = None, backoff = 1.0):
+    """Pulls historical data by splitting the request into ticker and date
+    chunks, which are fetched concurrently on a bounded thread pool with
+    failed chunks retried. The result has the same layout as `blp.bdh`.
+
+    :param tickers: Bloomberg tickers to pull
+    :type tickers: list
+    :param start_date: First date to pull
+    :type start_date: date like
+    :param end_date: Last date to pull
+    :type end_date: date like
+    :param flds: Bloomberg fields to pull
+    :type flds: list, defaults to ['PX_LAST']
+    :param source: Object providing `bdh`, defaults to the BBG_SOURCE source,
+    see data_source
+    :type source: object
+    :param tickers_per_chunk: Number of tickers per request
+    :type tickers_per_chunk: int, default = 1
+    :param chunk_days: Number of calendar days per request, defaults to
+    BBG_CHUNK_DAYS
+    :type chunk_days: int
+    :param max_workers: Number of concurrent requests, defaults to
+    BBG_MAX_WORKERS
+    :type max_workers: int
+    :param retries: Number of retries of a failed request, defaults to
+    BBG_RETRIES
+    :type retries: int
+    :param backoff: Seconds waited before the first retry, doubled after
+    each further failure
+    :type backoff: float, default = 1.0
+
+    :return: Historical data with (ticker, field) columns
+    :rtype: pd.DataFrame
+    """
+    flds = ['PX_LAST'] if flds is None else flds
+    source = _bloomberg() if source is None else source
+    chunk_days = config('BBG_CHUNK_DAYS') if chunk_days is None else chunk_days
+    max_workers = config('BBG_MAX_WORKERS') if max_workers is None else max_workers
+    retries = config('BBG_RETRIES') if retries is None else retries
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+
+    ticker_chunks = [tickers[i:i + tickers_per_chunk] for i in range(0, len(tickers), tickers_per_chunk)]
+    date_chunks = []
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days = chunk_days - 1), end_date)
+        date_chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + timedelta(days = 1)
+
+    with ThreadPoolExecutor(max_workers = max_workers) as pool:
+        futures = [[pool.submit(_bdh_with_retry, source, group, flds, lo, hi, retries, backoff)
+                    for lo, hi in date_chunks] for group in ticker_chunks]
+        frames = []
+        for group in futures:
+            parts = [f.result() for f in group]
+            parts = [part for part in parts if not part.empty]
+            if parts:
+                frames.append(pd.concat(parts, axis = 0))
+    if not frames:
+        return pd.DataFrame()
+
+    df = pd.concat(frames, axis = 1).sort_index()
+    columns = [(t, f) for t in tickers for f in flds if (t, f) in df.columns]
+    return df.loc[:, columns]
+
+def _watermark_file(file):
+    """Path of the per-ticker watermark file stored next to a raw data file
+    """
+    return file.replace('.parquet', '_watermark.json')
+
+def _load_watermarks(file, df):
+    """Loads the per-ticker watermarks of a raw data file. Caches written
+    before watermarks were recorded fall back to the last valid date of
+    each ticker.
+
+    :param file: Path of the raw data file
+    :type file: str
+    :param df: The cached raw data
+    :type df: pd.DataFrame
+
+    :return: Last requested date per ticker
+    :rtype: pd.Series
+    """
+    watermark_file = _watermark_file(file)
+    if os.path.exists(watermark_file):
+        with open(watermark_file) as f:
+            watermarks = json.load(f)
+        return pd.Series({k: pd.Timestamp(v).date() for k, v in watermarks.items()}, dtype = object)
+    tickers = df.columns.get_level_values(0).unique()
+    return pd.Series({ticker: df[ticker].last_valid_index() for ticker in tickers}, dtype = object)
+
+def _pull_incremental(file, tickers, end_date, rename = None, lookback_days = None):
+    """Updates a cached raw data file with only the dates missing from it.
+    Each ticker is requested from its watermark minus the look-back window
+    so that late revisions are picked up, and new values overwrite cached ones.
+
+    :param file: Path of the cached raw data file
+    :type file: str
+    :param tickers: Bloomberg tickers to pull
+    :type tickers: list
+    :param end_date: Last date to request
+    :type end_date: pd.Timestamp
+    :param rename: Mapping of Bloomberg tickers to stored column names
+    :type rename: dict
+    :param lookback_days: Days before the watermark to re-request, defaults
+    to PULL_LOOKBACK_DAYS
+    :type lookback_days: int
+
+    :return: The merged raw data and the updated watermarks
+    :rtype: tuple(pd.DataFrame, pd.Series)
+    """
+    rename = rename or {}
+    if lookback_days is None:
+        lookback_days = config('PULL_LOOKBACK_DAYS')
+    df = load_frame(file)
+    watermarks = _load_watermarks(file, df)
+
+    # Tickers sharing a start date are requested together
+    groups = {}
+    for ticker in tickers:
+        last = watermarks.get(rename.get(ticker, ticker))
+        if last is None or pd.isna(last):
+            start = pd.Timestamp(START_DATE)
+        else:
+            start = pd.Timestamp(last) - timedelta(days = lookback_days)
+        if start <= end_date:
+            groups.setdefault(start, []).append(ticker)
+
+    frames = []
+    for start, group in groups.items():
+        new_df = fetch_bdh(group, start, end_date)
+        if not new_df.empty:
+            frames.append(new_df)
+        for ticker in group:
+            watermarks[rename.get(ticker, ticker)] = end_date.date()
+
+    if frames:
+        new_df = pd.concat(frames, axis = 1).rename(columns = rename)
+        columns = list(df.columns) + [c for c in new_df.columns if c not in df.columns]
+        df = new_df.combine_first(df).loc[:, columns].sort_index()
+    return df, watermarks
+
+def _pull_raw(file, tickers, rename = None, override_download = False,
+              incremental = None, lookback_days = None, name = ''):
+    """Loads, fully downloads or incrementally updates a raw data file
+
+    :param file: Path of the raw data file
+    :type file: str
+    :param tickers: Bloomberg tickers to pull
+    :type tickers: list
+    :param rename: Mapping of Bloomberg tickers to stored column names
+    :type rename: dict
+    :param override_download: If set to True, downloaded data is ignored
+    :type override_download: bool, default = False
+    :param incremental: If set to True, only dates missing from the local
+    data are pulled, defaults to INCREMENTAL_PULL
+    :type incremental: bool
+    :param lookback_days: Days before the watermark to re-request
+    :type lookback_days: int
+    :param name: Name of the data used in messages
+    :type name: str
+
+    :return: Raw yield data
+    :rtype: pd.DataFrame
+    """
+    rename = rename or {}
+    if incremental is None:
+        incremental = config('INCREMENTAL_PULL')
+    exists = os.path.exists(file) and not override_download
+    if exists and not incremental:
+        print(f'Loading local {name} data.')
+        return load_frame(file)
+
+    TODAY = previous_business_day()
+    try:
+        if exists:
+            print(f'Updating {name} data from Bloomberg')
+            df, watermarks = _pull_incremental(file, tickers, TODAY, rename, lookback_days)
+        else:
+            print(f'Fetching {name} data from Bloomberg')
+            df = fetch_bdh(tickers, START_DATE, TODAY)
+            df = df.rename(columns = rename)
+            watermarks = pd.Series({rename.get(t, t): TODAY.date() for t in tickers}, dtype = object)
+    except Exception as e:
+        print(f'Failed Bloomberg data pull. See error below.')
+        raise e
+    # Raw pulls keep float64 so the cleaned data and its cache keys do not
+    # depend on COMPACT_FRAMES
+    save_frame(df, file, compact = False)
+    with open(_watermark_file(file), 'w') as f:
+        json.dump({k: str(v) for k, v in watermarks.items() if not pd.isna(v)}, f, indent = 1)
     return df
 
-def pull_raw_syields(override_download = False):
-    """Pull raw swap yield data
+@instrumented
+def pull_raw_tyields(override_download = False, incremental = None, lookback_days = None):
+    """Pull raw treasury yield data for every curve of the instrument universe
 
     :param override_download: If set to True, downloaded data is ignored
     :type override_download: bool, default = False
-    
+    :param incremental: If set to True, only dates after the last cached date
+    of each ticker are pulled and merged into the local data, defaults to
+    INCREMENTAL_PULL
+    :type incremental: bool
+    :param lookback_days: Days before the last cached date to re-request for
+    revisions, defaults to PULL_LOOKBACK_DAYS
+    :type lookback_days: int
+
+    :return: Raw treasury yield data
+    :rtype: pd.DataFrame
+    """
+    file = os.path.join(data_dir, 'bbg', 'raw_tyields.parquet')
+    return _pull_raw(file, govt_tickers(), rename = govt_rename(),
+                     override_download = override_download, incremental = incremental,
+                     lookback_days = lookback_days, name = 'treasury yield')
+
+@instrumented
+def pull_raw_syields(override_download = False, incremental = None, lookback_days = None):
+    """Pull raw swap yield data for every curve of the instrument universe
+
+    :param override_download: If set to True, downloaded data is ignored
+    :type override_download: bool, default = False
+    :param incremental: If set to True, only dates after the last cached date
+    of each ticker are pulled and merged into the local data, defaults to
+    INCREMENTAL_PULL
+    :type incremental: bool
+    :param lookback_days: Days before the last cached date to re-request for
+    revisions, defaults to PULL_LOOKBACK_DAYS
+    :type lookback_days: int
+
     :return: Raw swap yield data
     :rtype: pd.DataFrame
     """
-    file_dir = os.path.join(data_dir, 'bbg')
-    file = os.path.join(file_dir, 'raw_syields.pkl')
-    if os.path.exists(file) and not override_download:
-        print('Loading local swap yield data.')
-        df = pd.read_pickle(file)
+    file = os.path.join(data_dir, 'bbg', 'raw_syields.parquet')
+    return _pull_raw(file, swap_tickers(), override_download = override_download,
+                     incremental = incremental, lookback_days = lookback_days,
+                     name = 'swap yield')
+
+def _forward_positions(mask):
+    """Row position of the last True cell at or above each cell of a
+    (date x ticker) mask, -1 where there is none
+    """
+    rows = np.arange(len(mask))[:, None]
+    return np.maximum.accumulate(np.where(mask, rows, -1), axis = 0)
+
+## Increase when the output of clean_yields changes, invalidating cached results
+CLEAN_VERSION = 1
+
+NUMBER_PATTERN = r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$'
+
+def _parse_numbers(values):
+    """Parses a flat object array to floats in one bulk conversion
+
+    :return: The floats, with NaN for entries which are not numbers, and the
+    number of non-missing entries which could not be parsed
+    :rtype: tuple(np.ndarray, int)
+    """
+    try:
+        arr = pa.array(values, type = pa.string(), from_pandas = True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed python objects, e.g. floats and strings
+        parsed = pd.to_numeric(values, errors = 'coerce').astype(np.float64)
+        return parsed, int(np.isnan(parsed).sum() - pd.isna(values).sum())
+    try:
+        parsed = pc.cast(arr, pa.float64())
+    except pa.ArrowInvalid:
+        arr_trimmed = pc.utf8_trim_whitespace(arr)
+        numbers = pc.if_else(pc.match_substring_regex(arr_trimmed, NUMBER_PATTERN), arr_trimmed, None)
+        parsed = pc.cast(numbers, pa.float64())
+    coerced = parsed.null_count - arr.null_count
+    return parsed.to_numpy(zero_copy_only = False), coerced
+
+def clean_yields(raw_df, rules = None):
+    """Converts a raw yield frame to floats in one pass and applies the
+    cleaning rules. Numeric columns are used as they are, and all
+    non-numeric columns are parsed together in a single bulk conversion.
+
+    The rules are applied in order:
+
+     - `stale_limit`: a value repeated on more than this many consecutive
+       observations is set to NaN after its first stale_limit occurrences
+     - `clip`: (lower, upper) bounds the values are clipped to
+     - `ffill_limit`: missing values are forward filled over at most this
+       many observations. Cells removed as stale are not filled.
+
+    :param raw_df: Data Frame to clean
+    :type raw_df: pd.DataFrame
+    :param rules: Cleaning rules, defaults to None which only converts
+    :type rules: dict
+
+    :return: Cleaned data frame and the number of cells each step touched
+    :rtype: tuple(pd.DataFrame, dict)
+    """
+    rules = rules or {}
+    report = {'coerced': 0}
+    numeric = np.array([pd.api.types.is_numeric_dtype(x) for x in raw_df.dtypes], dtype = bool)
+    if numeric.all():
+        # Fast path, the frame is only copied if a rule modifies it
+        values = raw_df.to_numpy(np.float64, copy = bool(rules))
     else:
-        print('Fetching swap yield data from Bloomberg')
-        TODAY = pd.to_datetime('today').normalize() - timedelta(days=1)
-        years = [1, 2, 3, 5, 10, 20, 30]
-        swap_list = [f'USSO{x} CMPN Curncy' for x in years]
-        try:
-            df = blp.bdh(
-                tickers = swap_list,
-                flds = ['PX_LAST',],
-                start_date = '2000-01-01',
-                end_date = TODAY
-            )
-        except Exception as e:
-            print(f'Failed Bloomberg data pull. See error below.')
-            raise e
-        if not os.path.exists(file_dir):
-            os.makedirs(file_dir)
-        df.to_pickle(file)
-    return df
+        values = np.empty(raw_df.shape, dtype = np.float64)
+        num_cols, obj_cols = np.flatnonzero(numeric), np.flatnonzero(~numeric)
+        if len(num_cols):
+            values[:, num_cols] = raw_df.iloc[:, num_cols].to_numpy(np.float64)
+        block = raw_df.iloc[:, obj_cols].to_numpy(object)
+        parsed, report['coerced'] = _parse_numbers(block.ravel())
+        values[:, obj_cols] = parsed.reshape(block.shape)
+
+    missing = np.isnan(values)
+
+    if rules.get('stale_limit') is not None:
+        changed = np.ones(values.shape, dtype = bool)
+        changed[1:] = values[1:] != values[:-1]
+        run_length = np.arange(len(values))[:, None] - _forward_positions(changed)
+        stale = ~missing & (run_length >= rules['stale_limit'])
+        values[stale] = np.nan
+        report['stale'] = int(stale.sum())
+
+    if rules.get('clip') is not None:
+        lower, upper = rules['clip']
+        clipped = (values < lower) | (values > upper)
+        np.clip(values, lower, upper, out = values)
+        report['clipped'] = int(clipped.sum())
 
-def clean_raw_tyields(raw_df, override = False, save_data = True):
+    if rules.get('ffill_limit') is not None:
+        last = _forward_positions(~np.isnan(values))
+        gap = np.arange(len(values))[:, None] - last
+        fill = missing & (last >= 0) & (gap <= rules['ffill_limit'])
+        rows, cols = np.nonzero(fill)
+        values[rows, cols] = values[last[rows, cols], cols]
+        report['filled'] = len(rows)
+
+    df = pd.DataFrame(values, index = raw_df.index, columns = raw_df.columns, copy = False)
+    return df, report
+
+def _clean_raw(raw_df, file, override, save_data, rules, name):
+    """Cleans raw yield data. When saving, the cleaned data is reused from the
+    stage cache if this raw data was already cleaned with the same rules.
+    """
+    def compute():
+        df, report = clean_yields(raw_df, rules)
+        touched = ', '.join(f'{rule} {count}' for rule, count in report.items())
+        print(f'Cleaned {name} data, cells touched: {touched}.')
+        return df
+    if not save_data:
+        return compute()
+    return cached('clean_yields', CLEAN_VERSION, [raw_df], compute, params = {'rules': rules},
+                  target = file, override = override)
+
+@instrumented
+def clean_raw_tyields(raw_df, override = False, save_data = True, rules = None):
     """Cleans treasury yield data
 
     :param raw_df: Data Frame to clean
     :type raw_df: pd.DataFrame
-    :param override: If set to True, downloaded data is ignored
+    :param override: If set to True, cached cleaned data is ignored
     :type override: bool, default = False
     :type save_data: bool, default = True
+    :param rules: Cleaning rules, see clean_yields
+    :type rules: dict
 
     :return: Cleaned treasury yield data frame
     :rtype: pd.DataFrame
     """
-    if save_data == True:
-        file_dir = os.path.join(data_dir, 'bbg')
-        file = os.path.join(file_dir, 'tyields.pkl')
-        if os.path.exists(file) and not override:
-            print('Loading local cleaned treasury yield data.')
-            df = pd.read_pickle(file)
-        else:
-            df = raw_df.apply(pd.to_numeric, errors = 'coerce')
-            if not os.path.exists(file_dir):
-                os.makedirs(file_dir)
-            df.to_pickle(file)
-    else:
-        df = raw_df.apply(pd.to_numeric, errors = 'coerce')
-    return df
+    file = os.path.join(data_dir, 'bbg', 'tyields.parquet')
+    return _clean_raw(raw_df, file, override, save_data, rules, 'treasury yield')
 
-def clean_raw_syields(raw_df, override = False, save_data = True):
+@instrumented
+def clean_raw_syields(raw_df, override = False, save_data = True, rules = None):
     """Cleans swap yield data
 
     :param raw_df: Data Frame to clean
     :type raw_df: pd.DataFrame
-    :param override: If set to True, downloaded data is ignored
+    :param override: If set to True, cached cleaned data is ignored
     :type override: bool, default = False
     :type save_data: bool, default = True
+    :param rules: Cleaning rules, see clean_yields
+    :type rules: dict
 
     :return: Cleaned swap yield data frame
     :rtype: pd.DataFrame
     """
-    if save_data == True:
-        file_dir = os.path.join(data_dir, 'bbg')
-        file = os.path.join(file_dir, 'syields.pkl')
-        if os.path.exists(file) and not override:
-            print('Loading local cleaned swap yield data.')
-            df = pd.read_pickle(file)
-        else:
-            df = raw_df.apply(pd.to_numeric, errors = 'coerce')
-            if not os.path.exists(file_dir):
-                os.makedirs(file_dir)
-            
-            df.to_pickle(file)
-    else:
-        df = raw_df.apply(pd.to_numeric, errors = 'coerce')
-    return df
+    file = os.path.join(data_dir, 'bbg', 'syields.parquet')
+    return _clean_raw(raw_df, file, override, save_data, rules, 'swap yield')
 
 def bloom_main():
     """Main function which pulls data and cleans it
@@ -0,0 +1,176 @@
+"""
+Date-range queries over the stored spreads and yields.
+
+The frames in the columnar store are sorted by date and split into one row
+group per year. A query only reads the year partitions overlapping its
+window and the requested columns, and cuts the window with a binary search
+on the sorted dates. Loaded partitions are kept in an LRU cache of
+QUERY_CACHE_PARTITIONS (file, year, column) entries, so repeated queries are
+served from memory. A rewritten file is detected from its inode and
+modification time and read again.
+"""
+
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from settings import config
+from store import INDEX_COL, SEP, _restore_columns, load_metadata
+from universe import spread_tenors
+
+data_dir = Path(config("DATA_DIR"))
+
+def spreads_file():
+    """Path of the stored spreads
+    """
+    return os.path.join(data_dir, 'calc_spread', 'calc_merged.parquet')
+
+def yields_files():
+    """Paths of the stored cleaned treasury and swap yields
+    """
+    return [os.path.join(data_dir, 'bbg', 'tyields.parquet'),
+            os.path.join(data_dir, 'bbg', 'syields.parquet')]
+
+def file_version(file):
+    """Identifies the current content of a file. The store replaces files
+    atomically, so a rewritten file has a new inode.
+    """
+    stat = os.stat(file)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+@lru_cache(maxsize = 64)
+def _layout(file, version):
+    """Opened file with the first and last date of every row group, and the
+    stored column names
+    """
+    parquet = pq.ParquetFile(file)
+    meta = parquet.metadata
+    pos = parquet.schema_arrow.get_field_index(INDEX_COL)
+    bounds = [meta.row_group(i).column(pos).statistics for i in range(meta.num_row_groups)]
+    firsts = np.array([np.datetime64(x.min, 'ns') for x in bounds], dtype = 'datetime64[ns]')
+    lasts = np.array([np.datetime64(x.max, 'ns') for x in bounds], dtype = 'datetime64[ns]')
+    names = [name for name in parquet.schema_arrow.names if name != INDEX_COL]
+    return parquet, firsts, lasts, names, load_metadata(file)['column_levels']
+
+def _read_partition(file, version, group, name):
+    """One column of one row group as a numpy array
+    """
+    parquet = _layout(file, version)[0]
+    column = parquet.read_row_group(group, columns = [name]).column(0)
+    if name == INDEX_COL:
+        return column.to_numpy().astype('datetime64[ns]')
+    return column.to_numpy()
+
+_partition = lru_cache(maxsize = config('QUERY_CACHE_PARTITIONS'))(_read_partition)
+
+def clear_cache():
+    """Empties the partition cache
+    """
+    _partition.cache_clear()
+    _layout.cache_clear()
+
+def _bound(date, default):
+    return default if date is None else np.datetime64(pd.Timestamp(date), 'ns')
+
+def _window(file, columns, start, end):
+    """Dates, stored column names and values of a date window of a file
+    """
+    version = file_version(file)
+    _, firsts, lasts, names, levels = _layout(file, version)
+    if columns is not None:
+        first_level = [name.split(SEP)[0] for name in names]
+        missing = [column for column in columns if column not in first_level]
+        if missing:
+            raise KeyError(f'{missing} not in {file}')
+        names = [name for column in columns for name, label in zip(names, first_level) if label == column]
+
+    lo = _bound(start, firsts.min(initial = np.datetime64(0, 'ns')))
+    hi = _bound(end, lasts.max(initial = np.datetime64(0, 'ns')))
+    groups = np.flatnonzero((lasts >= lo) & (firsts <= hi))
+    if not len(groups):
+        return np.array([], dtype = 'datetime64[ns]'), names, np.empty((0, len(names))), levels
+
+    def read(name):
+        parts = [_partition(file, version, g, name) for g in groups]
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    dates = read(INDEX_COL)
+    i, j = np.searchsorted(dates, lo, 'left'), np.searchsorted(dates, hi, 'right')
+    values = np.empty((j - i, len(names)))
+    for k, name in enumerate(names):
+        values[:, k] = read(name)[i:j]
+    return dates[i:j], names, values, levels
+
+def query_frame(file, columns = None, start = None, end = None):
+    """Reads a date window of a stored frame
+
+    :param file: Path of the Parquet file
+    :type file: str
+    :param columns: First level column names, defaults to None which reads
+    every column
+    :type columns: list
+    :param start: First date, inclusive
+    :type start: date like
+    :param end: Last date, inclusive
+    :type end: date like
+
+    :return: The window, indexed by timestamps
+    :rtype: pd.DataFrame
+    """
+    dates, names, values, levels = _window(file, columns, start, end)
+    return pd.DataFrame(values, index = pd.DatetimeIndex(dates), columns = _restore_columns(names, levels))
+
+def get_spreads(tenors = None, start = None, end = None, curve = None, file = None):
+    """Arbitrage spreads of some tenors over a date window
+
+    :param tenors: Tenor labels, defaults to every tenor of the curve
+    :type tenors: list
+    :param start: First date, inclusive
+    :type start: date like
+    :param end: Last date, inclusive
+    :type end: date like
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+    :param file: Stored spreads, defaults to the calc_swap_spreads output
+    :type file: str
+
+    :return: One `Arb_Swap_{tenor}` column per tenor, indexed by timestamps
+    :rtype: pd.DataFrame
+    """
+    tenors = spread_tenors(curve) if tenors is None else tenors
+    dates, names, values, _ = _window(spreads_file() if file is None else file,
+                                      [f'Arb_Swap_{tenor}' for tenor in tenors], start, end)
+    columns = pd.Index([name.split(SEP)[0] for name in names])
+    return pd.DataFrame(values, index = pd.DatetimeIndex(dates), columns = columns)
+
+def get_yields(columns, start = None, end = None, fld = 'PX_LAST', files = None):
+    """Cleaned treasury or swap yields over a date window
+
+    :param columns: Column names of the yields, e.g. 'GT10 Govt'
+    :type columns: list
+    :param start: First date, inclusive
+    :type start: date like
+    :param end: Last date, inclusive
+    :type end: date like
+    :param fld: Bloomberg field
+    :type fld: str, default = 'PX_LAST'
+    :param files: Stored yields, defaults to the cleaned treasury and swap yields
+    :type files: list
+
+    :return: One column per yield, indexed by timestamps
+    :rtype: pd.DataFrame
+    """
+    frames, missing = [], list(columns)
+    for file in yields_files() if files is None else files:
+        stored = {name.split(SEP)[0] for name in _layout(file, file_version(file))[3]}
+        wanted = [column for column in missing if column in stored]
+        if wanted:
+            frames.append(query_frame(file, wanted, start, end).xs(fld, axis = 1, level = 1))
+            missing = [column for column in missing if column not in stored]
+    if missing:
+        raise KeyError(f'No stored yields for {missing}')
+    df = pd.concat(frames, axis = 1) if len(frames) > 1 else frames[0]
+    return df[list(columns)]
@@ -0,0 +1,275 @@
+"""
+Scenario analysis of the arbitrage spreads under shocks to the treasury and
+swap curves.
+
+A scenario set is a frame with one row per scenario and (leg, tenor) columns
+holding the shocks in bps of the government ('govt') and swap ('swap') par
+yields at the tenors of the curve. Government instruments without a swap, such
+as the bills, get the shock interpolated over maturity. The sets are built by
+
+ - parallel_shocks: the same shock at every tenor
+ - steepener_shocks: shocks rising linearly with maturity from -size / 2 at
+   the shortest tenor to size / 2 at the longest, flatteners being negative
+ - butterfly_shocks: size at the belly, falling linearly to -size at the
+   shortest and longest tenors
+ - historical_shocks: the yield changes over a horizon observed on every
+   date of the history
+
+and combined with pd.concat. Every scenario is applied to every date of the
+history: par spreads respond to a shock directly, while zero and forward
+spreads are bootstrapped again from the shocked par yields (zero_curves.py).
+The scenarios are evaluated in chunks broadcasted against all dates, sized so
+that a chunk takes about SCENARIO_CHUNK_MB of memory, and the chunks can be
+spread across processes. Each scenario is summarized per tenor by its spread
+on the last date and its change from the unshocked spreads over the history.
+"""
+
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from calc_swap_spreads import _align, _column_positions
+from calendars import take
+from settings import config
+from universe import load_universe, spread_pairs
+from zero_curves import KINDS, FREQUENCIES, coupon_grid, leg_rates
+
+output_dir = Path(config("OUTPUT_DIR"))
+
+LEGS = {'govt': ('govt',), 'swap': ('swap',), 'both': ('govt', 'swap')}
+SIZES = (-100, -50, -25, 25, 50, 100)
+STATS = ['last', 'change_last', 'change_mean', 'change_min', 'change_max']
+
+def _tenors(curve = None):
+    pairs = spread_pairs(curve)
+    return [str(x) for x in pairs['tenor']], pairs['years'].to_numpy(np.float64)
+
+def shape_shocks(name, weights, sizes = SIZES, legs = ('govt', 'swap', 'both'), curve = None):
+    """Scenarios scaling one shape of shocks
+
+    :param name: Name of the shape, used in the scenario names
+    :type name: str
+    :param weights: Shock per bp of size at every tenor of the curve
+    :type weights: np.ndarray
+    :param sizes: Sizes in bps
+    :type sizes: list
+    :param legs: Legs shocked by each scenario, keys of LEGS
+    :type legs: list
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+
+    :return: Shocks in bps with one row per leg and size
+    :rtype: pd.DataFrame
+    """
+    tenors, _ = _tenors(curve)
+    columns = pd.MultiIndex.from_product([['govt', 'swap'], tenors], names = ['leg', 'tenor'])
+    rows, names = [], []
+    for leg in legs:
+        mask = np.array([x in LEGS[leg] for x in ['govt', 'swap']], dtype = np.float64)
+        for size in sizes:
+            rows.append(size * (mask[:, None] * np.asarray(weights)[None, :]).ravel())
+            names.append(f'{name} {leg} {size:+g}bp')
+    return pd.DataFrame(rows, index = pd.Index(names, name = 'scenario'), columns = columns)
+
+def parallel_shocks(sizes = SIZES, legs = ('govt', 'swap', 'both'), curve = None):
+    """Parallel shifts, see shape_shocks
+    """
+    tenors, _ = _tenors(curve)
+    return shape_shocks('parallel', np.ones(len(tenors)), sizes, legs, curve)
+
+def steepener_shocks(sizes = SIZES, legs = ('govt', 'swap', 'both'), curve = None):
+    """Steepeners for positive sizes and flatteners for negative ones, see
+    shape_shocks
+    """
+    _, years = _tenors(curve)
+    weights = (years - years.min()) / (years.max() - years.min()) - 0.5
+    return shape_shocks('steepener', weights, sizes, legs, curve)
+
+def butterfly_shocks(sizes = SIZES, legs = ('govt', 'swap', 'both'), belly = 5, curve = None):
+    """Butterflies raising the belly and lowering the wings for positive
+    sizes, see shape_shocks
+
+    :param belly: Maturity of the belly in years
+    :type belly: float, default = 5
+    """
+    _, years = _tenors(curve)
+    weights = np.interp(years, [years.min(), belly, years.max()], [-1, 1, -1])
+    return shape_shocks('butterfly', weights, sizes, legs, curve)
+
+def historical_shocks(treasury_df, swap_df, horizon = 1, curve = None):
+    """Changes of the yields over a horizon, one scenario per start date with
+    every yield available
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+    :param horizon: Number of business days of the changes
+    :type horizon: int, default = 1
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+
+    :return: Shocks in bps
+    :rtype: pd.DataFrame
+    """
+    pairs = spread_pairs(curve)
+    tenors, _ = _tenors(curve)
+    index, t_rows, s_rows = _align(treasury_df, swap_df, curve)
+    legs = []
+    for df, rows, names in [(treasury_df, t_rows, pairs['govt']), (swap_df, s_rows, pairs['swap'])]:
+        cols = _column_positions(df, names)
+        values = take(df.iloc[:, cols].to_numpy(np.float64), rows[:, cols])
+        legs.append(100 * (values[horizon:] - values[:-horizon]))
+    shocks = np.concatenate(legs, axis = 1)
+    keep = ~np.isnan(shocks).any(axis = 1)
+    names = [f'historical {horizon}d {x}' for x in index[:len(index) - horizon][keep]]
+    columns = pd.MultiIndex.from_product([['govt', 'swap'], tenors], names = ['leg', 'tenor'])
+    return pd.DataFrame(shocks[keep], index = pd.Index(names, name = 'scenario'), columns = columns)
+
+def default_scenarios(treasury_df, swap_df, curve = None):
+    """Parallel, steepener and butterfly shocks of every leg and size, and the
+    historical 1 and 21 business day changes
+
+    :rtype: pd.DataFrame
+    """
+    return pd.concat([
+        parallel_shocks(curve = curve),
+        steepener_shocks(curve = curve),
+        butterfly_shocks(curve = curve),
+        historical_shocks(treasury_df, swap_df, 1, curve),
+        historical_shocks(treasury_df, swap_df, 21, curve),
+    ])
+
+def _shock_weights(years, tenor_years):
+    """Linear interpolation, flat outside, of tenor shocks to maturities,
+    as an (instrument x tenor) matrix
+    """
+    eye = np.eye(len(tenor_years))
+    return np.stack([np.interp(years, tenor_years, eye[j]) for j in range(len(tenor_years))], axis = 1)
+
+def _leg_inputs(treasury_df, swap_df, kind, curve):
+    """Aligned par yields and maturities of both legs. Par spreads only need
+    the tenor pairs, zero and forward spreads every government yield
+    """
+    pairs = spread_pairs(curve)
+    curve = config('CURVE') if curve is None else curve
+    universe = load_universe()
+    govts = pairs if kind == 'par' else universe[universe['curve'] == curve]
+    index, t_rows, s_rows = _align(treasury_df, swap_df, curve)
+    legs = {}
+    for leg, df, rows, instruments in [('govt', treasury_df, t_rows, govts), ('swap', swap_df, s_rows, pairs)]:
+        if kind != 'par':
+            instruments = instruments[instruments[leg].isin(set(df.columns.get_level_values(0)))]
+        cols = _column_positions(df, instruments[leg])
+        legs[leg] = (take(df.iloc[:, cols].to_numpy(np.float64), rows[:, cols]),
+                     instruments['years'].to_numpy(np.float64))
+    return index, legs, pairs['years'].to_numpy(np.float64)
+
+def _shocked_spreads(legs, tenor_years, govt_shocks, swap_shocks, kind, method):
+    """Spreads in bps of shape (scenario x date x tenor)
+    """
+    rates = {}
+    for leg, shocks in [('govt', govt_shocks), ('swap', swap_shocks)]:
+        par, years = legs[leg]
+        shocked = par[None] + (shocks @ _shock_weights(years, tenor_years).T)[:, None, :] / 100
+        if kind == 'par':
+            rates[leg] = shocked
+        else:
+            rows = shocked.reshape(-1, par.shape[1])
+            rates[leg] = leg_rates(rows, list(years), list(tenor_years), FREQUENCIES[leg],
+                                   method)[KINDS.index(kind)].reshape(len(shocks), len(par), -1)
+    return 100 * (rates['swap'] - rates['govt'])
+
+def _chunk_stats(legs, tenor_years, govt_shocks, swap_shocks, kind, method, base):
+    """Statistics of a chunk of scenarios, each of shape (scenario x tenor)
+    """
+    spreads = _shocked_spreads(legs, tenor_years, govt_shocks, swap_shocks, kind, method)
+    change = spreads - base[None]
+    with warnings.catch_warnings():
+        # Tenors without any spread get NaN statistics. The last dates are
+        # copied so the chunk's spreads are not kept alive by views
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return [spreads[:, -1].copy(), change[:, -1].copy(), np.nanmean(change, axis = 1),
+                np.nanmin(change, axis = 1), np.nanmax(change, axis = 1)]
+
+def run_scenarios(treasury_df, swap_df, shocks, kind = 'par', curve = None, method = None,
+                  chunk_mb = None, max_workers = None):
+    """Applies every scenario to every date of the history
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+    :param shocks: Scenario set with (leg, tenor) columns in bps
+    :type shocks: pd.DataFrame
+    :param kind: 'par', 'zero' or 'forward' spreads
+    :type kind: str, default = 'par'
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+    :param method: Interpolation of the par yields for zero and forward
+    spreads, defaults to INTERP_METHOD
+    :type method: str
+    :param chunk_mb: Approximate memory of a chunk of scenarios in MB,
+    defaults to SCENARIO_CHUNK_MB
+    :type chunk_mb: float
+    :param max_workers: Number of processes the chunks are spread across,
+    defaults to SCENARIO_MAX_WORKERS, and to the number of cores if that is 0.
+    1 runs in this process.
+    :type max_workers: int
+
+    :return: STATS in bps with one row per scenario and tenor
+    :rtype: pd.DataFrame
+    """
+    if kind not in ['par'] + KINDS:
+        raise ValueError(f"kind must be one of {['par'] + KINDS}, not {kind}")
+    method = config('INTERP_METHOD') if method is None else method
+    chunk_mb = config('SCENARIO_CHUNK_MB') if chunk_mb is None else chunk_mb
+    max_workers = config('SCENARIO_MAX_WORKERS') if max_workers is None else max_workers
+    tenors, _ = _tenors(curve)
+    index, legs, tenor_years = _leg_inputs(treasury_df, swap_df, kind, curve)
+    govt_shocks = shocks['govt'][tenors].to_numpy(np.float64)
+    swap_shocks = shocks['swap'][tenors].to_numpy(np.float64)
+
+    zero = np.zeros((1, len(tenors)))
+    base = _shocked_spreads(legs, tenor_years, zero, zero, kind, method)[0]
+
+    # Bytes of the arrays of one scenario, a few temporaries of every leg
+    width = len(tenors) + sum(legs[leg][0].shape[1] for leg in legs)
+    if kind != 'par':
+        width += sum(len(coupon_grid(max(tenor_years.max(), legs[leg][1].max()), FREQUENCIES[leg]))
+                     for leg in legs)
+    per_scenario = 4 * 8 * len(index) * width
+    size = max(1, int(chunk_mb * 2 ** 20 // max(per_scenario, 1)))
+    starts = range(0, len(shocks), size)
+    args = [(legs, tenor_years, govt_shocks[i:i + size], swap_shocks[i:i + size], kind, method, base)
+            for i in starts]
+    max_workers = min(max_workers or os.cpu_count() or 1, max(len(args), 1))
+    if max_workers <= 1:
+        parts = [_chunk_stats(*x) for x in args]
+    else:
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            parts = list(executor.map(_chunk_stats, *zip(*args)))
+
+    stats = [np.concatenate([part[k] for part in parts]) if parts else np.empty((0, len(tenors)))
+             for k in range(len(STATS))]
+    rows = pd.MultiIndex.from_product([shocks.index, tenors], names = ['scenario', 'tenor'])
+    return pd.DataFrame({name: values.ravel() for name, values in zip(STATS, stats)}, index = rows)
+
+def scenarios_main(treasury_df, swap_df):
+    """Runs the default scenarios on the spreads of SCENARIO_KIND and saves the
+    statistics to OUTPUT_DIR/scenario_summary.csv
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+
+    :rtype: pd.DataFrame
+    """
+    summary = run_scenarios(treasury_df, swap_df, default_scenarios(treasury_df, swap_df),
+                            kind = config('SCENARIO_KIND'))
+    summary.to_csv(os.path.join(output_dir, 'scenario_summary.csv'))
+    return summary
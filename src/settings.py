@@ -23,8 +23,20 @@ from pathlib import Path
 ## Helper for determining OS
 from platform import system
 
-from decouple import config as _config
-from pandas import to_datetime
+from datetime import datetime
+
+from decouple import Csv, config as _config
+
+
+def to_datetime(value):
+    """Parses a date setting. ISO dates are parsed without importing pandas,
+    which keeps importing the settings cheap.
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        from pandas import to_datetime as _to_datetime
+        return _to_datetime(value).to_pydatetime()
 
 
 def get_os():
@@ -70,10 +82,72 @@ d["OS_TYPE"] = get_os()
 d["START_DATE"] = _config("START_DATE", default="1913-01-01", cast=to_datetime)
 d["END_DATE"] = _config("END_DATE", default="2024-01-01", cast=to_datetime)
 
+## Bloomberg pulls
+d["INCREMENTAL_PULL"] = _config("INCREMENTAL_PULL", default=False, cast=bool)
+d["PULL_LOOKBACK_DAYS"] = _config("PULL_LOOKBACK_DAYS", default=5, cast=int)
+d["BBG_MAX_WORKERS"] = _config("BBG_MAX_WORKERS", default=4, cast=int)
+d["BBG_RETRIES"] = _config("BBG_RETRIES", default=3, cast=int)
+d["BBG_CHUNK_DAYS"] = _config("BBG_CHUNK_DAYS", default=1826, cast=int)
+d["BBG_SOURCE"] = _config("BBG_SOURCE", default="bloomberg")
+d["BBG_SIM_LATENCY"] = _config("BBG_SIM_LATENCY", default=0.0, cast=float)
+d["BBG_SIM_FAILURE_RATE"] = _config("BBG_SIM_FAILURE_RATE", default=0.0, cast=float)
+
+## Calendars
+d["CALENDAR"] = _config("CALENDAR", default="sifma")
+d["ALIGN_TOLERANCE"] = _config("ALIGN_TOLERANCE", default="3D")
+
 ## Paths
 d["BASE_DIR"] = _config("BASE_DIR", cast = Path)
 d["DATA_DIR"] = if_relative_make_abs(_config('DATA_DIR', default=Path('_data'), cast=Path))
 d["OUTPUT_DIR"] = if_relative_make_abs(_config('OUTPUT_DIR', default=Path('_output'), cast=Path))
+d["UNIVERSE_FILE"] = if_relative_make_abs(_config('UNIVERSE_FILE', default=Path('data_manual/universe.csv'), cast=Path))
+
+## Stage cache
+d["CACHE_MAX_MB"] = _config("CACHE_MAX_MB", default=1024, cast=float)
+d["CACHE_MAX_ENTRIES"] = _config("CACHE_MAX_ENTRIES", default=32, cast=int)
+
+## Compact frames
+d["COMPACT_FRAMES"] = _config("COMPACT_FRAMES", default=False, cast=bool)
+
+## Date-range queries
+d["QUERY_CACHE_PARTITIONS"] = _config("QUERY_CACHE_PARTITIONS", default=1024, cast=int)
+
+## Spread service
+d["SERVICE_HOST"] = _config("SERVICE_HOST", default="127.0.0.1")
+d["SERVICE_PORT"] = _config("SERVICE_PORT", default=8050, cast=int)
+d["SERVICE_HOT_DAYS"] = _config("SERVICE_HOT_DAYS", default=1095, cast=int)
+d["SERVICE_POLL_SECONDS"] = _config("SERVICE_POLL_SECONDS", default=5.0, cast=float)
+
+## Spread statistics
+d["STATS_WINDOWS"] = _config("STATS_WINDOWS", default="21,63,252", cast=Csv(int))
+
+## Bootstrap of the table means
+d["BOOTSTRAP_REPS"] = _config("BOOTSTRAP_REPS", default=10000, cast=int)
+d["BOOTSTRAP_BLOCK"] = _config("BOOTSTRAP_BLOCK", default=0, cast=int)
+d["BOOTSTRAP_METHOD"] = _config("BOOTSTRAP_METHOD", default="stationary")
+d["BOOTSTRAP_SEED"] = _config("BOOTSTRAP_SEED", default=0, cast=int)
+d["BOOTSTRAP_MAX_WORKERS"] = _config("BOOTSTRAP_MAX_WORKERS", default=0, cast=int)
+
+## Backtest
+d["BACKTEST_MAX_WORKERS"] = _config("BACKTEST_MAX_WORKERS", default=1, cast=int)
+
+## Scenarios
+d["SCENARIO_KIND"] = _config("SCENARIO_KIND", default="par")
+d["SCENARIO_CHUNK_MB"] = _config("SCENARIO_CHUNK_MB", default=256, cast=float)
+d["SCENARIO_MAX_WORKERS"] = _config("SCENARIO_MAX_WORKERS", default=1, cast=int)
+
+## Profiling
+d["PROFILE_MEMORY"] = _config("PROFILE_MEMORY", default="rss")
+d["PROFILE_CPROFILE"] = _config("PROFILE_CPROFILE", default=False, cast=bool)
+d["PROFILE_RESET_RSS"] = _config("PROFILE_RESET_RSS", default=True, cast=bool)
+d["PROFILE_MAX_RECORDS"] = _config("PROFILE_MAX_RECORDS", default=10000, cast=int)
+
+## Plots
+d["PLOT_MAX_WORKERS"] = _config("PLOT_MAX_WORKERS", default=1, cast=int)
+
+## Instrument universe
+d["CURVE"] = _config("CURVE", default="US")
+d["INTERP_METHOD"] = _config("INTERP_METHOD", default="linear")
 # fmt: on
 
 def config(*args, **kwargs):
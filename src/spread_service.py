@@ -0,0 +1,292 @@
+"""
+Local HTTP service serving the spreads and yields to other teams.
+
+The service runs on asyncio without further dependencies. It keeps the most
+recent SERVICE_HOT_DAYS of the stored spreads and yields in memory, answers
+range and tenor queries from that window, and reads older ranges through the
+query API in a worker thread. It polls the stored files and, when the
+pipeline rewrites them, loads a new snapshot in the background and swaps it
+in with a single assignment, so every request sees either the old or the
+new data, never a mix.
+
+Endpoints, all answering JSON in the `split` layout of `pd.DataFrame.to_json`:
+
+ - `/spreads?tenors=2,10&start=2020-01-01&end=2020-12-31`
+ - `/yields?columns=GT10 Govt,USSO10 CMPN Curncy&start=2020-01-01`
+ - `/health`
+
+Usage:
+```
+python ./src/spread_service.py serve
+python ./src/spread_service.py loadtest --requests 20000 --concurrency 64
+```
+"""
+
+import json
+import time
+import asyncio
+import argparse
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs, quote
+
+import numpy as np
+import pandas as pd
+import query
+from settings import config
+from universe import spread_tenors
+
+## Encoded responses kept per snapshot
+RESPONSE_CACHE_SIZE = 256
+
+def stored_version():
+    """Version of the stored files, changing whenever the pipeline rewrites one
+    """
+    return tuple(query.file_version(file) for file in [query.spreads_file()] + query.yields_files())
+
+class Snapshot:
+    """Immutable in-memory window of the stored spreads and yields
+
+    :param hot_days: Number of most recent calendar days held in memory
+    :type hot_days: int
+    """
+
+    def __init__(self, hot_days):
+        self.version = stored_version()
+        spreads = query.get_spreads()
+        end = spreads.index.max() if len(spreads) else pd.Timestamp.now()
+        self.hot_start = (end - pd.Timedelta(days = hot_days)).normalize()
+        self.frames = {
+            'spreads': spreads.loc[self.hot_start:],
+            'yields': pd.concat([query.query_frame(file, start = self.hot_start).xs('PX_LAST', axis = 1, level = 1)
+                                 for file in query.yields_files()], axis = 1),
+        }
+        self.dates = {name: df.index.to_numpy() for name, df in self.frames.items()}
+        self.responses = OrderedDict()
+
+    def window(self, name, columns, start, end):
+        """A date window of the hot spreads or yields, None if it has no start
+        or starts before the hot window, so the full history is read instead
+        """
+        if start is None or pd.Timestamp(start) < self.hot_start:
+            return None
+        dates = self.dates[name]
+        i = np.searchsorted(dates, np.datetime64(pd.Timestamp(start), 'ns'), 'left')
+        j = len(dates) if end is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end), 'ns'), 'right')
+        return self.frames[name].iloc[i:j][columns]
+
+def encode(df):
+    """JSON body of a frame, with dates as ISO strings and NaN as null
+    """
+    values = df.to_numpy(dtype = object)
+    values[pd.isna(df).to_numpy()] = None
+    body = {
+        'columns': [str(x) for x in df.columns],
+        'index': list(np.datetime_as_string(df.index.to_numpy(), unit = 'D')),
+        'data': values.tolist(),
+    }
+    return json.dumps(body).encode()
+
+class SpreadService:
+    """Answers the HTTP requests from the current snapshot and refreshes it
+    when the stored data changes
+
+    :param hot_days: Number of most recent calendar days held in memory,
+    defaults to SERVICE_HOT_DAYS
+    :type hot_days: int
+    :param poll_seconds: Seconds between checks of the stored files, defaults
+    to SERVICE_POLL_SECONDS
+    :type poll_seconds: float
+    """
+
+    def __init__(self, hot_days = None, poll_seconds = None):
+        self.hot_days = config('SERVICE_HOT_DAYS') if hot_days is None else hot_days
+        self.poll_seconds = config('SERVICE_POLL_SECONDS') if poll_seconds is None else poll_seconds
+        self.snapshot = Snapshot(self.hot_days)
+        self.requests = 0
+
+    async def refresh(self, force = False):
+        """Loads a new snapshot in a worker thread if the stored data changed,
+        then swaps it in
+
+        :return: True if the snapshot was replaced
+        :rtype: bool
+        """
+        loop = asyncio.get_running_loop()
+        version = await loop.run_in_executor(None, stored_version)
+        if version == self.snapshot.version and not force:
+            return False
+        snapshot = await loop.run_in_executor(None, Snapshot, self.hot_days)
+        self.snapshot = snapshot
+        print(f'Loaded spreads up to {snapshot.frames["spreads"].index.max()}')
+        return True
+
+    async def watch(self):
+        """Refreshes the snapshot whenever the pipeline writes new data
+        """
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.refresh()
+            except (OSError, KeyError) as e:
+                # The files are being rewritten, retried at the next poll
+                print(f'Refresh failed ({e}).')
+
+    async def answer(self, target):
+        """Status and body of a request target such as `/spreads?tenors=10`
+
+        :rtype: tuple(int, bytes)
+        """
+        snapshot = self.snapshot
+        cached = snapshot.responses.get(target)
+        if cached is not None:
+            snapshot.responses.move_to_end(target)
+            return cached
+
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        start, end = params.get('start'), params.get('end')
+        try:
+            if url.path == '/health':
+                return 200, json.dumps({
+                    'version': str(snapshot.version), 'hot_start': str(snapshot.hot_start.date()),
+                    'rows': len(snapshot.frames['spreads']), 'requests': self.requests,
+                }).encode()
+            if url.path == '/spreads':
+                tenors = params['tenors'].split(',') if 'tenors' in params else spread_tenors()
+                columns = [f'Arb_Swap_{tenor}' for tenor in tenors]
+                df = snapshot.window('spreads', columns, start, end)
+                if df is None:
+                    df = await asyncio.get_running_loop().run_in_executor(
+                        None, query.get_spreads, tenors, start, end)
+            elif url.path == '/yields':
+                columns = params['columns'].split(',')
+                df = snapshot.window('yields', columns, start, end)
+                if df is None:
+                    df = await asyncio.get_running_loop().run_in_executor(
+                        None, query.get_yields, columns, start, end)
+            else:
+                return 404, json.dumps({'error': f'Unknown path {url.path}'}).encode()
+            response = 200, encode(df)
+        except (KeyError, ValueError) as e:
+            return 400, json.dumps({'error': str(e)}).encode()
+
+        snapshot.responses[target] = response
+        if len(snapshot.responses) > RESPONSE_CACHE_SIZE:
+            snapshot.responses.popitem(last = False)
+        return response
+
+    async def handle(self, reader, writer):
+        """Serves the requests of one keep-alive connection
+        """
+        try:
+            while True:
+                request = await reader.readuntil(b'\r\n\r\n')
+                method, target, _ = request.split(b'\r\n', 1)[0].decode('latin-1').split(' ', 2)
+                self.requests += 1
+                if method != 'GET':
+                    status, body = 405, b'{"error": "Only GET is supported"}'
+                else:
+                    status, body = await self.answer(target)
+                writer.write(f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                             f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'
+                             .encode() + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host = None, port = None):
+        """Serves requests until cancelled
+
+        :param host: Interface to listen on, defaults to SERVICE_HOST
+        :type host: str
+        :param port: Port to listen on, defaults to SERVICE_PORT
+        :type port: int
+        """
+        host = config('SERVICE_HOST') if host is None else host
+        port = config('SERVICE_PORT') if port is None else port
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f'Serving spreads on http://{host}:{server.sockets[0].getsockname()[1]}')
+        watcher = asyncio.create_task(self.watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+async def _client(host, port, targets, latencies, statuses):
+    """Sends requests over one keep-alive connection until targets is empty
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while targets:
+            target = quote(targets.pop(), safe = '/?=&,')
+            start = time.perf_counter()
+            writer.write(f'GET {target} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            statuses.append(int(head.split(b' ', 2)[1]))
+    finally:
+        writer.close()
+
+async def load_test(targets, requests = 10_000, concurrency = 32, host = None, port = None):
+    """Sends requests from concurrent keep-alive connections and measures
+    the throughput and latency percentiles
+
+    :param targets: Request targets cycled through, e.g. ['/spreads?tenors=10']
+    :type targets: list
+    :param requests: Total number of requests
+    :type requests: int, default = 10_000
+    :param concurrency: Number of connections
+    :type concurrency: int, default = 32
+    :param host: Host of the service, defaults to SERVICE_HOST
+    :type host: str
+    :param port: Port of the service, defaults to SERVICE_PORT
+    :type port: int
+
+    :return: Requests per second, latency percentiles in milliseconds and
+    the number of errors
+    :rtype: dict
+    """
+    host = config('SERVICE_HOST') if host is None else host
+    port = config('SERVICE_PORT') if port is None else port
+    queue = [targets[i % len(targets)] for i in range(requests)]
+    latencies, statuses = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(host, port, queue, latencies, statuses) for _ in range(concurrency)])
+    seconds = time.perf_counter() - start
+    ms = 1000 * np.array(latencies)
+    result = {
+        'requests': len(latencies), 'rps': len(latencies) / seconds,
+        'p50_ms': np.percentile(ms, 50), 'p95_ms': np.percentile(ms, 95),
+        'p99_ms': np.percentile(ms, 99), 'max_ms': ms.max(),
+        'errors': sum(status != 200 for status in statuses),
+    }
+    print(', '.join(f'{k} {v:.2f}' if isinstance(v, float) else f'{k} {v}' for k, v in result.items()))
+    return result
+
+DEFAULT_TARGETS = [
+    '/spreads?tenors=2,10&start=2023-01-01',
+    '/spreads?tenors=30',
+    '/spreads',
+    '/yields?columns=GT10 Govt&start=2023-06-01&end=2023-12-31',
+    '/health',
+]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Serve the spreads over HTTP.')
+    parser.add_argument('command', choices = ['serve', 'loadtest'])
+    parser.add_argument('--host', default = None)
+    parser.add_argument('--port', type = int, default = None)
+    parser.add_argument('--requests', type = int, default = 10_000)
+    parser.add_argument('--concurrency', type = int, default = 32)
+    args = parser.parse_args()
+    if args.command == 'serve':
+        asyncio.run(SpreadService().serve(args.host, args.port))
+    else:
+        asyncio.run(load_test(DEFAULT_TARGETS, args.requests, args.concurrency, args.host, args.port))
@@ -0,0 +1,279 @@
+"""
+Rolling and regime statistics of the arbitrage spreads.
+
+All windows and tenors are computed together: rolling means, standard
+deviations and z-scores come from one cumulative sum of the spreads, and
+rolling percentiles from sorted strided windows, so no statistic loops over
+windows or tenors in Python. Results are written as LaTeX and CSV tables to
+OUTPUT_DIR and the rolling statistics to the columnar store.
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from settings import config
+from store import save_frame
+from universe import spread_tenors
+
+data_dir = Path(config("DATA_DIR"))
+output_dir = Path(config("OUTPUT_DIR"))
+
+QUANTILES = (0.05, 0.5, 0.95)
+## Share of valid spreads a window needs in the reports
+MIN_VALID_SHARE = 0.8
+## Start dates of the regimes, each lasting until the next one starts
+REGIMES = {
+    'Pre-crisis': '2000-01-01',
+    'Financial crisis': '2007-08-01',
+    'Post-crisis': '2010-01-01',
+    'Pandemic': '2020-03-01',
+    'Tightening': '2022-03-01',
+}
+
+def spread_matrix(calc_df, curve = None):
+    """Spreads of every tenor as a (date x tenor) array
+
+    :param calc_df: DataFrame containing the arbitrage calculations
+    :type calc_df: pd.DataFrame
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+
+    :return: The spreads, their dates and their column names
+    :rtype: tuple(np.ndarray, pd.Index, list)
+    """
+    names = [f'Arb_Swap_{tenor}' for tenor in spread_tenors(curve)]
+    return calc_df[names].to_numpy(np.float64), calc_df.index, names
+
+def _window_sums(values, windows):
+    """Sums over the trailing windows ending at every row, for every window,
+    taken as differences of one cumulative sum
+
+    :return: Array of shape (window, date, tenor)
+    """
+    n, k = values.shape
+    csum = np.zeros((n + 1, k))
+    np.cumsum(values, axis = 0, out = csum[1:])
+    ends = np.arange(1, n + 1)
+    starts = np.maximum(ends[None, :] - np.asarray(windows)[:, None], 0)
+    return csum[ends][None] - csum[starts]
+
+def rolling_stats(calc_df, windows = None, min_periods = None, curve = None):
+    """Rolling mean, standard deviation and z-score of every tenor over
+    several trailing windows of observations, all in one vectorized pass.
+    Missing spreads are skipped and a window needs min_periods valid spreads.
+
+    :param calc_df: DataFrame containing the arbitrage calculations
+    :type calc_df: pd.DataFrame
+    :param windows: Window lengths in observations, defaults to STATS_WINDOWS
+    :type windows: list
+    :param min_periods: Valid spreads needed in a window, either one number
+    or one per window, defaults to the window length as in
+    `pd.DataFrame.rolling`
+    :type min_periods: int or list
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+
+    :return: Statistics with (spread, stat, window) columns
+    :rtype: pd.DataFrame
+    """
+    windows = list(config('STATS_WINDOWS') if windows is None else windows)
+    values, index, names = spread_matrix(calc_df, curve)
+    valid = ~np.isnan(values)
+    # Centering keeps the differences of the cumulative sums accurate
+    center = np.nanmean(values, axis = 0) if valid.any() else np.zeros(len(names))
+    center = np.nan_to_num(center)
+    x = np.where(valid, values - center, 0)
+
+    count = _window_sums(valid.astype(np.float64), windows)
+    s1 = _window_sums(x, windows)
+    s2 = _window_sums(x * x, windows)
+    needed = np.broadcast_to(windows if min_periods is None else min_periods, len(windows))
+    enough = count >= np.maximum(needed, 1)[:, None, None]
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean = np.where(enough, s1 / count, np.nan)
+        var = np.maximum(s2 - s1 * s1 / count, 0) / (count - 1)
+        std = np.where(enough & (count > 1), np.sqrt(var), np.nan)
+        zscore = (values - center - mean) / std
+    mean += center
+
+    # (stat, window, date, tenor) to (date, tenor, stat, window) columns
+    stats = np.stack([mean, std, zscore]).transpose(2, 3, 0, 1).reshape(len(index), -1)
+    columns = pd.MultiIndex.from_product([names, ['mean', 'std', 'zscore'], [str(w) for w in windows]])
+    return pd.DataFrame(stats, index = index, columns = columns)
+
+def _quantiles_sorted(sorted_values, counts, q):
+    """Linearly interpolated quantiles of arrays sorted along the last axis
+    with the NaNs last, given the number of valid values of each array
+    """
+    pos = np.asarray(q).reshape((-1,) + (1,) * counts.ndim) * (counts - 1)
+    lo = np.floor(pos).astype(int).clip(0)
+    hi = np.ceil(pos).astype(int).clip(0)
+    low = np.take_along_axis(sorted_values[None], lo[..., None], axis = -1)[..., 0]
+    high = np.take_along_axis(sorted_values[None], hi[..., None], axis = -1)[..., 0]
+    return low + (high - low) * (pos - lo)
+
+def rolling_quantiles(calc_df, window, q = QUANTILES, min_periods = None, curve = None,
+                      chunk_size = 2 ** 22):
+    """Rolling percentiles of every tenor over a trailing window. The windows
+    are strided views of the spreads which are sorted in chunks of rows.
+
+    :param calc_df: DataFrame containing the arbitrage calculations
+    :type calc_df: pd.DataFrame
+    :param window: Window length in observations
+    :type window: int
+    :param q: Quantiles to compute
+    :type q: tuple, default = QUANTILES
+    :param min_periods: Valid spreads needed in a window, defaults to window
+    :type min_periods: int
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+    :param chunk_size: Maximum number of values sorted at once
+    :type chunk_size: int
+
+    :return: Quantiles with (spread, quantile) columns
+    :rtype: pd.DataFrame
+    """
+    values, index, names = spread_matrix(calc_df, curve)
+    n, k = values.shape
+    min_periods = window if min_periods is None else min_periods
+    out = np.empty((len(q), n, k))
+    # Leading NaN rows give the first dates their partial windows
+    padded = np.vstack([np.full((window - 1, k), np.nan), values])
+    windows = sliding_window_view(padded, window, axis = 0)
+    counts = _window_sums((~np.isnan(values)).astype(np.float64), [window])[0]
+    rows = max(chunk_size // (k * window), 1)
+    for start in range(0, n, rows):
+        chunk = np.sort(windows[start:start + rows], axis = -1)
+        out[:, start:start + rows] = _quantiles_sorted(chunk, counts[start:start + rows], q)
+    out[:, counts < max(min_periods, 1)] = np.nan
+    columns = pd.MultiIndex.from_product([names, [f'q{round(100 * x)}' for x in q]])
+    return pd.DataFrame(out.transpose(1, 2, 0).reshape(n, -1), index = index, columns = columns)
+
+def drawdowns(calc_df, curve = None):
+    """Drawdown of every tenor from its running maximum, in bps
+
+    :param calc_df: DataFrame containing the arbitrage calculations
+    :type calc_df: pd.DataFrame
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+
+    :return: Drawdowns with one column per spread
+    :rtype: pd.DataFrame
+    """
+    values, index, names = spread_matrix(calc_df, curve)
+    peak = np.fmax.accumulate(values, axis = 0)
+    return pd.DataFrame(values - peak, index = index, columns = names)
+
+def regime_labels(index, regimes = None):
+    """Regime of every date
+
+    :param index: Dates
+    :type index: pd.Index
+    :param regimes: Mapping of the regime names to their start dates,
+    defaults to REGIMES
+    :type regimes: dict
+
+    :rtype: np.ndarray
+    """
+    regimes = REGIMES if regimes is None else regimes
+    starts = pd.to_datetime(pd.Series(regimes)).sort_values()
+    pos = np.searchsorted(starts.to_numpy(), pd.to_datetime(index).to_numpy(), side = 'right') - 1
+    return np.where(pos >= 0, starts.index.to_numpy()[pos.clip(0)], None)
+
+def period_stats(calc_df, by = 'year', regimes = None, curve = None):
+    """Mean, standard deviation, extremes and number of observations of every
+    tenor per calendar year or per regime
+
+    :param calc_df: DataFrame containing the arbitrage calculations
+    :type calc_df: pd.DataFrame
+    :param by: 'year' or 'regime'
+    :type by: str, default = 'year'
+    :param regimes: Mapping of the regime names to their start dates,
+    defaults to REGIMES
+    :type regimes: dict
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+
+    :return: One row per period with (spread, stat) columns
+    :rtype: pd.DataFrame
+    """
+    values, index, names = spread_matrix(calc_df, curve)
+    if by == 'year':
+        labels = pd.to_datetime(index).year
+    elif by == 'regime':
+        labels = regime_labels(index, regimes)
+    else:
+        raise ValueError(f"by must be 'year' or 'regime', not {by}")
+    df = pd.DataFrame(values, columns = names)
+    stats = df.groupby(pd.Index(labels, name = by), sort = by == 'year').agg(['mean', 'std', 'min', 'max', 'count'])
+    if by == 'regime':
+        order = [x for x in (REGIMES if regimes is None else regimes) if x in stats.index]
+        stats = stats.loc[order]
+    return stats
+
+def _report_min_periods(windows):
+    return [int(np.ceil(MIN_VALID_SHARE * w)) for w in windows]
+
+def summary_stats(calc_df, windows = None, q = QUANTILES, curve = None):
+    """Full sample statistics of every tenor with the latest rolling z-scores
+
+    :param calc_df: DataFrame containing the arbitrage calculations
+    :type calc_df: pd.DataFrame
+    :param windows: Window lengths of the z-scores, defaults to STATS_WINDOWS
+    :type windows: list
+    :param q: Quantiles to report
+    :type q: tuple, default = QUANTILES
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+
+    :return: One row per spread
+    :rtype: pd.DataFrame
+    """
+    windows = list(config('STATS_WINDOWS') if windows is None else windows)
+    values, index, names = spread_matrix(calc_df, curve)
+    summary = pd.DataFrame(index = names)
+    summary['Mean(bps)'] = np.nanmean(values, axis = 0)
+    summary['Std(bps)'] = np.nanstd(values, axis = 0, ddof = 1)
+    for x, column in zip(q, np.nanquantile(values, q, axis = 0)):
+        summary[f'Q{round(100 * x)}(bps)'] = column
+    summary['Max drawdown(bps)'] = drawdowns(calc_df, curve).min().to_numpy()
+    rolling = rolling_stats(calc_df, windows, _report_min_periods(windows), curve)
+    latest = rolling.ffill().iloc[-1]
+    for w in windows:
+        summary[f'Z {w}d'] = [latest[(name, 'zscore', str(w))] for name in names]
+    return summary
+
+def stats_main(calc_df, windows = None, regimes = None, curve = None):
+    """Computes the statistics of the spreads and saves the tables to
+    OUTPUT_DIR and the rolling statistics to DATA_DIR/stats
+
+    :param calc_df: DataFrame containing the arbitrage calculations
+    :type calc_df: pd.DataFrame
+    :param windows: Window lengths, defaults to STATS_WINDOWS
+    :type windows: list
+    :param regimes: Mapping of the regime names to their start dates,
+    defaults to REGIMES
+    :type regimes: dict
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+
+    :return: The summary, yearly, regime and rolling statistics
+    :rtype: dict
+    """
+    windows = list(config('STATS_WINDOWS') if windows is None else windows)
+    results = {
+        'summary': summary_stats(calc_df, windows, curve = curve),
+        'yearly': period_stats(calc_df, 'year', curve = curve),
+        'regime': period_stats(calc_df, 'regime', regimes, curve),
+        'rolling': rolling_stats(calc_df, windows, _report_min_periods(windows), curve),
+    }
+    for name in ['summary', 'yearly', 'regime']:
+        df = results[name]
+        df.to_csv(os.path.join(output_dir, f'spread_stats_{name}.csv'))
+        with open(os.path.join(output_dir, f'spread_stats_{name}.tex'), 'w') as table:
+            table.write(df.to_latex(float_format = '%.2f'))
+    save_frame(results['rolling'], os.path.join(data_dir, 'stats', 'rolling_stats.parquet'))
+    return results
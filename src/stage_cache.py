@@ -0,0 +1,148 @@
+"""
+Content-addressed cache of stage outputs.
+
+An output is stored under a key hashed from the name and version of the
+stage, the contents of its input frames and its parameters, so a stage is
+skipped exactly when it was already run on the same inputs. Entries live in
+DATA_DIR/cache and the least recently used ones are evicted once the cache
+exceeds CACHE_MAX_MB or CACHE_MAX_ENTRIES.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+from glob import glob
+from pathlib import Path
+
+import pandas as pd
+from settings import config
+from store import save_frame, load_frame, load_metadata, EXT
+
+data_dir = Path(config("DATA_DIR"))
+
+def hash_frame(df):
+    """Hashes the values, index, column labels and dtypes of a frame
+
+    :param df: Data frame to hash
+    :type df: pd.DataFrame
+
+    :return: Hex digest
+    :rtype: str
+    """
+    h = hashlib.sha256()
+    h.update(repr((list(df.columns), [str(x) for x in df.dtypes], df.shape)).encode())
+    h.update(pd.util.hash_pandas_object(df, index = True).to_numpy().tobytes())
+    return h.hexdigest()
+
+def cache_key(name, version, frames, params = None):
+    """Key of a stage output
+
+    :param name: Name of the stage
+    :type name: str
+    :param version: Version of the stage, to be increased whenever the stage
+    changes its output
+    :type version: int
+    :param frames: Input frames
+    :type frames: list
+    :param params: JSON serializable parameters of the stage
+    :type params: dict
+
+    :return: Hex digest
+    :rtype: str
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([name, version, params], sort_keys = True, default = str).encode())
+    for df in frames:
+        h.update(hash_frame(df).encode())
+    return h.hexdigest()
+
+def _cache_dir():
+    return os.path.join(data_dir, 'cache')
+
+def evict(max_mb = None, max_entries = None):
+    """Removes the least recently used entries until the cache fits the limits
+
+    :param max_mb: Maximum total size in MB, defaults to CACHE_MAX_MB
+    :type max_mb: float
+    :param max_entries: Maximum number of entries, defaults to CACHE_MAX_ENTRIES
+    :type max_entries: int
+
+    :return: Paths of the removed entries
+    :rtype: list
+    """
+    max_mb = config('CACHE_MAX_MB') if max_mb is None else max_mb
+    max_entries = config('CACHE_MAX_ENTRIES') if max_entries is None else max_entries
+    entries = sorted(glob(os.path.join(_cache_dir(), '*' + EXT)), key = os.path.getmtime)
+    sizes = [os.path.getsize(file) for file in entries]
+    total = sum(sizes)
+    removed = []
+    while entries and (total > max_mb * 2 ** 20 or len(entries) > max_entries):
+        file = entries.pop(0)
+        total -= sizes.pop(0)
+        os.remove(file)
+        removed.append(file)
+    return removed
+
+def _link(file, target):
+    """Points the target at a cache entry with a hard link, copying it only
+    where the file system does not support links
+    """
+    os.makedirs(os.path.dirname(target) or '.', exist_ok = True)
+    if os.path.exists(target) and os.path.samefile(file, target):
+        return
+    tmp_file = target + '.tmp'
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    try:
+        os.link(file, tmp_file)
+    except OSError:
+        shutil.copyfile(file, tmp_file)
+    os.replace(tmp_file, target)
+
+def cached(name, version, frames, compute, params = None, target = None, override = False,
+           **load_kwargs):
+    """Returns the cached output of a stage for these inputs, computing and
+    caching it on a miss
+
+    :param name: Name of the stage
+    :type name: str
+    :param version: Version of the stage
+    :type version: int
+    :param frames: Input frames of the stage
+    :type frames: list
+    :param compute: Function without arguments computing the output
+    :type compute: callable
+    :param params: JSON serializable parameters of the stage
+    :type params: dict
+    :param target: File linked to the cached output, relinked only when it
+    holds the output of other inputs
+    :type target: str
+    :param override: If set to True, the output is recomputed
+    :type override: bool, default = False
+    :param load_kwargs: Column and date selection passed to load_frame on a hit
+
+    :return: Output of the stage
+    :rtype: pd.DataFrame
+
+    Entries are stored without COMPACT_FRAMES, so a hit returns the same
+    values as a miss.
+    """
+    key = cache_key(name, version, frames, params)
+    file = os.path.join(_cache_dir(), f'{name}-{key[:32]}{EXT}')
+    if os.path.exists(file) and not override:
+        print(f'Using cached {name} output.')
+        os.utime(file)
+        df = load_frame(file, **load_kwargs)
+        if target is not None and (not os.path.exists(target) or load_metadata(target).get('cache_key') != key):
+            _link(file, target)
+        return df
+
+    df = compute()
+    save_frame(df, file, metadata = {'cache_key': key}, compact = False)
+    if target is not None:
+        _link(file, target)
+    if load_kwargs:
+        df = load_frame(file, **load_kwargs)
+    evict()
+    return df
@@ -0,0 +1,216 @@
+"""
+Columnar on-disk storage for the data frames passed between the stages.
+
+Frames are stored as compressed Parquet files with one row group per calendar
+year, so that a load can read only the requested columns and skip the years
+outside of the requested date window.
+
+Running this file on its own migrates the pickles written by older versions
+of the pipeline.
+"""
+
+import os
+import json
+from glob import glob
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from settings import config
+
+data_dir = Path(config("DATA_DIR"))
+
+EXT = '.parquet'
+INDEX_COL = 'date'
+SEP = '|'
+COMPRESSION = 'zstd'
+ROW_GROUP_SIZE = 1_000_000
+METADATA_KEY = b'treasury_swap'
+
+def _flatten_columns(columns):
+    """Joins the levels of the column labels into flat string names
+    """
+    if isinstance(columns, pd.MultiIndex):
+        return [SEP.join(str(x) for x in col) for col in columns]
+    return [str(col) for col in columns]
+
+def _restore_columns(names, levels):
+    """Splits flat column names back into the original column levels
+    """
+    if levels > 1:
+        return pd.MultiIndex.from_tuples([tuple(name.split(SEP, levels - 1)) for name in names])
+    return pd.Index(names)
+
+def _to_timestamp(date):
+    """Converts a date like value to a timestamp usable in filters
+    """
+    return None if date is None else pd.Timestamp(date)
+
+def _stringify_mixed(flat):
+    """Converts the object columns mixing types, e.g. floats and '#N/A' in
+    raw pulls, to strings with their nulls kept, as Arrow needs one type per
+    column
+
+    :return: The names of the converted columns
+    :rtype: list
+    """
+    mixed = []
+    for name in flat.columns[flat.dtypes == object]:
+        try:
+            pa.array(flat[name], from_pandas = True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            flat[name] = flat[name].astype(str).where(flat[name].notna(), None)
+            mixed.append(name)
+    return mixed
+
+def _restore_mixed(column):
+    """Parses the numbers of a column stored by _stringify_mixed back to
+    floats, keeping the other strings
+    """
+    numbers = pd.to_numeric(column, errors = 'coerce')
+    return column.where(numbers.isna(), numbers.astype(object))
+
+def save_frame(df, file, row_group_size = ROW_GROUP_SIZE, metadata = None, compact = None):
+    """Saves a data frame indexed by date to the columnar store
+
+    :param df: Data frame indexed by date
+    :type df: pd.DataFrame
+    :param file: Path of the Parquet file
+    :type file: str
+    :param row_group_size: Maximum number of rows per row group, each calendar
+    year always starts a new row group
+    :type row_group_size: int
+    :param metadata: Extra JSON serializable values stored with the frame
+    :type metadata: dict
+    :param compact: If set to True, float64 columns are stored as float32
+    with missing values as nulls, and loaded back as float64, see compact.py
+    for the precision. Defaults to COMPACT_FRAMES
+    :type compact: bool
+
+    Object columns mixing types are stored as strings and their numbers are
+    parsed back to floats on loading.
+    """
+    compact = config('COMPACT_FRAMES') if compact is None else compact
+    index = pd.DatetimeIndex(df.index)
+    flat = df.copy(deep = False)
+    flat.columns = _flatten_columns(df.columns)
+    flat.index = index.rename(INDEX_COL)
+    flat = flat.sort_index()
+    mixed = _stringify_mixed(flat)
+    compacted = [name for name, dtype in flat.dtypes.items() if compact and dtype == np.float64]
+    metadata = {
+        **(metadata or {}),
+        'column_levels': df.columns.nlevels,
+        'index_type': pd.Index(df.index).inferred_type,
+        'float32_columns': compacted,
+        'mixed_columns': mixed,
+    }
+    table = pa.Table.from_pandas(flat.reset_index(), preserve_index = False)
+    for name in compacted:
+        # Nulls are stored in the validity bitmap of the column instead of as values
+        pos = table.schema.get_field_index(name)
+        column = pa.array(flat[name].to_numpy(np.float32), from_pandas = True)
+        table = table.set_column(pos, pa.field(name, pa.float32()), column)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           METADATA_KEY: json.dumps(metadata).encode()})
+
+    file_dir = os.path.dirname(file)
+    if file_dir and not os.path.exists(file_dir):
+        os.makedirs(file_dir)
+    tmp_file = file + '.tmp'
+    years = flat.index.year.to_numpy()
+    bounds = [0] + list(np.flatnonzero(np.diff(years)) + 1) + [len(years)]
+    with pq.ParquetWriter(tmp_file, table.schema, compression = COMPRESSION) as writer:
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            writer.write_table(table.slice(lo, hi - lo), row_group_size = row_group_size)
+    os.replace(tmp_file, file)
+
+def load_frame(file, columns = None, start = None, end = None):
+    """Loads a data frame from the columnar store, reading only the requested
+    columns and the row groups overlapping the requested date window
+
+    :param file: Path of the Parquet file
+    :type file: str
+    :param columns: First level column names to load, defaults to None which
+    loads every column
+    :type columns: list
+    :param start: First date to load, inclusive
+    :type start: date like
+    :param end: Last date to load, inclusive
+    :type end: date like
+
+    :return: The stored data frame
+    :rtype: pd.DataFrame
+    """
+    schema = pq.read_schema(file)
+    metadata = json.loads(schema.metadata[METADATA_KEY])
+    levels = metadata['column_levels']
+
+    names = [name for name in schema.names if name != INDEX_COL]
+    if columns is not None:
+        wanted = set(columns)
+        names = [name for name in names if name.split(SEP)[0] in wanted]
+
+    filters = []
+    if start is not None:
+        filters.append((INDEX_COL, '>=', _to_timestamp(start)))
+    if end is not None:
+        filters.append((INDEX_COL, '<=', _to_timestamp(end)))
+
+    table = pq.read_table(file, columns = [INDEX_COL] + names, filters = filters or None)
+    df = table.to_pandas().set_index(INDEX_COL)
+    compacted = set(metadata.get('float32_columns', [])).intersection(names)
+    if compacted:
+        df = df.astype({name: np.float64 for name in compacted})
+    for name in set(metadata.get('mixed_columns', [])).intersection(names):
+        df[name] = _restore_mixed(df[name])
+    df.columns = _restore_columns(names, levels)
+    if metadata['index_type'] == 'date':
+        df.index = pd.Index(df.index.date)
+    df.index.name = None
+    return df
+
+def load_metadata(file):
+    """Loads the metadata stored with a frame without reading its data
+
+    :param file: Path of the Parquet file
+    :type file: str
+
+    :rtype: dict
+    """
+    return json.loads(pq.read_schema(file).metadata[METADATA_KEY])
+
+def migrate_pickles(dirs = ('bbg', 'calc_spread'), remove = False):
+    """Converts the pickles written by older versions of the pipeline into
+    the columnar store. Per-ticker watermarks are converted to JSON.
+
+    :param dirs: Directories under DATA_DIR to migrate
+    :type dirs: tuple
+    :param remove: If set to True, the pickles are deleted after conversion
+    :type remove: bool, default = False
+
+    :return: Paths of the files written
+    :rtype: list
+    """
+    written = []
+    for sub_dir in dirs:
+        for pickle_file in sorted(glob(os.path.join(data_dir, sub_dir, '*.pkl'))):
+            obj = pd.read_pickle(pickle_file)
+            if pickle_file.endswith('_watermark.pkl'):
+                file = pickle_file[:-len('.pkl')] + '.json'
+                with open(file, 'w') as f:
+                    json.dump({k: str(v) for k, v in obj.items() if not pd.isna(v)}, f, indent = 1)
+            else:
+                file = pickle_file[:-len('.pkl')] + EXT
+                save_frame(obj, file)
+            print(f'Migrated {pickle_file} to {file}')
+            written.append(file)
+            if remove:
+                os.remove(pickle_file)
+    return written
+
+
+if __name__ == '__main__':
+    migrate_pickles()
@@ -0,0 +1,273 @@
+"""
+Streaming computation of the arbitrage spreads.
+
+A `SpreadStream` is seeded once with the historical treasury and swap yields
+and then updated with new yield observations, either from a Bloomberg
+subscription or a local replay file. Each observation updates the spread of
+its tenor and the running statistics in constant time, without touching the
+historical rows.
+"""
+
+import csv
+import math
+
+import numpy as np
+import pandas as pd
+from calc_swap_spreads import calc_swap_spreads
+from calendars import is_business_day
+from settings import config
+from universe import curve_calendar, spread_pairs, govt_rename
+
+class SpreadStream:
+    """Incrementally maintained spreads and statistics for one curve.
+
+    Observations are grouped into periods (days by default). The last spread
+    of a period is committed to the statistics when the first observation of
+    the next period arrives, while the spread of the current period is
+    included provisionally, so the statistics always match what `sup_table`
+    and a rolling window over the daily spreads would report. As in the
+    alignment of calc_swap_spreads, missing yields keep the last value until
+    it is older than ALIGN_TOLERANCE, and periods which are not business days
+    of the curve's calendar are left out of the statistics unless both legs
+    were quoted in them. Observations older than the last one are ignored.
+
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+    :param window: Number of valid spreads in the rolling statistics
+    :type window: int, default = 252
+    :param freq: Length of a period, None commits every observation
+    :type freq: str, default = 'D'
+    """
+
+    def __init__(self, curve = None, window = 252, freq = 'D'):
+        pairs = spread_pairs(curve)
+        self.curve = curve
+        self.tenors = list(pairs['tenor'])
+        self.window = window
+        self.freq = freq
+        k = len(self.tenors)
+
+        # Bloomberg tickers and column names both map to (leg, tenor position)
+        source = {govt: ticker for ticker, govt in govt_rename(curve).items()}
+        self.tickers = []
+        self._legs = {}
+        for i, (govt, swap) in enumerate(zip(pairs['govt'], pairs['swap'])):
+            self._legs[govt] = self._legs[source.get(govt, govt)] = (0, i)
+            self._legs[swap] = (1, i)
+            self.tickers += [source.get(govt, govt), swap]
+
+        self.yields = np.full((2, k), np.nan)
+        ## Time of the last valid value of every yield
+        self.seen = np.full((2, k), np.datetime64('NaT'), dtype = 'datetime64[ns]')
+        self.tolerance = pd.Timedelta(config('ALIGN_TOLERANCE')).to_timedelta64()
+        self.calendar = curve_calendar(curve) or config('CALENDAR')
+        self.period = None
+        self.last_time = None
+
+        # Full sample statistics of committed spreads (Welford)
+        self._n = np.zeros(k)
+        self._mean = np.zeros(k)
+        self._m2 = np.zeros(k)
+        # Rolling window ring buffer of committed spreads with running sums
+        self._ring = np.full((window, k), np.nan)
+        self._pos = np.zeros(k, dtype = int)
+        self._count = np.zeros(k, dtype = int)
+        self._sum = np.zeros(k)
+        self._sumsq = np.zeros(k)
+
+    @property
+    def spreads(self):
+        """Current spread of every tenor in bps, NaN where a yield is stale
+        """
+        yields = self.yields
+        if self.period is not None:
+            yields = np.where(self.period.to_datetime64() - self.seen > self.tolerance, np.nan, yields)
+        return 100 * (yields[1] - yields[0])
+
+    def seed(self, treasury_df, swap_df):
+        """Initializes the yields and statistics from history. The history is
+        processed once, in a vectorized pass.
+
+        :param treasury_df: DataFrame containing the treasury yield data
+        :type treasury_df: pd.DataFrame
+        :param swap_df: DataFrame containing the swap yield data
+        :type swap_df: pd.DataFrame
+
+        :return: The seeded stream
+        :rtype: SpreadStream
+        """
+        for df in [treasury_df, swap_df]:
+            for col in df.columns:
+                name = col[0] if isinstance(col, tuple) else col
+                if name in self._legs:
+                    leg, i = self._legs[name]
+                    last = df[col].last_valid_index()
+                    if last is not None:
+                        self.yields[leg, i] = df[col].loc[last]
+                        self.seen[leg, i] = pd.Timestamp(last).to_datetime64()
+        calc_df = calc_swap_spreads(treasury_df, swap_df, self.curve)
+        arb = calc_df[[f'Arb_Swap_{tenor}' for tenor in self.tenors]].to_numpy(float)
+        if len(arb):
+            # The last date stays the provisional current period
+            self.period = self._period(calc_df.index[-1])
+            self.last_time = pd.Timestamp(calc_df.index[-1])
+            arb = arb[:-1]
+        valid = ~np.isnan(arb)
+        self._n = valid.sum(axis = 0).astype(float)
+        self._mean = np.where(self._n > 0, np.nansum(arb, axis = 0) / np.maximum(self._n, 1), 0)
+        self._m2 = np.nansum((arb - self._mean) ** 2, axis = 0)
+        for i in range(len(self.tenors)):
+            recent = arb[valid[:, i], i][-self.window:]
+            self._ring[:len(recent), i] = recent
+            self._count[i] = len(recent)
+            self._pos[i] = len(recent) % self.window
+            self._sum[i] = recent.sum()
+            self._sumsq[i] = (recent ** 2).sum()
+        return self
+
+    def _period(self, timestamp):
+        timestamp = pd.Timestamp(timestamp)
+        return timestamp if self.freq is None else timestamp.floor(self.freq)
+
+    def _open(self):
+        """Whether the current period is a business day, or a period in which
+        both legs were quoted
+        """
+        if self.period is None:
+            return False
+        quoted = (self.seen >= self.period.to_datetime64()).any(axis = 1).all()
+        return bool(quoted) or is_business_day(self.period, self.calendar)
+
+    def _commit(self):
+        """Adds the spreads of the current period to the statistics
+        """
+        if not self._open():
+            return
+        x = self.spreads
+        valid = ~np.isnan(x)
+        if not valid.any():
+            return
+        idx = np.flatnonzero(valid)
+        x = x[idx]
+        self._n[idx] += 1
+        delta = x - self._mean[idx]
+        self._mean[idx] += delta / self._n[idx]
+        self._m2[idx] += delta * (x - self._mean[idx])
+
+        full = self._count[idx] == self.window
+        old = self._ring[self._pos[idx], idx]
+        old = np.where(full, old, 0)
+        self._sum[idx] += x - old
+        self._sumsq[idx] += x ** 2 - old ** 2
+        self._ring[self._pos[idx], idx] = x
+        self._pos[idx] = (self._pos[idx] + 1) % self.window
+        self._count[idx] = np.minimum(self._count[idx] + 1, self.window)
+
+    def _tenor_stats(self, i):
+        """Statistics of a tenor including its provisional current spread
+        """
+        x = self.spreads[i] if self._open() else math.nan
+        n, mean, m2 = self._n[i], self._mean[i], self._m2[i]
+        count, total, sumsq = self._count[i], self._sum[i], self._sumsq[i]
+        if not math.isnan(x):
+            delta = x - mean
+            n, mean = n + 1, mean + delta / (n + 1)
+            m2 += delta * (x - mean)
+            if count == self.window:
+                old = self._ring[self._pos[i], i]
+                total, sumsq = total - old, sumsq - old ** 2
+            else:
+                count += 1
+            total, sumsq = total + x, sumsq + x ** 2
+        rolling_mean = total / count if count else math.nan
+        if count > 1:
+            var = max(sumsq - total ** 2 / count, 0) / (count - 1)
+            rolling_std = math.sqrt(var)
+        else:
+            rolling_std = math.nan
+        return {
+            'mean': mean if n else math.nan,
+            'std': math.sqrt(m2 / (n - 1)) if n > 1 else math.nan,
+            'rolling_mean': rolling_mean,
+            'rolling_std': rolling_std,
+        }
+
+    def update(self, timestamp, ticker, value):
+        """Applies a new yield observation
+
+        :param timestamp: Time of the observation
+        :type timestamp: date like
+        :param ticker: Bloomberg ticker or column name of the yield
+        :type ticker: str
+        :param value: The yield
+        :type value: float
+
+        :return: The updated spread and statistics of the tenor, None if the
+        ticker is not part of the curve or the observation is older than the
+        last one
+        :rtype: dict
+        """
+        leg_tenor = self._legs.get(ticker)
+        timestamp = pd.Timestamp(timestamp)
+        if leg_tenor is None or (self.last_time is not None and timestamp < self.last_time):
+            return None
+        period = self._period(timestamp)
+        if self.period is not None and period > self.period:
+            self._commit()
+        if self.period is None or period > self.period:
+            self.period = period
+        self.last_time = timestamp
+        leg, i = leg_tenor
+        if not math.isnan(value):
+            self.yields[leg, i] = value
+            self.seen[leg, i] = self.last_time.to_datetime64()
+        return {
+            'time': self.last_time,
+            'tenor': self.tenors[i],
+            f'Arb_Swap_{self.tenors[i]}': self.spreads[i],
+            **self._tenor_stats(i),
+        }
+
+    def snapshot(self):
+        """Current spreads and statistics of every tenor
+
+        :return: One row per tenor
+        :rtype: pd.DataFrame
+        """
+        rows = [{'Arb_Swap': self.spreads[i], **self._tenor_stats(i)} for i in range(len(self.tenors))]
+        return pd.DataFrame(rows, index = [f'Arb_Swap_{x}' for x in self.tenors])
+
+def replay(stream, file):
+    """Feeds the observations of a CSV file with timestamp, ticker and value
+    columns to a stream, row by row. Empty values are missing yields.
+
+    :param stream: The stream to update
+    :type stream: SpreadStream
+    :param file: Path of the replay file
+    :type file: str
+
+    :return: Generator of the updates
+    :rtype: generator
+    """
+    with open(file, newline = '') as f:
+        for row in csv.DictReader(f):
+            update = stream.update(row['timestamp'], row['ticker'], float(row['value'] or 'nan'))
+            if update is not None:
+                yield update
+
+async def live(stream, fld = 'LAST_PRICE', **kwargs):
+    """Feeds a Bloomberg subscription to a stream
+
+    :param stream: The stream to update
+    :type stream: SpreadStream
+    :param fld: Subscribed field
+    :type fld: str, default = 'LAST_PRICE'
+
+    :return: Asynchronous generator of the updates
+    :rtype: async generator
+    """
+    from xbbg import blp
+    async for msg in blp.live(stream.tickers, flds = [fld], **kwargs):
+        update = stream.update(pd.Timestamp.now(), msg['TICKER'], float(msg[fld]))
+        if update is not None:
+            yield update
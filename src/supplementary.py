@@ -1,55 +1,113 @@
 """Functions to generate supplementary table and plots
 """
+import os
+import numpy as np
 import pandas as pd
-from pull_bloomberg import *
-from calc_swap_spreads import *
+from bootstrap import bootstrap_intervals
+from calendars import align_frames
+from universe import curve_calendar, spread_pairs, spread_tenors
 from settings import config
+from instrument import instrumented
 
 OUTPUT_DIR = config('OUTPUT_DIR')
 
-def replication_df(treasury_df, swap_df):
-    """Creates a merged DataFrame of the treasury and swap yields
+@instrumented
+def replication_df(treasury_df, swap_df, curve = None):
+    """Creates a merged DataFrame of the treasury and swap yields from 2010,
+    aligned on the business days of the curve's calendar with as-of joins
     :param treasury_df: DataFrame containing the treasury yield data
     :type treasury_df: pd.DataFrame
     :param swap_df: DataFrame containing the swap yield data
     :type swap_df: pd.DataFrame
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
     :return: The merged data frame
     :rtype: pd.DataFrame
     """
-    years = [1, 2, 3, 5, 10, 20, 30]
-    t_list = [f'GT{year} Govt' for year in years]
-    s_list = [f'USSO{year} CMPN Curncy' for year in years]
-    return pd.merge(treasury_df[t_list].loc[pd.Timestamp('2010').date():], swap_df[s_list].loc[pd.Timestamp('2010').date():], left_index = True, right_index = True, how = 'inner')
+    pairs = spread_pairs(curve)
+    t_list = list(pairs['govt'])
+    s_list = list(pairs['swap'])
+    t_df, s_df = align_frames([treasury_df[t_list], swap_df[s_list]], curve_calendar(curve),
+                              start = '2010-01-01')
+    return pd.concat([t_df, s_df], axis = 1)
 
-def sup_table(calc_df, file_name='table.txt'):
+@instrumented
+def sup_table(calc_df, file_name='table.txt', curve = None):
     """Creates the table of means for spreads. Also saves the LaTeX table to a text file.
 
     :param calc_df: DataFrame containing the swap yield data
     :type calc_df: pd.DataFrame
     :param file_name: name of the text file to save LaTeX table to
     :type file_name: string
-    :return: The data frame containing means
-    :rtype: pd.DataFrame
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+    :return: The means of the spreads
+    :rtype: pd.Series
     """
-    years = [1,2,3,5,10,20,30]
-    df = calc_df[[f'Arb_Swap_{year}' for year in years]]
-    for year in years:
-        df = df.rename(columns = {f'Arb_Swap_{year}': f'Arb Swap {year}'})
+    df = _table_spreads(calc_df, curve)
     means = df.mean()
-    means.rename()
     means_str = pd.DataFrame(means, columns=['Mean(bps)']).to_latex()
     file = os.path.join(OUTPUT_DIR, file_name)
     with open(file, 'w') as table:
         table.write(means_str)
     return means
 
+def _table_spreads(calc_df, curve = None):
+    """Spreads of the table, with one column per tenor of the curve
+    """
+    tenors = spread_tenors(curve)
+    df = calc_df[[f'Arb_Swap_{tenor}' for tenor in tenors]]
+    return df.rename(columns = {f'Arb_Swap_{tenor}': f'Arb Swap {tenor}' for tenor in tenors})
+
+@instrumented
+def sup_intervals(calc_df, file_name='table_intervals.txt', curve = None, reps = None, block = None,
+                  method = None, alpha = 0.05, seed = None, max_workers = None):
+    """Creates the table of means for spreads with their block bootstrap standard
+    errors and confidence intervals, next to the table of sup_table. Also saves
+    the LaTeX table to a text file.
+
+    :param calc_df: DataFrame containing the swap yield data
+    :type calc_df: pd.DataFrame
+    :param file_name: name of the text file to save LaTeX table to
+    :type file_name: string
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+    :param reps: Number of bootstrap replicates, defaults to BOOTSTRAP_REPS.
+    0 leaves out the standard errors and intervals.
+    :type reps: int
+    :param block: Block length, defaults to BOOTSTRAP_BLOCK, see bootstrap.py
+    :type block: int
+    :param method: 'stationary' or 'moving', defaults to BOOTSTRAP_METHOD
+    :type method: str
+    :param alpha: One minus the confidence level of the intervals
+    :type alpha: float, default = 0.05
+    :param seed: Seed of the replicates, defaults to BOOTSTRAP_SEED
+    :type seed: int
+    :param max_workers: Number of processes, defaults to BOOTSTRAP_MAX_WORKERS
+    :type max_workers: int
+    :return: The data frame containing the means, standard errors and intervals
+    :rtype: pd.DataFrame
+    """
+    df = _table_spreads(calc_df, curve)
+    table = pd.DataFrame(df.mean(), columns=['Mean(bps)'])
+    reps = config('BOOTSTRAP_REPS') if reps is None else reps
+    if reps and len(df):
+        se, lower, upper, _ = bootstrap_intervals(df.to_numpy(np.float64), reps, block, method, alpha,
+                                                  seed, max_workers)
+        table['SE(bps)'] = se
+        table['CI low(bps)'] = lower
+        table['CI high(bps)'] = upper
+    means_str = table.to_latex(float_format = '%.2f')
+    file = os.path.join(OUTPUT_DIR, file_name)
+    with open(file, 'w') as f:
+        f.write(means_str)
+    return table
+
 def supplementary_main():
     """Main function which runs the functions for supplementary data/table.
     """
-    swap_df = clean_raw_syields(pull_raw_syields())
-    treasury_df = clean_raw_tyields(pull_raw_tyields())
-    sup_table(calc_swap_spreads(treasury_df, swap_df))
-    return replication_df(treasury_df, swap_df)
+    from pipeline import Pipeline
+    return Pipeline().run(['table', 'intervals', 'replication'])['replication']
 
 
 if __name__ == '__main__':
@@ -0,0 +1,88 @@
+"""
+Deterministic synthetic yield curves shaped like the Bloomberg pulls, used to
+benchmark and test the pipeline without a terminal.
+"""
+
+import zlib
+
+import numpy as np
+import pandas as pd
+
+SESSION_START = '09:30'
+SESSION_END = '16:00'
+
+def _business_days(start, end):
+    """Weekdays between two dates, as `pd.bdate_range` without its slow
+    day by day generation
+    """
+    days = pd.date_range(start, end)
+    return days[days.dayofweek < 5]
+
+def synthetic_index(start = '2000-01-01', end = '2024-12-31', freq = 'B'):
+    """Dates of a synthetic history. Daily frequencies give business dates
+    like `blp.bdh`, intraday frequencies give timestamps within the New York
+    trading session of every business day.
+
+    :param start: First date
+    :type start: date like
+    :param end: Last date
+    :type end: date like
+    :param freq: Pandas frequency, e.g. 'B', 'h' or 'min'
+    :type freq: str, default = 'B'
+
+    :rtype: pd.Index
+    """
+    days = _business_days(start, end)
+    if freq in ('B', 'D'):
+        return pd.Index(days.date)
+    session = pd.date_range(f'2000-01-01 {SESSION_START}', f'2000-01-01 {SESSION_END}',
+                            freq = freq, inclusive = 'left')
+    offsets = (session - session[0].normalize()).to_numpy()
+    stamps = days.to_numpy()[:, None] + offsets[None, :]
+    return pd.DatetimeIndex(stamps.ravel())
+
+def synthetic_yields(tickers, start = '2000-01-01', end = '2024-12-31', freq = 'B',
+                     nan_density = 0.0, seed = 0, dtype = 'float', flds = None):
+    """Generates a yield history with (ticker, field) columns. Every ticker is
+    a random walk around a level that increases with its position in the
+    list, so the output looks like an upward sloping curve.
+
+    :param tickers: Column names
+    :type tickers: list
+    :param start: First date
+    :type start: date like
+    :param end: Last date
+    :type end: date like
+    :param freq: Pandas frequency, see synthetic_index
+    :type freq: str, default = 'B'
+    :param nan_density: Share of cells set to NaN
+    :type nan_density: float, default = 0.0
+    :param seed: Seed of the random walks
+    :type seed: int, default = 0
+    :param dtype: 'float' for numeric columns, or 'object' for strings with
+    the NaN cells written as '#N/A N/A' as in a raw export
+    :type dtype: str, default = 'float'
+    :param flds: Field names of the second column level
+    :type flds: list, defaults to ['PX_LAST']
+
+    :rtype: pd.DataFrame
+    """
+    flds = ['PX_LAST'] if flds is None else flds
+    index = synthetic_index(start, end, freq)
+    n, k = len(index), len(tickers) * len(flds)
+    data = np.empty((n, k))
+    scale = 0.05 / np.sqrt(max(n / len(_business_days(start, end)), 1))
+    for j, ticker in enumerate(tickers):
+        rng = np.random.default_rng([seed, zlib.crc32(ticker.encode())])
+        walk = 1 + 3 * j / max(len(tickers) - 1, 1) + np.cumsum(rng.normal(0, scale, n))
+        for f in range(len(flds)):
+            data[:, j * len(flds) + f] = walk
+    if nan_density:
+        rng = np.random.default_rng([seed, n, k])
+        data[rng.random((n, k)) < nan_density] = np.nan
+
+    columns = pd.MultiIndex.from_product([tickers, flds])
+    df = pd.DataFrame(data, index = index, columns = columns)
+    if dtype == 'object':
+        df = df.round(4).astype(str).replace('nan', '#N/A N/A').astype(object)
+    return df
@@ -0,0 +1,68 @@
+"""
+Tests the vectorized backtest in backtest.py
+"""
+import numpy as np
+import pandas as pd
+import backtest
+from synthetic import synthetic_yields
+
+def _spreads():
+    names = [f'Arb_Swap_{x}' for x in [2, 10, 30]]
+    df = 100 * synthetic_yields(names, '2010-01-01', '2014-12-31', nan_density = 0.03)
+    df.columns = names
+    return df
+
+def _loop_pnl(spread, lookback, entry, holding, cost, rule):
+    """Daily net PnL of one combination, computed date by date
+    """
+    s = pd.Series(spread)
+    deviation = s - s.rolling(lookback, min_periods = lookback).mean()
+    if rule == 'zscore':
+        deviation = deviation / s.rolling(lookback, min_periods = lookback).std()
+    signal = np.where(deviation < -entry, 1, 0) - np.where(deviation > entry, 1, 0)
+    filled = s.ffill().to_numpy()
+    pnl, held = np.zeros(len(s)), 0.0
+    for t in range(len(s)):
+        position = signal[max(t - holding + 1, 0):t + 1].sum() / holding
+        if t > 0 and not np.isnan(filled[t] - filled[t - 1]):
+            pnl[t] += held * (filled[t] - filled[t - 1])
+        pnl[t] -= cost * abs(position - held)
+        held = position
+    return pnl
+
+def test_matches_loop():
+    """Checking the PnL and metrics of the vectorized grid against a date by
+    date loop for both rules. The rolling windows skip the missing spreads,
+    so the loop runs on the valid dates.
+    """
+    spread = _spreads()['Arb_Swap_10'].dropna().to_numpy()
+    for rule, entry in [('zscore', 1.5), ('level', 5.0)]:
+        metrics, pnl = backtest.backtest_tenor(spread, [21, 63], [entry, 2 * entry], [1, 10], [0.0, 1.0],
+                                               rule, keep_pnl = True)
+        for i, lookback in enumerate([21, 63]):
+            for k, holding in enumerate([1, 10]):
+                for c, cost in enumerate([0.0, 1.0]):
+                    expected = _loop_pnl(spread, lookback, entry, holding, cost, rule)
+                    assert np.allclose(pnl[i, 0, k, c], expected)
+                    assert np.isclose(metrics['pnl_bps'][i, 0, k, c], expected.sum())
+                    sharpe = expected.mean() / expected.std() * np.sqrt(252)
+                    assert np.isclose(metrics['sharpe'][i, 0, k, c], sharpe)
+                    drawdown = (expected.cumsum() - np.maximum.accumulate(np.maximum(expected.cumsum(), 0))).min()
+                    assert np.isclose(metrics['max_drawdown_bps'][i, 0, k, c], drawdown)
+
+def test_run_backtest():
+    """Checking the layout of the grid results, the PnL of the best
+    combinations, and that sharding the tenors gives the same results
+    """
+    df = _spreads()
+    summary, pnl = backtest.run_backtest(df, tenors = ['2', '10', '30'], max_workers = 1, top = 3)
+    grid = backtest.parameter_grid()
+    assert len(summary) == 3 * len(grid)
+    assert list(summary.index.names) == ['tenor'] + backtest.PARAMS
+    assert pnl.shape == (len(df), 9) and pnl.index.equals(df.index)
+    for column in pnl.columns:
+        assert np.isclose(pnl[column].sum(), summary.loc[column, 'pnl_bps'])
+        assert summary.loc[column, 'sharpe'] >= summary.loc[column[0], 'sharpe'].nlargest(3).min()
+
+    sharded = backtest.run_backtest(df, tenors = ['2', '10', '30'], max_workers = 3, top = 3)
+    assert sharded[0].equals(summary) and sharded[1].equals(pnl)
@@ -0,0 +1,45 @@
+"""
+Tests the synthetic data generator and the benchmark runner.
+"""
+import os
+import numpy as np
+import pandas as pd
+from synthetic import synthetic_yields
+from benchmarks import run_benchmarks, check_imports, IMPORT_TARGET_RATIO
+
+def test_synthetic_yields():
+    """Checks that the generator is deterministic, has the Bloomberg layout
+    and the requested share of missing cells
+    """
+    tickers = ['GT2 Govt', 'GT10 Govt']
+    df = synthetic_yields(tickers, '2000-01-01', '2009-12-31', nan_density = 0.1, seed = 3)
+    assert df.equals(synthetic_yields(tickers, '2000-01-01', '2009-12-31', nan_density = 0.1, seed = 3))
+    assert [a for a, _ in df.columns] == tickers
+    assert len(df) == len(pd.bdate_range('2000-01-01', '2009-12-31'))
+    assert abs(df.isna().to_numpy().mean() - 0.1) < 0.01
+
+    intraday = synthetic_yields(tickers, '2024-01-01', '2024-01-05', freq = 'min')
+    assert len(intraday) == 5 * 390
+    raw = synthetic_yields(tickers, '2024-01-01', '2024-01-05', nan_density = 0.5, dtype = 'object')
+    assert (raw.dtypes == object).all()
+
+def test_run_benchmarks(tmp_path):
+    """Runs two benchmark runs on tiny data and checks that both are stored
+    """
+    file = os.path.join(tmp_path, 'benchmarks.csv')
+    stages = ['clean_raw_tyields', 'calc_swap_spreads']
+    run_benchmarks(['tiny'], stages, repeat = 1, results_file = file)
+    results = run_benchmarks(['tiny'], stages, repeat = 1, results_file = file)
+    assert list(results['stage']) == stages
+    assert (results['seconds'] > 0).all()
+    assert len(pd.read_csv(file)) == 4
+
+def test_import_time():
+    """Checks that computing spreads, cleaning and plotting code can be imported
+    within the startup budget relative to importing pandas, without loading
+    xbbg or matplotlib
+    """
+    modules = ['calc_swap_spreads', 'pull_bloomberg', 'plot_figure', 'pipeline']
+    results = check_imports(modules, repeat = 2)
+    assert (results['ratio'] < IMPORT_TARGET_RATIO).all()
+    assert results['heavy'].map(len).eq(0).all()
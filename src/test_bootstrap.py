@@ -0,0 +1,50 @@
+"""
+Tests the block bootstrap in bootstrap.py
+"""
+import numpy as np
+import bootstrap
+
+def _ar1(n = 2000, k = 3, phi = 0.9, seed = 1):
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(size = (n, k))
+    x = np.zeros((n, k))
+    for t in range(1, n):
+        x[t] = phi * x[t - 1] + noise[t]
+    return x
+
+def test_indices_and_means():
+    """Checking that the resamples are made of runs of consecutive rows and
+    that the means from the row counts match the means of the resamples,
+    missing values included.
+    """
+    x = _ar1(300)
+    x[:40, 1] = np.nan
+    rng = np.random.default_rng(0)
+    for method in bootstrap.METHODS:
+        idx = bootstrap.block_indices(len(x), 20, 10, method, rng)
+        assert idx.shape == (20, len(x)) and idx.min() >= 0 and idx.max() < len(x)
+        steps = np.diff(idx, axis = 1)
+        assert ((steps == 1) | (steps == 1 - len(x))).mean() > 0.8
+
+    seed = np.random.SeedSequence(5)
+    idx = bootstrap.block_indices(len(x), 7, 10, 'stationary', np.random.default_rng(seed))
+    valid = ~np.isnan(x)
+    means = bootstrap._batch_means(np.where(valid, x, 0), valid.astype(float), 7, 10, 'stationary', seed)
+    assert np.allclose(means, np.nanmean(x[idx], axis = 1))
+
+def test_reproducible_and_covering():
+    """Checking that the replicates only depend on the seed, not on the number
+    of processes, and that the standard errors of an AR(1) are close to the
+    long run ones and well above the iid ones.
+    """
+    x = _ar1()
+    serial, block = bootstrap.bootstrap_means(x, 1000, None, 'stationary', 3, 1, batch = 100)
+    parallel, _ = bootstrap.bootstrap_means(x, 1000, None, 'stationary', 3, 2, batch = 100)
+    assert np.array_equal(serial, parallel)
+    assert block > 1
+
+    se, lower, upper, _ = bootstrap.bootstrap_intervals(x, 2000, None, 'moving', 0.05, 3, 1)
+    long_run = 1 / (1 - 0.9) / np.sqrt(len(x))
+    assert np.all(np.abs(se / long_run - 1) < 0.4)
+    assert np.all(se > 2 * x.std(axis = 0) / np.sqrt(len(x)))
+    assert np.all((lower < x.mean(axis = 0)) & (x.mean(axis = 0) < upper))
@@ -2,6 +2,7 @@
 Tests functions in calc_swap_spreads responsible for calculation and plots.
 """
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 from calc_swap_spreads import *
 from pull_bloomberg import *
@@ -33,5 +34,40 @@ def test_swap_main():
     """
     swap_main()
     file_dir = os.path.join(data_dir , 'calc_spread')
-    file = os.path.join(file_dir, 'calc_merged.pkl')
-    assert os.path.exists(file)
\ No newline at end of file
+    file = os.path.join(file_dir, 'calc_merged.parquet')
+    assert os.path.exists(file)
+
+def _dummy_yields(tickers, seed):
+    """Creates a yield frame shaped like the Bloomberg pulls
+    """
+    index = [x.date() for x in pd.bdate_range('1999-06-01', '2001-12-31')]
+    columns = pd.MultiIndex.from_product([tickers, ['PX_LAST']])
+    data = np.random.default_rng(seed).normal(3, 1, (len(index), len(columns)))
+    return pd.DataFrame(data, index = index, columns = columns)
+
+def test_calc_swap_spreads_mmap(tmp_path):
+    """Tests that the memory-mapped engine matches calc_swap_spreads on dummy
+    data with missing dates and values, and that its output views the
+    memory-mapped file
+    """
+    years = [1,2,3,5,10,20,30]
+    treasury_df = _dummy_yields([f'GT{year} Govt' for year in years], 0).iloc[3:]
+    swap_df = _dummy_yields([f'USSO{year} CMPN Curncy' for year in years], 1)
+    swap_df.iloc[400:410] = np.nan
+    treasury_df.iloc[500:520, 2] = np.nan
+
+    expected = calc_swap_spreads(treasury_df, swap_df)
+    output = calc_swap_spreads_mmap(treasury_df, swap_df, mmap_dir = tmp_path, chunk_size = 100)
+    assert output.columns.equals(expected.columns)
+    assert output.index.equals(expected.index)
+    assert np.allclose(output.to_numpy(), expected.to_numpy(), equal_nan = True)
+    file = os.path.join(tmp_path, 'spreads.dat')
+    assert os.path.getsize(file) == output.to_numpy().nbytes
+
+    # The values are backed by the memory-mapped file, not copied to memory
+    values = output.to_numpy()
+    backing = values
+    while not isinstance(backing, np.memmap) and backing.base is not None:
+        backing = backing.base
+    assert isinstance(backing, np.memmap) and backing.filename == os.path.abspath(file)
+    assert np.shares_memory(values, backing)
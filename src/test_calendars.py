@@ -0,0 +1,61 @@
+"""
+Tests the holiday calendars and the as-of alignment in calendars.py
+"""
+import os
+import numpy as np
+import pandas as pd
+import calendars
+from datetime import date
+
+def test_holidays(calendar_dir):
+    """Checking known closes of both calendars, the Saturday rules, the early
+    closes on Good Friday, the end dates of the pulls and that the holidays
+    are stored for later runs
+    """
+    sifma = calendars.holidays('sifma')
+    nyfed = calendars.holidays('nyfed')
+    for day in ['2020-07-03', '2021-12-24', '2022-04-15', '2022-06-20', '2018-12-05', '2012-10-30']:
+        assert pd.Timestamp(day).date() in sifma.index
+    for day in ['2020-07-03', '2021-12-24', '2022-04-15', '2018-12-05']:
+        assert pd.Timestamp(day).date() not in nyfed.index
+    for day in ['2023-04-07', '2021-04-02', '2015-04-03', '2012-04-06']:
+        assert pd.Timestamp(day).date() not in sifma.index
+    assert date(2021, 12, 31) not in sifma.index and date(2023, 11, 10) not in sifma.index
+    assert date(2022, 6, 20) in nyfed.index and date(2023, 11, 10) not in nyfed.index
+
+    assert calendars.previous_business_day('2022-04-18', 'sifma') == pd.Timestamp('2022-04-14')
+    assert calendars.previous_business_day('2022-04-18', 'nyfed') == pd.Timestamp('2022-04-15')
+    assert calendars.previous_business_day('2023-04-10', 'sifma') == pd.Timestamp('2023-04-07')
+    assert calendars.previous_business_day('2024-01-02', 'sifma') == pd.Timestamp('2023-12-29')
+    days = calendars.business_days('2023-12-22', '2024-01-02', 'sifma')
+    assert list(days) == [date(2023, 12, 22), date(2023, 12, 26), date(2023, 12, 27), date(2023, 12, 28),
+                          date(2023, 12, 29), date(2024, 1, 2)]
+    assert os.path.exists(os.path.join(calendar_dir, 'sifma.parquet'))
+    assert calendars._compute_holidays('sifma')['holiday'].equals(sifma)
+
+def test_align_matches_merge_asof():
+    """Checking the alignment against one merge_asof per column: holidays are
+    left out unless both frames quote them, dates missing in one frame are
+    kept, and values older than the tolerance are missing
+    """
+    rng = np.random.default_rng(0)
+    days = pd.bdate_range('2023-06-01', '2023-12-31')
+    t_days = days.delete([5, 6, 7, 23, 40])
+    s_days = days.delete([20, 60])
+    t_df = pd.DataFrame(rng.normal(size = (len(t_days), 2)), index = t_days.date, columns = ['a', 'b'])
+    s_df = pd.DataFrame(rng.normal(size = (len(s_days), 2)), index = s_days.date, columns = ['c', 'd'])
+    t_df.iloc[30:34, 0] = np.nan
+
+    t_out, s_out = calendars.align_frames([t_df, s_df], 'sifma', '3D')
+    assert date(2023, 7, 4) not in t_out.index and date(2023, 11, 23) in t_out.index
+    assert t_out.index.equals(s_out.index)
+    assert set(t_out.index) == {x for x in set(t_df.index) | set(s_df.index)
+                                if calendars.is_business_day(x, 'sifma') or (x in t_df.index and x in s_df.index)}
+    target = pd.DataFrame({'date': pd.to_datetime(t_out.index)})
+    for df, out in [(t_df, t_out), (s_df, s_out)]:
+        for col in df:
+            source = df[[col]].dropna().rename_axis('date').reset_index()
+            source['date'] = pd.to_datetime(source['date'])
+            expected = pd.merge_asof(target, source, on = 'date', tolerance = pd.Timedelta('3D'))
+            assert np.allclose(out[col].to_numpy(), expected[col].to_numpy(), equal_nan = True)
+    assert t_out['a'].isna().sum() > 0
@@ -0,0 +1,70 @@
+"""
+Tests the compact representation of yield histories in compact.py
+"""
+import os
+import numpy as np
+import pandas as pd
+from pipeline import Pipeline
+from compact import CompactFrame, compact, expand, max_error_bps
+from store import save_frame, load_frame
+from synthetic import synthetic_yields
+
+def _sparse_yields():
+    """Yields with late starting, early ending and gappy tenors
+    """
+    df = synthetic_yields([f'GT{x} Govt' for x in [1, 2, 5, 10, 20, 30]], '2000-01-01', '2024-12-31',
+                          nan_density = 0.02)
+    df.iloc[:2500, 4] = np.nan
+    df.iloc[1500:, 5] = np.nan
+    df.iloc[:, 3] = np.nan
+    return df
+
+def test_compact_frame():
+    """Checking that a compacted frame expands to the original values within
+    the float32 precision, keeps every missing cell, and takes at most half
+    the memory
+    """
+    df = _sparse_yields()
+    frame = CompactFrame(df)
+    restored = frame.to_frame()
+    assert restored.index.equals(df.index) and restored.columns.equals(df.columns)
+    assert restored.isna().equals(df.isna())
+    assert np.nanmax(np.abs(restored - df).to_numpy()) * 100 <= max_error_bps(np.nanmax(df.abs())) / 2
+    assert frame.nbytes <= df.memory_usage(index = False).sum() / 2
+    assert list(frame.starts[[0, 3, 4]]) == [0, 0, 2500] and frame.stops[5] == 1500
+
+    assert not isinstance(compact(df.astype(object)), CompactFrame)
+    assert expand(frame).equals(restored)
+
+def test_compact_pipeline():
+    """Checking that a compact pipeline holds the frames as CompactFrames
+    and passes regular frames to the stages
+    """
+    df = _sparse_yields()
+    stages = {
+        'clean': (lambda: df, []),
+        'calc': (lambda clean: 100 * (clean.iloc[:, [1]] - clean.iloc[:, [0]].to_numpy()), ['clean']),
+        'table': (lambda clean, calc: (type(clean), type(calc)), ['clean', 'calc']),
+    }
+    pipe = Pipeline(stages, compact = True)
+    assert pipe.run(['table'])['table'] == (pd.DataFrame, pd.DataFrame)
+    pipe = Pipeline(stages, compact = True)
+    calc = pipe.run(['calc', 'clean'])
+    assert isinstance(pipe.results['calc'], CompactFrame)
+    expected = 100 * (df.iloc[:, [1]] - df.iloc[:, [0]].to_numpy())
+    assert np.nanmax(np.abs(calc['calc'] - expected).to_numpy()) <= max_error_bps(np.nanmax(df.abs()))
+
+def test_compact_store(tmp_path):
+    """Checking that a compact file loads back as float64 within the float32
+    precision and is smaller than the regular file
+    """
+    df = _sparse_yields()
+    regular, small = os.path.join(tmp_path, 'regular.parquet'), os.path.join(tmp_path, 'compact.parquet')
+    save_frame(df, regular, compact = False)
+    save_frame(df, small, compact = True)
+    loaded = load_frame(small)
+    assert (loaded.dtypes == np.float64).all()
+    assert loaded.isna().equals(df.isna())
+    assert np.allclose(loaded, df, rtol = 2 ** -24, atol = 0, equal_nan = True)
+    assert os.path.getsize(small) < os.path.getsize(regular)
+    assert load_frame(regular).equals(df)
@@ -0,0 +1,122 @@
+"""
+Tests the stage instrumentation in instrument.py
+"""
+import os
+import json
+import threading
+import pstats
+import tracemalloc
+from collections import deque
+import numpy as np
+import instrument
+
+def _settings(monkeypatch, tmp_path, memory = 'tracemalloc', cprofile = False, reset_rss = True,
+              max_records = 100):
+    monkeypatch.setattr(instrument, 'output_dir', tmp_path)
+    monkeypatch.setattr(instrument, 'RECORDS', deque(maxlen = max_records))
+    monkeypatch.setattr(instrument, '_recorded', 0)
+    monkeypatch.setattr(instrument, '_summarized', 0)
+    monkeypatch.setattr(instrument, 'config', lambda key: {'PROFILE_MEMORY': memory,
+                                                           'PROFILE_CPROFILE': cprofile,
+                                                           'PROFILE_RESET_RSS': reset_rss}[key])
+
+@instrument.instrumented
+def _inner(n):
+    return np.ones(n).sum()
+
+@instrument.instrumented(name = 'outer')
+def _outer(n):
+    total = _inner(n)
+    x = np.ones(n // 4)
+    return total + x.sum()
+
+def test_nested_records(tmp_path, monkeypatch):
+    """Checking that nested stages record their own peak memory, that the
+    outer stage includes the inner peak, and that the summary and the run
+    file list every call
+    """
+    _settings(monkeypatch, tmp_path)
+    assert _outer(2 ** 22) == 2 ** 22 + 2 ** 20
+    inner, outer = instrument.RECORDS
+    assert (inner['stage'], outer['stage']) == ('_inner', 'outer')
+    assert 31 < inner['peak_mb'] < 40 and outer['peak_mb'] >= inner['peak_mb']
+    assert outer['seconds'] >= inner['seconds']
+    assert not tracemalloc.is_tracing()
+
+    assert instrument.summary().startswith('outer ')
+    assert instrument.summary() == ''
+    with open(instrument.write_run()) as f:
+        run = json.load(f)
+    assert [x['stage'] for x in run['stages']] == ['_inner', 'outer']
+
+def test_cprofile(tmp_path, monkeypatch):
+    """Checking that the outermost stage is profiled and its statistics
+    dumped, and that tracing started by the caller is left running
+    """
+    _settings(monkeypatch, tmp_path, cprofile = True)
+    tracemalloc.start()
+    try:
+        _outer(1000)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    inner, outer = instrument.RECORDS
+    assert inner['profile'] is None and os.path.exists(outer['profile'])
+    functions = [name for _, _, name in pstats.Stats(outer['profile']).stats]
+    assert '_inner' in functions
+
+def test_rss_peak(tmp_path, monkeypatch):
+    """Checking the resident memory peak of a stage where /proc is available
+    """
+    _settings(monkeypatch, tmp_path, memory = 'rss')
+    _inner(2 ** 23)
+    record = instrument.RECORDS[0]
+    if instrument._rss() is None or not instrument._reset_rss_peak():
+        assert record['peak_mb'] is None
+    else:
+        assert record['peak_mb'] > 50
+
+def test_rss_reset_flag(tmp_path, monkeypatch):
+    """Checking that the resident memory peak is neither reset nor measured
+    without PROFILE_RESET_RSS
+    """
+    _settings(monkeypatch, tmp_path, memory = 'rss', reset_rss = False)
+    resets = []
+    monkeypatch.setattr(instrument, '_reset_rss_peak', lambda: resets.append(1) or True)
+    _inner(1000)
+    assert instrument.RECORDS[0]['peak_mb'] is None
+    assert resets == []
+
+def test_bounded_records(tmp_path, monkeypatch):
+    """Checking that only the latest records are kept and that the summary
+    lists the calls not summarized yet among them
+    """
+    _settings(monkeypatch, tmp_path, max_records = 3)
+    _outer(1000)
+    assert instrument.summary() == instrument.summary(list(instrument.RECORDS))
+    for _ in range(4):
+        _inner(1000)
+    assert len(instrument.RECORDS) == 3
+    assert instrument.summary().count('_inner') == 3
+    assert instrument.summary() == ''
+
+def test_threads(tmp_path, monkeypatch):
+    """Checking that stages running in several threads keep their own stacks
+    of nested calls
+    """
+    _settings(monkeypatch, tmp_path, max_records = 1000)
+    errors = []
+    def run():
+        try:
+            for _ in range(20):
+                _outer(2 ** 12)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target = run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(instrument.RECORDS) == 4 * 20 * 2
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,75 @@
+"""
+Tests the curve interpolation in interpolation.py
+"""
+import datetime
+import numpy as np
+import universe
+import interpolation
+from calc_swap_spreads import calc_swap_spreads
+from synthetic import synthetic_yields
+
+YEARS = [0.25, 0.5, 1, 2, 3, 5, 7, 10, 20, 30]
+
+def test_linear_and_pchip():
+    """Checking that both methods go through the points, reproduce a straight
+    line, keep monotone curves monotone, and give the same results batched
+    over dates with missing points as date by date
+    """
+    rng = np.random.default_rng(0)
+    values = np.sort(rng.normal(3, 1, (200, len(YEARS))), axis = 1)
+    values[rng.random(values.shape) < 0.1] = np.nan
+    grid = np.linspace(0.25, 30, 120)
+    for method in ['linear', 'pchip']:
+        out = interpolation.interpolate(values, YEARS, list(YEARS) + list(grid), method)
+        nodes, fine = out[:, :len(YEARS)], out[:, len(YEARS):]
+        valid = ~np.isnan(values)
+        assert np.allclose(nodes[valid], values[valid])
+        assert (np.nan_to_num(np.diff(fine, axis = 1)) >= -1e-12).all()
+
+        line = interpolation.interpolate(np.tile(2 + 0.1 * np.array(YEARS), (3, 1)), YEARS, grid, method)
+        assert np.allclose(line, 2 + 0.1 * grid)
+
+        rows = [interpolation.interpolate(row[None], YEARS, grid, method)[0] for row in values[:20]]
+        assert np.allclose(np.array(rows), fine[:20], equal_nan = True)
+
+def test_nelson_siegel():
+    """Checking that a Nelson-Siegel curve is recovered from a subset of its
+    points and that dates with too few points are NaN
+    """
+    beta = np.array([[4.0, -2.0, 1.5], [3.0, 1.0, -0.5]])
+    curve = beta @ interpolation._nelson_siegel_loadings(YEARS).T
+    curve[1, 2:6] = np.nan
+    grid = [0.5, 4, 15, 25]
+    out = interpolation.interpolate(curve, YEARS, grid, 'nelson_siegel')
+    assert np.allclose(out, beta @ interpolation._nelson_siegel_loadings(grid).T)
+    assert np.isnan(interpolation.interpolate(curve[:, :2], YEARS[:2], grid, 'nelson_siegel')).all()
+
+def test_interpolated_spreads():
+    """Checking that the spreads on the swap maturities match calc_swap_spreads
+    and that tenors without a swap are interpolated from the neighbouring swaps
+    """
+    govt = synthetic_yields(universe.govt_tickers('US'), '2019-01-01', '2020-12-31', seed = 1)
+    govt = govt.rename(columns = universe.govt_rename('US'))
+    swap = synthetic_yields(universe.swap_tickers('US'), '2019-01-01', '2020-12-31', seed = 2)
+    expected = calc_swap_spreads(govt, swap)
+    df = interpolation.interpolated_spreads(govt, swap, method = 'linear')
+    assert np.allclose(df.to_numpy(), expected.to_numpy())
+
+    df = interpolation.interpolated_spreads(govt, swap, grid = [7], method = 'linear')
+    swap_7 = 0.6 * swap[('USSO5 CMPN Curncy', 'PX_LAST')] + 0.4 * swap[('USSO10 CMPN Curncy', 'PX_LAST')]
+    assert np.allclose(df['Arb_Swap_7'], 100 * (swap_7 - govt[('GT7 Govt', 'PX_LAST')]).loc[df.index])
+
+def test_common_grid_calendar(monkeypatch):
+    """Checking that the common grid is aligned on the calendar of the curve
+    """
+    govt = synthetic_yields(universe.govt_tickers('US'), '2020-06-01', '2020-07-31', seed = 1)
+    govt = govt.rename(columns = universe.govt_rename('US'))
+    swap = synthetic_yields(universe.swap_tickers('US'), '2020-06-01', '2020-07-31', seed = 2)
+    holiday = datetime.date(2020, 7, 3)
+    govt = govt.drop(holiday)
+    govt_grid, _ = interpolation.common_grid_yields(govt, swap, method = 'linear', curve = 'US')
+    assert holiday not in govt_grid.index
+
+    monkeypatch.setattr(interpolation, 'curve_calendar', lambda curve: 'weekdays')
+    govt_grid, _ = interpolation.common_grid_yields(govt, swap, method = 'linear', curve = 'US')
+    assert holiday in govt_grid.index
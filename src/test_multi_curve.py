@@ -0,0 +1,64 @@
+"""
+Tests the batch spread engine of several curves in multi_curve.py
+"""
+import os
+from datetime import date
+import numpy as np
+import pandas as pd
+import universe
+from calc_swap_spreads import calc_swap_spreads
+from multi_curve import calc_curve_spreads
+from synthetic import synthetic_yields
+
+def _yields(tickers, seed):
+    df = synthetic_yields(tickers, '1999-06-01', '2002-12-31', nan_density = 0.05, seed = seed)
+    return df.iloc[seed:]
+
+def test_us_wide_format():
+    """Checking that the wide format of the US curve matches calc_swap_spreads
+    """
+    treasury_df = _yields(universe.govt_tickers('US'), 1).rename(columns = universe.govt_rename('US'))
+    swap_df = _yields(universe.swap_tickers('US'), 2)
+    long_df, wide_df = calc_curve_spreads(treasury_df, swap_df)
+    expected = calc_swap_spreads(treasury_df, swap_df)
+    assert wide_df.equals(expected)
+    assert set(long_df['curve']) == {'US'}
+    assert len(long_df) == expected.filter(like = 'tswap').notna().sum().sum()
+
+def test_several_curves(tmp_path, monkeypatch):
+    """Checking on a manifest of four curves, two sharing their government
+    yields, that every curve matches its own calc_swap_spreads, and that a
+    curve on its own calendar keeps the US holidays
+    """
+    rows = []
+    for curve, govt, swap in [('US', 'GT{} Govt', 'USSO{} CMPN Curncy'),
+                              ('SOFR', 'GT{} Govt', 'USOSFR{} Curncy'),
+                              ('EUR', 'GTDEM{}Y Govt', 'EESWE{} Curncy'),
+                              ('GBP', 'GTGBP{}Y Govt', 'BPSWS{} Curncy')]:
+        for years in ([2, 5, 10, 30] if curve != 'GBP' else [2, 10, 20]):
+            rows.append({'curve': curve, 'tenor': str(years), 'years': years, 'govt': govt.format(years),
+                         'govt_source': None, 'swap': swap.format(years), 'plot_order': None,
+                         'calendar': 'weekdays' if curve == 'EUR' else None})
+    file = os.path.join(tmp_path, 'universe.csv')
+    pd.DataFrame(rows).to_csv(file, index = False)
+    monkeypatch.setattr(universe, 'config', lambda key: {'UNIVERSE_FILE': file, 'CURVE': 'US'}[key])
+
+    # The treasuries are closed on Independence Day, the swaps are quoted
+    treasury_df = _yields(list(dict.fromkeys(universe.govt_tickers())), 3).drop(date(2001, 7, 4))
+    swap_df = _yields(universe.swap_tickers(), 4)
+    long_df, wide_df = calc_curve_spreads(treasury_df, swap_df)
+    assert list(long_df['tenor'].cat.categories) == ['2', '5', '10', '20', '30']
+    assert long_df.index.is_monotonic_increasing
+
+    for curve in ['US', 'SOFR', 'EUR', 'GBP']:
+        expected = calc_swap_spreads(treasury_df, swap_df, curve)
+        rows = long_df[long_df['curve'] == curve]
+        spreads = rows.pivot(columns = 'tenor', values = 'spread')
+        for tenor in universe.spread_tenors(curve):
+            column = expected[(f'Arb_Swap_{tenor}', '')].dropna()
+            assert np.allclose(spreads[tenor].dropna(), column)
+    assert wide_df.equals(calc_swap_spreads(treasury_df, swap_df, 'US'))
+
+    # Independence Day is a US holiday, not one of the weekdays calendar
+    holiday = long_df.index == date(2001, 7, 4)
+    assert set(long_df['curve'][holiday]) == {'EUR'}
@@ -0,0 +1,49 @@
+"""
+Tests the in-process pipeline runner in pipeline.py
+"""
+import pytest
+from pipeline import Pipeline
+
+def _counting_stages(calls):
+    def stage(name, value):
+        def func(*args):
+            calls.append(name)
+            return value + sum(args)
+        return func
+    return {
+        'raw': (stage('raw', 1), []),
+        'clean': (stage('clean', 10), ['raw']),
+        'calc': (stage('calc', 100), ['clean']),
+        'table': (stage('table', 1000), ['calc']),
+        'figures': (stage('figures', 0), ['calc', 'clean']),
+    }
+
+def test_pipeline_runs_each_stage_once():
+    """Checks that shared dependencies run once, in dependency order, across
+    several calls as the doit tasks make them
+    """
+    calls = []
+    pipe = Pipeline(_counting_stages(calls))
+    assert pipe.order(['figures']) == ['raw', 'clean', 'calc', 'figures']
+    assert pipe.run(['raw']) == {'raw': 1}
+    assert pipe.run(['table']) == {'table': 1111}
+    assert pipe.run(['figures']) == {'figures': 122}
+    assert calls == ['raw', 'clean', 'calc', 'table', 'figures']
+
+def test_pipeline_releases_consumed_frames():
+    """Checks that outputs are dropped once all their dependents ran, and
+    recomputed if a rerun needs them
+    """
+    calls = []
+    pipe = Pipeline(_counting_stages(calls))
+    pipe.run(['table', 'figures'])
+    assert set(pipe.results) == {'table', 'figures'}
+    assert pipe.run(['clean']) == {'clean': 11}
+    assert calls.count('raw') == 2
+
+def test_pipeline_cycle():
+    """Checks that a cycle is reported
+    """
+    pipe = Pipeline({'a': (lambda b: b, ['b']), 'b': (lambda a: a, ['a'])})
+    with pytest.raises(ValueError):
+        pipe.run(['a'])
@@ -50,6 +50,34 @@ def test_plot_supplementary():
         file = os.path.join(output_dir, f"replication_figure{year}.png")
         assert os.path.exists(file)
 
+def test_decimate():
+    """Checks that a long series is reduced to a few points per pixel while
+    keeping its endpoints and extremes
+    """
+    index = pd.bdate_range('2000-01-01', periods = 50_000).date
+    series = pd.Series(np.sin(np.arange(50_000) / 500), index = index)
+    series.iloc[12_345] = 5
+
+    small = decimate(series, 640)
+    assert len(small) <= 4 * 640
+    assert small.index[0] == series.index[0] and small.index[-1] == series.index[-1]
+    assert small.max() == 5 and small.min() == series.min()
+    assert small.index.is_monotonic_increasing
+    assert decimate(series.iloc[:100], 640).equals(series.iloc[:100])
+
+def test_render_figures_parallel(tmp_path):
+    """Renders several figure specs in a process pool and checks the files
+    """
+    index = pd.bdate_range('2000-01-01', periods = 50).date
+    series = pd.Series(np.arange(50.0), index = index)
+    specs = [{'lines': [{'x': pd.to_datetime(series.index).to_numpy(), 'y': series.to_numpy(), 'label': 'a'}],
+              'title': 't', 'xlabel': 'x', 'ylabel': 'y',
+              'path': os.path.join(tmp_path, f'dummy_render{i}.png')} for i in range(3)]
+    paths = render_figures(specs, max_workers = 2)
+
+    assert paths == [spec['path'] for spec in specs]
+    assert all(os.path.exists(path) for path in paths)
+
 def test_plot_main():
     """Runs plot_main() and checks if the plots are saved correctly
     Note: It only passes/works when running with a bloomberg-enabled machine.
@@ -4,8 +4,12 @@ Tests functions in pull_bloomberg responsible for the raw and clean data.
 import pandas as pd
 import os
 import pull_bloomberg
+import stage_cache
+import store
 import numpy as np
+import pytest
 from pathlib import Path
+from fake_blp import FakeBlp, RecordingBlp, ReplayBlp
 from settings import config
 
 data_dir = Path(config("DATA_DIR"))
@@ -22,7 +26,7 @@ def test_pull_raw_tyields():
     assert (colu == t_list)
     
     file_dir = os.path.join(data_dir, 'bbg')
-    file = os.path.join(file_dir, 'raw_tyields.pkl')
+    file = os.path.join(file_dir, 'raw_tyields.parquet')
     assert os.path.exists(file)
 
 def test_pull_raw_syields():
@@ -36,7 +40,7 @@ def test_pull_raw_syields():
     assert (colu == swap_list)
 
     file_dir = os.path.join(data_dir, 'bbg')
-    file = os.path.join(file_dir, 'raw_syields.pkl')
+    file = os.path.join(file_dir, 'raw_syields.parquet')
     assert os.path.exists(file)
 
 def test_clean_raw_tyields():
@@ -71,4 +75,117 @@ def test_clean_raw_syields():
     test_df = pull_bloomberg.clean_raw_syields(test_df, override = False, save_data = False)
     assert ((test_df.dtypes == np.int64) | (test_df.dtypes == np.float64)).all()
     
-    assert len(test_df) == test_len
\ No newline at end of file
+    assert len(test_df) == test_len
+
+def test_pull_raw_syields_incremental(tmp_path, monkeypatch):
+    """Checking with a fake Bloomberg connection that an incremental pull
+    only requests the dates after the watermark minus the look-back window
+    and merges them into the local data, which keeps float64 when frames
+    are compacted
+    """
+    fake = FakeBlp()
+    monkeypatch.setattr(pull_bloomberg, 'blp', fake)
+    monkeypatch.setattr(pull_bloomberg, 'data_dir', tmp_path)
+    monkeypatch.setattr(store, 'config', lambda key: True if key == 'COMPACT_FRAMES' else config(key))
+
+    full = pull_bloomberg.pull_raw_syields(override_download = True)
+    file = os.path.join(tmp_path, 'bbg', 'raw_syields.parquet')
+    stale = full.iloc[:-10]
+    pull_bloomberg.save_frame(stale, file, compact = False)
+    os.remove(os.path.join(tmp_path, 'bbg', 'raw_syields_watermark.json'))
+
+    fake.calls.clear()
+    df = pull_bloomberg.pull_raw_syields(incremental = True, lookback_days = 3)
+    assert len(fake.calls) == len(full.columns)
+    for _, start, end in fake.calls:
+        assert start == pd.Timestamp(stale.index[-1]) - pd.Timedelta(days = 3)
+    assert df.equals(full)
+    assert pull_bloomberg.load_frame(file).equals(full)
+
+def test_fetch_bdh_chunks():
+    """Checking that a request split into ticker and date chunks runs
+    concurrently and reassembles into the single request layout
+    """
+    fake = FakeBlp(latency = 0.05)
+    tickers = [f'USSO{x} CMPN Curncy' for x in [1, 2, 3, 5]]
+    df = pull_bloomberg.fetch_bdh(tickers, '2000-01-01', '2003-12-31', source = fake,
+                                  chunk_days = 731, max_workers = 4)
+    expected = FakeBlp().bdh(tickers, ['PX_LAST'], '2000-01-01', '2003-12-31')
+    assert len(fake.calls) == 8
+    assert 1 < fake.max_active <= 4
+    assert df.equals(expected)
+
+def test_fetch_bdh_retries():
+    """Checking that transient failures are retried and that a chunk which
+    keeps failing raises once the retries are exhausted
+    """
+    fake = FakeBlp(failures = 2)
+    df = pull_bloomberg.fetch_bdh(['GT2 Govt'], '2020-01-01', '2020-12-31', source = fake,
+                                  retries = 2, backoff = 0)
+    assert len(fake.calls) == 3
+    assert len(df) == len(pd.bdate_range('2020-01-01', '2020-12-31'))
+
+    fake = FakeBlp(failures = 3)
+    with pytest.raises(ConnectionError):
+        pull_bloomberg.fetch_bdh(['GT2 Govt'], '2020-01-01', '2020-12-31', source = fake,
+                                 retries = 2, backoff = 0)
+
+def test_clean_yields_rules():
+    """Checking that the cleaning rules touch the expected cells and that
+    the report counts them
+    """
+    test_df = pd.DataFrame(index = pd.date_range('2025-01-01', periods = 9))
+    test_df['test1'] = ['1', '1', '1', '1', 'n/a', None, None, '2', '9']
+    test_df['test2'] = [3.0, np.nan, np.nan, 3.5, np.nan, np.nan, np.nan, np.nan, -1.0]
+    rules = {'stale_limit': 2, 'clip': (0, 5), 'ffill_limit': 2}
+    df, report = pull_bloomberg.clean_yields(test_df, rules)
+    assert report == {'coerced': 1, 'stale': 2, 'clipped': 2, 'filled': 4}
+    expected_1 = [1, 1, np.nan, np.nan, np.nan, np.nan, np.nan, 2, 5]
+    expected_2 = [3, 3, 3, 3.5, 3.5, 3.5, np.nan, np.nan, 0]
+    assert np.allclose(df['test1'], expected_1, equal_nan = True)
+    assert np.allclose(df['test2'], expected_2, equal_nan = True)
+
+def test_clean_raw_tyields_cache(tmp_path, monkeypatch):
+    """Checking that the saved cleaned data is only reused for the same raw
+    data, and that the cleaned data file follows the latest raw data
+    """
+    monkeypatch.setattr(pull_bloomberg, 'data_dir', tmp_path)
+    monkeypatch.setattr(stage_cache, 'data_dir', tmp_path)
+    first = pd.DataFrame({'test1': ['1', '2.3']}, index = pd.date_range('2025-01-01', periods = 2))
+    second = pd.DataFrame({'test1': ['4', 'x']}, index = pd.date_range('2025-01-01', periods = 2))
+    file = os.path.join(tmp_path, 'bbg', 'tyields.parquet')
+    for raw in [first, second, first]:
+        df = pull_bloomberg.clean_raw_tyields(raw)
+        expected = pull_bloomberg.clean_yields(raw)[0]
+        assert df.equals(expected)
+        assert pull_bloomberg.load_frame(file).equals(expected)
+
+def test_record_replay(tmp_path):
+    """Checking that recorded responses are served back by the replay source
+    for a differently chunked request, leaving out unknown tickers
+    """
+    tickers = [f'USSO{x} CMPN Curncy' for x in [2, 10]]
+    client = FakeBlp()
+    recorder = RecordingBlp(client, str(tmp_path))
+    recorded = pull_bloomberg.fetch_bdh(tickers, '2018-01-01', '2021-12-31', source = recorder,
+                                        chunk_days = 400, max_workers = 3)
+    assert len(os.listdir(tmp_path)) == 2
+
+    replay = ReplayBlp(str(tmp_path), latency = 0.01)
+    df = pull_bloomberg.fetch_bdh(tickers + ['USSO99 CMPN Curncy'], '2019-06-01', '2020-06-30',
+                                  source = replay, chunk_days = 100)
+    assert df.equals(recorded.loc[pd.Timestamp('2019-06-01').date():pd.Timestamp('2020-06-30').date()])
+    assert len(replay.calls) == 3 * 4
+
+def test_data_source_failures(monkeypatch):
+    """Checking that the configured source is used by the pulls and that
+    its random failures are absorbed by the retries
+    """
+    source = pull_bloomberg.data_source('synthetic', failure_rate = 0.3)
+    monkeypatch.setattr(pull_bloomberg, 'blp', source)
+    df = pull_bloomberg.fetch_bdh(['GT2 Govt', 'GT10 Govt'], '2010-01-01', '2019-12-31',
+                                  chunk_days = 365, retries = 10, backoff = 0)
+    assert len(source.calls) > 2 * 10
+    assert df.equals(FakeBlp().bdh(['GT2 Govt', 'GT10 Govt'], ['PX_LAST'], '2010-01-01', '2019-12-31'))
+    with pytest.raises(ValueError):
+        pull_bloomberg.data_source('terminal')
@@ -0,0 +1,64 @@
+"""
+Tests the date-range query API in query.py
+"""
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import query
+from store import save_frame, load_frame
+from synthetic import synthetic_yields
+
+def _dummy_spreads(start = '2009-01-01', end = '2012-12-31', seed = 0):
+    """Creates spreads shaped like the calc_swap_spreads output
+    """
+    names = [f'Arb_Swap_{year}' for year in [1, 2, 3, 5, 10, 20, 30]]
+    df = 100 * synthetic_yields(names, start, end, nan_density = 0.05, seed = seed)
+    df.columns = pd.MultiIndex.from_tuples([(name, '') for name, _ in df.columns])
+    return df
+
+def test_get_spreads_window(tmp_path):
+    """Checks a window against the full stored frame, and that only the years
+    and columns of the window are read
+    """
+    query.clear_cache()
+    file = os.path.join(tmp_path, 'calc_merged.parquet')
+    save_frame(_dummy_spreads(), file)
+    df = query.get_spreads(['10', '2'], '2010-03-01', '2011-02-28', file = file)
+
+    full = load_frame(file).droplevel(1, axis = 1)
+    expected = full[['Arb_Swap_10', 'Arb_Swap_2']].loc[pd.Timestamp('2010-03-01').date():pd.Timestamp('2011-02-28').date()]
+    assert list(df.columns) == ['Arb_Swap_10', 'Arb_Swap_2']
+    assert list(df.index.date) == list(expected.index)
+    assert np.allclose(df.to_numpy(), expected.to_numpy(), equal_nan = True)
+    # Two years of dates and two columns
+    assert query._partition.cache_info().misses == 6
+
+    query.get_spreads(['10'], '2010-06-01', '2010-06-30', file = file)
+    assert query._partition.cache_info().misses == 6
+    assert query.get_spreads(['10'], '2030-01-01', file = file).empty
+
+def test_get_spreads_rewritten_file(tmp_path):
+    """Checks that a rewritten file is read again instead of served from the cache
+    """
+    file = os.path.join(tmp_path, 'calc_merged.parquet')
+    save_frame(_dummy_spreads(seed = 0), file)
+    first = query.get_spreads(['5'], '2012-01-01', file = file)
+    new = _dummy_spreads(seed = 1)
+    save_frame(new, file)
+    second = query.get_spreads(['5'], '2012-01-01', file = file)
+    assert not np.allclose(first.to_numpy(), second.to_numpy(), equal_nan = True)
+    expected = new['Arb_Swap_5'].loc[pd.Timestamp('2012-01-01').date():].to_numpy().ravel()
+    assert np.allclose(second['Arb_Swap_5'].to_numpy(), expected, equal_nan = True)
+
+def test_get_yields(tmp_path):
+    """Checks that yields are found in the treasury and swap files
+    """
+    files = [os.path.join(tmp_path, 'tyields.parquet'), os.path.join(tmp_path, 'syields.parquet')]
+    save_frame(synthetic_yields(['GT2 Govt', 'GT10 Govt'], '2015-01-01', '2016-12-31'), files[0])
+    save_frame(synthetic_yields(['USSO2 CMPN Curncy'], '2015-01-01', '2016-12-31'), files[1])
+    df = query.get_yields(['USSO2 CMPN Curncy', 'GT10 Govt'], '2016-01-01', files = files)
+    assert list(df.columns) == ['USSO2 CMPN Curncy', 'GT10 Govt']
+    assert df.index[0].year == 2016 and not df.isna().any().any()
+    with pytest.raises(KeyError):
+        query.get_yields(['GT5 Govt'], files = files)
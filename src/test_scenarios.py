@@ -0,0 +1,60 @@
+"""
+Tests the scenario engine in scenarios.py
+"""
+import numpy as np
+import pandas as pd
+import universe
+import scenarios
+from calendars import align_frames
+from calc_swap_spreads import calc_swap_spreads
+from synthetic import synthetic_yields
+
+def _yields(start = '2019-01-01', end = '2020-12-31'):
+    govt = synthetic_yields(universe.govt_tickers('US'), start, end, seed = 1)
+    govt = govt.rename(columns = universe.govt_rename('US'))
+    swap = synthetic_yields(universe.swap_tickers('US'), start, end, seed = 2)
+    return govt, swap
+
+def test_par_shocks():
+    """Checking that shocking both legs leaves the par spreads unchanged, that
+    a government shock moves them by minus its size, and that chunks and
+    processes give the same statistics
+    """
+    govt, swap = _yields()
+    shocks = scenarios.parallel_shocks(sizes = [-25, 25])
+    summary = scenarios.run_scenarios(govt, swap, shocks, curve = 'US')
+    assert len(summary) == len(shocks) * len(universe.spread_pairs('US'))
+    assert list(summary.columns) == scenarios.STATS
+
+    both = summary.xs('parallel both +25bp', level = 'scenario')
+    assert np.allclose(both[['change_last', 'change_mean', 'change_min', 'change_max']], 0)
+    govt_up = summary.xs('parallel govt +25bp', level = 'scenario')
+    assert np.allclose(govt_up[['change_last', 'change_mean', 'change_min', 'change_max']], -25)
+    expected = calc_swap_spreads(govt, swap).iloc[-1]
+    arb = [x for x in expected.index if x[0].startswith('Arb_Swap_')]
+    assert np.allclose(govt_up['last'], expected[arb].to_numpy() - 25)
+
+    chunked = scenarios.run_scenarios(govt, swap, shocks, curve = 'US', chunk_mb = 0.01, max_workers = 2)
+    pd.testing.assert_frame_equal(summary, chunked)
+
+def test_historical_and_zero_shocks():
+    """Checking the historical shocks against the yield changes, and that a
+    zero shock leaves the zero spreads unchanged
+    """
+    govt, swap = _yields('2020-01-01', '2020-06-30')
+    shocks = scenarios.historical_shocks(govt, swap, horizon = 5, curve = 'US')
+    pairs = universe.spread_pairs('US')
+    first = shocks.iloc[0]
+    start = pd.Timestamp(first.name.split()[-1]).date()
+    aligned, _ = align_frames([govt, swap])
+    row = aligned.index.get_loc(start)
+    changes = 100 * (aligned.iloc[row + 5] - aligned.iloc[row])
+    expected = [changes[(x, 'PX_LAST')] for x in pairs['govt']]
+    assert np.allclose(first['govt'].to_numpy(), expected)
+
+    flat = scenarios.shape_shocks('flat', np.zeros(len(pairs)), sizes = [0], legs = ['both'], curve = 'US')
+    summary = scenarios.run_scenarios(govt, swap, pd.concat([flat, shocks.iloc[:3]]), kind = 'zero',
+                                      curve = 'US', method = 'linear')
+    zero = summary.xs('flat both +0bp', level = 'scenario')
+    assert np.allclose(zero[['change_last', 'change_mean', 'change_min', 'change_max']], 0, equal_nan = True)
+    assert len(summary) == 4 * len(pairs)
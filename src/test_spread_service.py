@@ -0,0 +1,87 @@
+"""
+Tests the HTTP spread service in spread_service.py
+"""
+import os
+import json
+import asyncio
+import numpy as np
+import pandas as pd
+import query
+from spread_service import SpreadService, load_test
+from store import save_frame
+from synthetic import synthetic_yields
+
+def _store(data_dir, seed = 0, end = '2024-06-28'):
+    """Writes spreads and yields shaped like the pipeline outputs
+    """
+    names = [f'Arb_Swap_{year}' for year in [1, 2, 3, 5, 10, 20, 30]]
+    spreads = 100 * synthetic_yields(names, '2015-01-01', end, seed = seed)
+    spreads.columns = pd.MultiIndex.from_tuples([(name, '') for name, _ in spreads.columns])
+    save_frame(spreads, os.path.join(data_dir, 'calc_spread', 'calc_merged.parquet'))
+    save_frame(synthetic_yields(['GT10 Govt'], '2015-01-01', end, seed = seed),
+               os.path.join(data_dir, 'bbg', 'tyields.parquet'))
+    save_frame(synthetic_yields(['USSO10 CMPN Curncy'], '2015-01-01', end, seed = seed),
+               os.path.join(data_dir, 'bbg', 'syields.parquet'))
+    return spreads.droplevel(1, axis = 1)
+
+async def _get(port, target):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {target} HTTP/1.1\r\n\r\n'.encode())
+    head = await reader.readuntil(b'\r\n\r\n')
+    length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+    body = json.loads(await reader.readexactly(length))
+    writer.close()
+    return int(head.split(b' ', 2)[1]), body
+
+def test_service_answers_and_refreshes(tmp_path, monkeypatch):
+    """Checks hot and cold range queries against the stored data, that a
+    query without a start returns the full history, and that a rewrite of the data is picked up by a refresh
+    """
+    monkeypatch.setattr(query, 'data_dir', tmp_path)
+    spreads = _store(tmp_path)
+
+    async def run():
+        service = SpreadService(hot_days = 365)
+        server = await asyncio.start_server(service.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            status, hot = await _get(port, '/spreads?tenors=2,10&start=2024-01-02&end=2024-01-31')
+            assert status == 200 and hot['columns'] == ['Arb_Swap_2', 'Arb_Swap_10']
+            expected = spreads.loc[pd.Timestamp('2024-01-02').date():pd.Timestamp('2024-01-31').date()]
+            assert hot['index'][0] == '2024-01-02' and len(hot['index']) == len(expected)
+            assert np.allclose(hot['data'], expected[['Arb_Swap_2', 'Arb_Swap_10']].to_numpy())
+
+            status, cold = await _get(port, '/spreads?tenors=5&start=2016-03-01&end=2016-03-31')
+            assert status == 200 and cold['index'][0] == '2016-03-01'
+            status, _ = await _get(port, '/yields?columns=GT10%20Govt,USSO10%20CMPN%20Curncy&start=2024-06-01')
+            assert status == 200
+            assert (await _get(port, '/spreads?tenors=7'))[0] == 400
+            status, full = await _get(port, '/spreads?tenors=30')
+            assert status == 200 and full['index'][0] == str(spreads.index[0])
+            assert len(full['index']) == len(spreads)
+
+            assert not await service.refresh()
+            _store(tmp_path, seed = 1, end = '2024-07-31')
+            assert await service.refresh()
+            _, body = await _get(port, '/spreads?tenors=10&start=2024-07-01')
+            assert body['index'][-1] == '2024-07-31'
+
+    asyncio.run(run())
+
+def test_load_test(tmp_path, monkeypatch):
+    """Runs the load test harness against the service
+    """
+    monkeypatch.setattr(query, 'data_dir', tmp_path)
+    _store(tmp_path)
+
+    async def run():
+        service = SpreadService()
+        server = await asyncio.start_server(service.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            targets = ['/spreads?tenors=10&start=2024-01-01', '/yields?columns=GT10 Govt', '/health']
+            return await load_test(targets, requests = 300, concurrency = 8, host = '127.0.0.1', port = port)
+
+    result = asyncio.run(run())
+    assert result['requests'] == 300 and result['errors'] == 0
+    assert result['rps'] > 0 and result['p50_ms'] <= result['p99_ms']
@@ -0,0 +1,65 @@
+"""
+Tests the rolling and regime statistics in spread_stats.py
+"""
+import os
+import numpy as np
+import pandas as pd
+import spread_stats
+from spread_stats import rolling_stats, rolling_quantiles, period_stats, stats_main
+from store import load_frame
+
+def _dummy_spreads(n = 600, seed = 0):
+    """Creates spreads shaped like the calc_swap_spreads output with missing values
+    """
+    names = [f'Arb_Swap_{year}' for year in [1, 2, 3, 5, 10, 20, 30]]
+    index = [x.date() for x in pd.bdate_range('2007-01-01', periods = n)]
+    data = np.random.default_rng(seed).normal(0, 10, (n, len(names))).cumsum(axis = 0)
+    data[np.random.default_rng(seed + 1).random(data.shape) < 0.03] = np.nan
+    columns = pd.MultiIndex.from_tuples([(name, '') for name in names])
+    return pd.DataFrame(data, index = index, columns = columns)
+
+def test_rolling_stats_match_pandas():
+    """Checks the one pass rolling statistics and quantiles against the pandas
+    rolling windows
+    """
+    df = _dummy_spreads()
+    flat = df.droplevel(1, axis = 1)
+    stats = rolling_stats(df, [5, 63], min_periods = [3, 40])
+    quantiles = rolling_quantiles(df, 21, q = (0.1, 0.5), min_periods = 15)
+    for name in flat.columns:
+        for window, min_periods in [(5, 3), (63, 40)]:
+            rolling = flat[name].rolling(window, min_periods = min_periods)
+            assert np.allclose(stats[(name, 'mean', str(window))], rolling.mean(), equal_nan = True)
+            assert np.allclose(stats[(name, 'std', str(window))], rolling.std(), equal_nan = True)
+            zscore = (flat[name] - rolling.mean()) / rolling.std()
+            assert np.allclose(stats[(name, 'zscore', str(window))], zscore, equal_nan = True)
+        rolling = flat[name].rolling(21, min_periods = 15)
+        assert np.allclose(quantiles[(name, 'q10')], rolling.quantile(0.1), equal_nan = True)
+        assert np.allclose(quantiles[(name, 'q50')], rolling.median(), equal_nan = True)
+
+def test_period_stats():
+    """Checks the yearly and regime aggregates against a direct computation
+    """
+    df = _dummy_spreads()
+    flat = df.droplevel(1, axis = 1)
+    yearly = period_stats(df, 'year')
+    assert list(yearly.index) == [2007, 2008, 2009]
+    in_2008 = flat.loc[pd.Timestamp('2008-01-01').date():pd.Timestamp('2008-12-31').date()]
+    assert np.isclose(yearly.loc[2008, ('Arb_Swap_10', 'mean')], in_2008['Arb_Swap_10'].mean())
+    assert yearly.loc[2008, ('Arb_Swap_10', 'count')] == in_2008['Arb_Swap_10'].count()
+
+    regime = period_stats(df, 'regime', {'Calm': '2000-01-01', 'Crisis': '2008-09-15'})
+    assert list(regime.index) == ['Calm', 'Crisis']
+    assert regime[('Arb_Swap_1', 'count')].sum() == flat['Arb_Swap_1'].count()
+
+def test_stats_main(tmp_path, monkeypatch):
+    """Checks that the tables and the rolling statistics are saved
+    """
+    monkeypatch.setattr(spread_stats, 'output_dir', tmp_path)
+    monkeypatch.setattr(spread_stats, 'data_dir', tmp_path)
+    results = stats_main(_dummy_spreads(), windows = [21, 63])
+    for name in ['summary', 'yearly', 'regime']:
+        assert os.path.exists(os.path.join(tmp_path, f'spread_stats_{name}.tex'))
+        assert os.path.exists(os.path.join(tmp_path, f'spread_stats_{name}.csv'))
+    stored = load_frame(os.path.join(tmp_path, 'stats', 'rolling_stats.parquet'), columns = ['Arb_Swap_5'])
+    assert np.allclose(stored.to_numpy(), results['rolling']['Arb_Swap_5'].to_numpy(), equal_nan = True)
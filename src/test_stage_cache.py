@@ -0,0 +1,68 @@
+"""
+Tests the content-addressed stage cache in stage_cache.
+"""
+import os
+import time
+import numpy as np
+import pandas as pd
+import stage_cache
+import store
+from settings import config
+from store import load_frame
+
+def _frame(seed, n = 50):
+    index = [x.date() for x in pd.bdate_range('2020-01-01', periods = n)]
+    return pd.DataFrame(np.random.default_rng(seed).normal(size = (n, 3)), index = index,
+                        columns = ['a', 'b', 'c'])
+
+def test_cached_hits_only_on_same_inputs(tmp_path, monkeypatch):
+    """Checks that the output is reused for equal inputs and parameters, with
+    the exact values also when frames are compacted, and recomputed when the
+    inputs, parameters or version change
+    """
+    monkeypatch.setattr(stage_cache, 'data_dir', tmp_path)
+    monkeypatch.setattr(store, 'config', lambda key: True if key == 'COMPACT_FRAMES' else config(key))
+    calls = []
+    def run(df, version = 1, params = None):
+        def compute():
+            calls.append(1)
+            return df * 2
+        return stage_cache.cached('double', version, [df], compute, params = params)
+
+    df = _frame(0)
+    assert run(df).equals(df * 2)
+    assert run(df.copy()).equals(df * 2)
+    assert len(calls) == 1
+    other = df.copy()
+    other.iloc[10, 1] += 1e-9
+    assert run(other).equals(other * 2)
+    run(df, version = 2)
+    run(df, params = {'limit': 3})
+    assert len(calls) == 4
+
+def test_cached_target(tmp_path, monkeypatch):
+    """Checks that the target always holds the output of the latest inputs,
+    also when that output comes from the cache, as a link to the entry
+    """
+    monkeypatch.setattr(stage_cache, 'data_dir', tmp_path)
+    target = os.path.join(tmp_path, 'out', 'target.parquet')
+    first, second = _frame(0), _frame(1)
+    for df in [first, second, first]:
+        stage_cache.cached('double', 1, [df], lambda: df * 2, target = target)
+        assert load_frame(target).equals(df * 2)
+        key = stage_cache.cache_key('double', 1, [df])
+        assert os.path.samefile(target, os.path.join(tmp_path, 'cache', f'double-{key[:32]}.parquet'))
+
+def test_evict_least_recently_used(tmp_path, monkeypatch):
+    """Checks that eviction removes the least recently used entries first
+    """
+    monkeypatch.setattr(stage_cache, 'data_dir', tmp_path)
+    frames = [_frame(i) for i in range(3)]
+    for df in frames:
+        stage_cache.cached('double', 1, [df], lambda: df * 2)
+        time.sleep(0.01)
+    time.sleep(0.01)
+    stage_cache.cached('double', 1, [frames[0]], lambda: frames[0] * 2)
+    removed = stage_cache.evict(max_entries = 2)
+    key = stage_cache.cache_key('double', 1, [frames[1]])
+    assert [os.path.basename(x) for x in removed] == [f'double-{key[:32]}.parquet']
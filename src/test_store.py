@@ -0,0 +1,62 @@
+"""
+Tests functions in store responsible for the columnar data files.
+"""
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import store
+
+def _dummy_df():
+    """Creates a frame shaped like the Bloomberg pulls, indexed by dates
+    """
+    index = [x.date() for x in pd.bdate_range('2008-01-01', '2011-12-31')]
+    columns = pd.MultiIndex.from_product([['GT1 Govt', 'GT2 Govt', 'GT5 Govt'], ['PX_LAST']])
+    data = np.random.default_rng(0).normal(3, 1, (len(index), len(columns)))
+    return pd.DataFrame(data, index = index, columns = columns)
+
+def test_save_load_frame(tmp_path):
+    """Checking that a frame round trips with its columns, dtypes and index,
+    and that each calendar year is written to its own row group
+    """
+    df = _dummy_df()
+    file = os.path.join(tmp_path, 'raw.parquet')
+    store.save_frame(df, file)
+    assert pq.ParquetFile(file).num_row_groups == 4
+    assert store.load_frame(file).equals(df)
+
+def test_save_load_mixed_frame(tmp_path):
+    """Checking that a raw pull mixing floats and '#N/A' strings in one column
+    is saved and read back with its values
+    """
+    df = _dummy_df().iloc[:4].astype(object)
+    df.iloc[:, 0] = [1.0, '#N/A', 2.0, 3.0]
+    df.iloc[2, 1] = None
+    file = os.path.join(tmp_path, 'raw.parquet')
+    store.save_frame(df, file)
+    out = store.load_frame(file)
+    assert out.iloc[:, 0].tolist() == [1.0, '#N/A', 2.0, 3.0]
+    assert out.iloc[:, 1].isna().tolist() == [False, False, True, False]
+    assert np.allclose(out.iloc[:, 2].astype(float), df.iloc[:, 2].astype(float))
+
+def test_load_frame_projection(tmp_path):
+    """Checking that only the requested columns and dates are returned
+    """
+    df = _dummy_df()
+    file = os.path.join(tmp_path, 'raw.parquet')
+    store.save_frame(df, file)
+    start, end = pd.Timestamp('2009-03-02').date(), pd.Timestamp('2010-06-30').date()
+    out = store.load_frame(file, columns = ['GT5 Govt'], start = start, end = end)
+    assert out.equals(df.loc[start:end, ['GT5 Govt']])
+
+def test_migrate_pickles(tmp_path, monkeypatch):
+    """Checking that pickles are converted to Parquet files with the same data
+    """
+    monkeypatch.setattr(store, 'data_dir', tmp_path)
+    os.makedirs(os.path.join(tmp_path, 'bbg'))
+    df = _dummy_df()
+    df.to_pickle(os.path.join(tmp_path, 'bbg', 'raw_tyields.pkl'))
+    written = store.migrate_pickles(remove = True)
+    assert written == [os.path.join(tmp_path, 'bbg', 'raw_tyields.parquet')]
+    assert not os.path.exists(os.path.join(tmp_path, 'bbg', 'raw_tyields.pkl'))
+    assert store.load_frame(written[0]).equals(df)
@@ -0,0 +1,58 @@
+"""
+Tests the streaming spread computation in stream_spreads.
+"""
+import os
+import numpy as np
+import pandas as pd
+from fake_blp import FakeBlp
+from calc_swap_spreads import calc_swap_spreads
+from stream_spreads import SpreadStream, replay
+from universe import spread_pairs
+
+def test_replay_matches_batch(tmp_path):
+    """Seeds a stream with part of a dummy history, replays the rest tick by
+    tick from a file, with missing yields written as empty cells, and checks the spreads and statistics against a batch
+    calculation over the full history
+    """
+    pairs = spread_pairs()
+    fake = FakeBlp()
+    treasury_df = fake.bdh(list(pairs['govt']), ['PX_LAST'], '2000-01-01', '2002-12-31')
+    swap_df = fake.bdh(list(pairs['swap']), ['PX_LAST'], '2000-01-01', '2002-12-31')
+    swap_df.iloc[100:130, 2] = np.nan
+    swap_df.iloc[600:606, 1] = np.nan
+
+    stream = SpreadStream(window = 60).seed(treasury_df.iloc[:500], swap_df.iloc[:500])
+    rows = []
+    for date in treasury_df.index[500:]:
+        for df in [treasury_df, swap_df]:
+            for col in df.columns:
+                rows.append((str(date), col[0], df.loc[date, col]))
+    file = os.path.join(tmp_path, 'replay.csv')
+    pd.DataFrame(rows, columns = ['timestamp', 'ticker', 'value']).to_csv(file, index = False)
+    updates = list(replay(stream, file))
+    assert len(updates) == len(rows)
+
+    arb = calc_swap_spreads(treasury_df, swap_df)
+    arb = arb[[f'Arb_Swap_{x}' for x in pairs['tenor']]].droplevel(1, axis = 1)
+    snapshot = stream.snapshot()
+    assert np.allclose(snapshot['Arb_Swap'], arb.iloc[-1])
+    assert np.allclose(snapshot['mean'], arb.mean())
+    assert np.allclose(snapshot['std'], arb.std())
+    assert np.allclose(snapshot['rolling_mean'], [arb[c].dropna().tail(60).mean() for c in arb])
+    assert np.allclose(snapshot['rolling_std'], [arb[c].dropna().tail(60).std() for c in arb])
+
+def test_update_unknown_ticker():
+    """Checks that tickers outside of the curve and late observations are
+    ignored, and that the Bloomberg ticker of a renamed column updates its
+    tenor
+    """
+    stream = SpreadStream()
+    assert stream.update('2024-01-02', 'GT7 Govt', 4.0) is None
+    stream.update('2024-01-02', 'USSO1 CMPN Curncy', 5.0)
+    update = stream.update('2024-01-02', 'GB12 Govt', 4.5)
+    assert update['tenor'] == '1'
+    assert np.isclose(update['Arb_Swap_1'], 50)
+
+    # An observation older than the last one does not move the stream back
+    assert stream.update('2024-01-01', 'USSO1 CMPN Curncy', 9.0) is None
+    assert np.isclose(stream.spreads[0], 50) and stream.last_time == pd.Timestamp('2024-01-02')
@@ -1,7 +1,11 @@
 """Test functions present in supplementary.py
 """
 from supplementary import *
+from pull_bloomberg import pull_raw_syields, pull_raw_tyields, clean_raw_syields, clean_raw_tyields
 from pandas.tseries.offsets import DateOffset
+from pathlib import Path
+
+output_dir = Path(config("OUTPUT_DIR"))
 
 def test_replication_df():
     """Tests replication_df to ensure that the output dataframe
@@ -35,3 +39,21 @@ def test_sup_table():
 
     assert os.path.exists(file)
 
+def test_sup_intervals(tmp_path):
+    """Checks that the table with intervals keeps the means of sup_table and
+    that every interval contains its mean
+    """
+    index = pd.date_range('2020-01-01', periods = 50).date
+    col = [f'Arb_Swap_{year}' for year in [1,20,2,30,3,5,10]]
+    arb_df = pd.DataFrame(np.random.default_rng(0).normal(size = (50, 7)), index = index, columns = col)
+
+    means = sup_table(arb_df, os.path.join(tmp_path, 'table.txt'))
+    file = os.path.join(tmp_path, 'table_intervals.txt')
+    table = sup_intervals(arb_df, file, reps = 200, max_workers = 1)
+
+    assert os.path.exists(file)
+    assert isinstance(means, pd.Series)
+    assert list(table.columns) == ['Mean(bps)', 'SE(bps)', 'CI low(bps)', 'CI high(bps)']
+    assert table['Mean(bps)'].equals(means.rename('Mean(bps)'))
+    assert (table['CI low(bps)'] <= table['Mean(bps)']).all() and (table['Mean(bps)'] <= table['CI high(bps)']).all()
+
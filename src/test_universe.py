@@ -0,0 +1,46 @@
+"""
+Tests functions in universe responsible for the instrument manifest.
+"""
+import os
+import numpy as np
+import pandas as pd
+import universe
+from calc_swap_spreads import calc_swap_spreads
+
+def test_default_universe():
+    """Checking that the default manifest reproduces the original US tickers
+    """
+    months = [1, 2, 3, 4, 6, 12]
+    years = [2, 3, 5, 7, 10, 20, 30]
+    assert universe.govt_tickers() == [f'GB{x} Govt' for x in months] + [f'GT{x} Govt' for x in years]
+    assert universe.govt_rename() == {'GB12 Govt': 'GT1 Govt'}
+    assert universe.swap_tickers() == [f'USSO{x} CMPN Curncy' for x in [1, 2, 3, 5, 10, 20, 30]]
+    assert universe.plot_tenors('US') == ['1', '20', '2', '30', '3', '5', '10']
+
+def test_custom_universe(tmp_path, monkeypatch):
+    """Checking that a manifest with another curve drives the spread calculation
+    """
+    file = os.path.join(tmp_path, 'universe.csv')
+    pd.DataFrame({
+        'curve': ['US', 'EUR', 'EUR', 'EUR'],
+        'tenor': ['1', '2', '5', '7'],
+        'years': [1, 2, 5, 7],
+        'govt': ['GT1 Govt', 'GTDEM2Y Govt', 'GTDEM5Y Govt', 'GTDEM7Y Govt'],
+        'govt_source': [None] * 4,
+        'swap': ['USSO1 CMPN Curncy', 'EUSWE2 Curncy', 'EUSWE5 Curncy', None],
+        'plot_order': [1, 2, 1, None],
+    }).to_csv(file, index = False)
+    monkeypatch.setattr(universe, 'config', lambda key: {'UNIVERSE_FILE': file, 'CURVE': 'EUR'}[key])
+
+    assert universe.govt_tickers('EUR') == ['GTDEM2Y Govt', 'GTDEM5Y Govt', 'GTDEM7Y Govt']
+    assert universe.swap_tickers() == ['USSO1 CMPN Curncy', 'EUSWE2 Curncy', 'EUSWE5 Curncy']
+    assert universe.plot_tenors() == ['5', '2']
+
+    index = pd.date_range('2020-01-01', periods = 3)
+    govt = pd.DataFrame(np.ones((3, 3)), index = index, columns = ['GTDEM2Y Govt', 'GTDEM5Y Govt', 'GTDEM7Y Govt'])
+    swap = pd.DataFrame(np.full((3, 2), 1.5), index = index, columns = ['EUSWE2 Curncy', 'EUSWE5 Curncy'])
+    output = calc_swap_spreads(govt, swap, curve = 'EUR')
+    assert list(output.columns) == ['Arb_Swap_2', 'Arb_Swap_5', 'tswap_2_rf', 'tswap_5_rf']
+    assert len(output) > 0
+    assert (output[['Arb_Swap_2', 'Arb_Swap_5']] == 50).all().all()
+    assert (output[['tswap_2_rf', 'tswap_5_rf']] == 150).all().all()
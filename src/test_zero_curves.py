@@ -0,0 +1,49 @@
+"""
+Tests the zero and forward curve bootstrap in zero_curves.py
+"""
+import numpy as np
+import universe
+import zero_curves
+from calc_swap_spreads import calc_swap_spreads
+from synthetic import synthetic_yields
+
+def test_bootstrap_matches_solve():
+    """Checking the closed form discount factors against solving the
+    triangular system of every date, and the rates of a flat par curve
+    """
+    rng = np.random.default_rng(0)
+    par = rng.uniform(0.5, 5, (50, 1)) + np.cumsum(rng.uniform(-0.05, 0.15, (50, 60)), axis = 1)
+    discount = zero_curves.bootstrap_discount(par, 2)
+    a = par / 100 / 2
+    systems = np.tril(np.ones((60, 60)))[None] * a[:, :, None] + np.eye(60)[None]
+    expected = np.linalg.solve(systems, np.ones((50, 60, 1)))[..., 0]
+    assert np.allclose(discount, expected, rtol = 0, atol = 1e-12)
+
+    # A par curve flat at c has discount factors (1 + c / f) ** -k
+    flat = np.full((2, 4), 4.0)
+    zero, forward = zero_curves.leg_rates(flat, [1, 2, 3, 5], [1, 2, 5], 1)
+    assert np.allclose(zero, 100 * np.log(1.04))
+    assert np.allclose(forward, 100 * np.log(1.04))
+    zero, _ = zero_curves.leg_rates(flat, [1, 2, 3, 5], [1, 2, 5], 2)
+    assert np.allclose(zero, 200 * np.log(1.02))
+
+def test_zero_forward_spreads():
+    """Checking the layout against calc_swap_spreads, that the zero and par
+    spreads agree at the first coupon date of both legs, and that missing
+    yields are interpolated over
+    """
+    govt = synthetic_yields(universe.govt_tickers('US'), '2019-01-01', '2020-12-31', seed = 1)
+    govt = govt.rename(columns = universe.govt_rename('US'))
+    swap = synthetic_yields(universe.swap_tickers('US'), '2019-01-01', '2020-12-31', seed = 2)
+    govt.iloc[10:20, 8] = np.nan
+    expected = calc_swap_spreads(govt, swap)
+    zero_df, forward_df = zero_curves.zero_forward_spreads(govt, swap, method = 'linear')
+    for df in [zero_df, forward_df]:
+        assert df.columns.equals(expected.columns)
+        assert df.index.equals(expected.index)
+        assert not df.isna().any().any()
+
+    # At one year the swap pays once, so its zero rate is ln(1 + c)
+    swap_1 = expected[('tswap_1_rf', '')] / 100
+    assert np.allclose(zero_df[('tswap_1_rf', '')], 100 * 100 * np.log(1 + swap_1 / 100))
+    assert np.allclose(forward_df[('tswap_1_rf', '')], zero_df[('tswap_1_rf', '')])
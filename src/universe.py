@@ -0,0 +1,134 @@
+"""
+Loads the instrument universe which drives the pulls, spread calculations,
+tables and plots.
+
+The universe is a manifest (UNIVERSE_FILE, by default
+`data_manual/universe.csv`) with one row per curve and tenor:
+
+ - `curve`: name of the curve, e.g. US
+ - `tenor`: label used in column names such as `Arb_Swap_{tenor}`
+ - `years`: maturity in years
+ - `govt`: column name of the government yield
+ - `govt_source`: Bloomberg ticker of the government yield, if it differs
+   from `govt`
+ - `swap`: ticker of the swap yield, left empty for tenors without a swap
+ - `plot_order`: order of the tenor in the plots
+ - `calendar`: optional holiday calendar of the curve's business days, one of
+   calendars.CALENDARS, CALENDAR where it is left empty
+"""
+
+from functools import lru_cache
+
+import pandas as pd
+from settings import config
+
+@lru_cache(maxsize = None)
+def _read_universe(file):
+    df = pd.read_csv(file, dtype = {'curve': str, 'tenor': str, 'govt': str,
+                                    'govt_source': str, 'swap': str, 'calendar': str})
+    if 'calendar' not in df:
+        df['calendar'] = None
+    df['govt_source'] = df['govt_source'].fillna(df['govt'])
+    df['plot_order'] = df['plot_order'].astype('Int64')
+    return df
+
+def load_universe(file = None):
+    """Loads the instrument universe manifest
+
+    :param file: Path of the manifest, defaults to UNIVERSE_FILE
+    :type file: str
+
+    :return: One row per curve and tenor
+    :rtype: pd.DataFrame
+    """
+    file = config('UNIVERSE_FILE') if file is None else file
+    return _read_universe(str(file)).copy()
+
+def _curves(df, curves):
+    """Rows of the requested curves, all curves if curves is None
+    """
+    if curves is None:
+        return df
+    if isinstance(curves, str):
+        curves = [curves]
+    return df[df['curve'].isin(curves)]
+
+def govt_tickers(curves = None):
+    """Bloomberg tickers of the government yields
+
+    :param curves: Curves to include, defaults to None which includes all
+    :type curves: list or str
+
+    :rtype: list
+    """
+    return list(_curves(load_universe(), curves)['govt_source'])
+
+def govt_rename(curves = None):
+    """Mapping of the government Bloomberg tickers to their column names
+
+    :param curves: Curves to include, defaults to None which includes all
+    :type curves: list or str
+
+    :rtype: dict
+    """
+    df = _curves(load_universe(), curves)
+    df = df[df['govt_source'] != df['govt']]
+    return dict(zip(df['govt_source'], df['govt']))
+
+def swap_tickers(curves = None):
+    """Bloomberg tickers of the swap yields
+
+    :param curves: Curves to include, defaults to None which includes all
+    :type curves: list or str
+
+    :rtype: list
+    """
+    return list(_curves(load_universe(), curves)['swap'].dropna())
+
+def spread_pairs(curve = None):
+    """Tenors of a curve which have both a government and a swap yield
+
+    :param curve: Curve name, defaults to CURVE
+    :type curve: str
+
+    :return: Rows with the tenor, years, govt and swap columns
+    :rtype: pd.DataFrame
+    """
+    curve = config('CURVE') if curve is None else curve
+    df = _curves(load_universe(), curve)
+    return df.dropna(subset = ['swap']).reset_index(drop = True)
+
+def curve_calendar(curve = None):
+    """Holiday calendar of a curve
+
+    :param curve: Curve name, defaults to CURVE
+    :type curve: str
+
+    :return: The calendar of the manifest, None where it is left empty so
+    that CALENDAR is used
+    :rtype: str
+    """
+    curve = config('CURVE') if curve is None else curve
+    calendars = _curves(load_universe(), curve)['calendar'].dropna()
+    return calendars.iloc[0] if len(calendars) else None
+
+def spread_tenors(curve = None):
+    """Tenor labels of the spreads of a curve
+
+    :param curve: Curve name, defaults to CURVE
+    :type curve: str
+
+    :rtype: list
+    """
+    return list(spread_pairs(curve)['tenor'])
+
+def plot_tenors(curve = None):
+    """Tenor labels of the spreads of a curve in plotting order
+
+    :param curve: Curve name, defaults to CURVE
+    :type curve: str
+
+    :rtype: list
+    """
+    df = spread_pairs(curve)
+    return list(df.sort_values('plot_order', kind = 'stable')['tenor'])
@@ -0,0 +1,169 @@
+"""
+Zero and forward curves bootstrapped from the par yields.
+
+The government and swap legs are only quoted as par yields, so their spread is
+a difference of par yields. For every date at once, the par yields of a leg
+are interpolated onto its coupon dates k / f (f = 2 for treasuries, 1 for
+SOFR OIS), the shortest yield being extended flat to the first coupon date,
+and the discount factors DF_k of par instruments maturing on the coupon dates
+are bootstrapped from
+
+    c_k / f * (DF_1 + ... + DF_k) + DF_k = 1
+
+This lower triangular system has a closed form: with a_k = c_k / f and
+P_k = (1 + a_1) ... (1 + a_k), the annuity S_k = DF_1 + ... + DF_k is
+(1 + P_1 + ... + P_{k-1}) / P_k, so the discount factors of every date and
+maturity come from one cumulative product and one cumulative sum over the
+(date x coupon date) par yields.
+
+Zero rates are continuously compounded, -ln(DF(T)) / T, and forward rates are
+the one year forwards ending at each tenor, ln(DF(T - 1) / DF(T)). The zero
+and forward spreads are returned in the layout of calc_swap_spreads.
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from calc_swap_spreads import _align, _column_positions, _spread_columns
+from calendars import take
+from interpolation import interpolate
+from settings import config
+from store import save_frame
+from universe import load_universe, spread_pairs
+
+data_dir = Path(config("DATA_DIR"))
+
+## Coupons per year of the par yields of each leg
+FREQUENCIES = {'govt': 2, 'swap': 1}
+## Length in years of the forward periods ending at each tenor
+FORWARD_YEARS = 1
+KINDS = ['zero', 'forward']
+
+def coupon_grid(max_years, frequency):
+    """Coupon dates in years up to a maturity
+
+    :rtype: np.ndarray
+    """
+    return np.arange(1, int(np.ceil(max_years * frequency - 1e-9)) + 1) / frequency
+
+def bootstrap_discount(par, frequency):
+    """Discount factors of par instruments maturing on consecutive coupon
+    dates, for every row at once
+
+    :param par: Par yields in percent of shape (date x coupon date), the k-th
+    column maturing on the k-th coupon date
+    :type par: np.ndarray
+    :param frequency: Coupons per year
+    :type frequency: int
+
+    :return: Discount factors of the same shape, NaN from the first missing
+    par yield of a row on
+    :rtype: np.ndarray
+    """
+    a = np.asarray(par, dtype = np.float64) / 100 / frequency
+    products = np.cumprod(1 + a, axis = 1)
+    previous = np.ones_like(products)
+    previous[:, 1:] = products[:, :-1]
+    annuity = np.cumsum(previous, axis = 1) / products
+    return np.diff(annuity, axis = 1, prepend = 0)
+
+def _fill_short_end(values):
+    """Extends the first valid value of every row to the columns before it
+    """
+    valid = ~np.isnan(values)
+    first = np.where(valid.any(axis = 1), valid.argmax(axis = 1), 0)
+    before = np.arange(values.shape[1])[None, :] < first[:, None]
+    return np.where(before, values[np.arange(len(values)), first][:, None], values)
+
+def leg_rates(par, years, tenors, frequency, method = 'linear'):
+    """Zero and forward rates of one leg at some tenors
+
+    :param par: Par yields in percent of shape (date x instrument)
+    :type par: np.ndarray
+    :param years: Maturities of the instruments in years
+    :type years: list
+    :param tenors: Maturities in years to return the rates at, on the coupon
+    dates of the leg
+    :type tenors: list
+    :param frequency: Coupons per year
+    :type frequency: int
+    :param method: Interpolation of the par yields, see interpolation.py
+    :type method: str, default = 'linear'
+
+    :return: Zero and forward rates in percent of shape (date x tenor)
+    :rtype: tuple(np.ndarray, np.ndarray)
+    """
+    tenors = np.asarray(tenors, dtype = np.float64)
+    grid = coupon_grid(max(max(years), tenors.max()), frequency)
+    par_grid = _fill_short_end(interpolate(par, list(years), grid, method))
+    discount = np.concatenate([np.ones((len(par_grid), 1)), bootstrap_discount(par_grid, frequency)], axis = 1)
+
+    # Column 0 holds the discount factor of today
+    at = np.rint(tenors * frequency).astype(int)
+    start = np.rint(np.maximum(tenors - FORWARD_YEARS, 0) * frequency).astype(int)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        zero = -100 * np.log(discount[:, at]) / tenors
+        forward = 100 * np.log(discount[:, start] / discount[:, at]) / (tenors - start / frequency)
+    return zero, forward
+
+def zero_forward_spreads(treasury_df, swap_df, curve = None, method = None):
+    """Zero and forward spreads of every tenor pair of a curve, on the dates of
+    calc_swap_spreads
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+    :param curve: Curve of the instrument universe, defaults to CURVE
+    :type curve: str
+    :param method: Interpolation of the par yields, defaults to INTERP_METHOD
+    :type method: str
+
+    :return: The zero and the forward spreads and swap rates in bps, each in
+    the layout of calc_swap_spreads
+    :rtype: tuple(pd.DataFrame, pd.DataFrame)
+    """
+    curve = config('CURVE') if curve is None else curve
+    method = config('INTERP_METHOD') if method is None else method
+    pairs = spread_pairs(curve)
+    universe = load_universe()
+    legs = {'govt': universe[universe['curve'] == curve], 'swap': pairs}
+
+    index, t_rows, s_rows = _align(treasury_df, swap_df, curve)
+    rates = {}
+    for leg, df, rows in [('govt', treasury_df, t_rows), ('swap', swap_df, s_rows)]:
+        # Government yields of the curve missing from the frame are left out
+        labels = set(df.columns.get_level_values(0))
+        instruments = legs[leg][legs[leg][leg].isin(labels)]
+        cols = _column_positions(df, instruments[leg])
+        par = take(df.iloc[:, cols].to_numpy(np.float64), rows[:, cols])
+        rates[leg] = leg_rates(par, list(instruments['years']), list(pairs['years']),
+                               FREQUENCIES[leg], method)
+
+    columns = _spread_columns(pairs['tenor'], swap_df.columns.nlevels)
+    frames = []
+    for k in range(len(KINDS)):
+        govts, swaps = rates['govt'][k], rates['swap'][k]
+        values = 100 * np.concatenate([swaps - govts, swaps], axis = 1)
+        keep = ~np.isnan(values).all(axis = 1)
+        frames.append(pd.DataFrame(values[keep], index = index[keep], columns = columns))
+    return frames[0], frames[1]
+
+def zero_main(treasury_df, swap_df):
+    """Calculates the zero and forward spreads and saves them to
+    DATA_DIR/calc_spread/zero_spreads.parquet and forward_spreads.parquet
+
+    :param treasury_df: DataFrame containing the treasury yield data
+    :type treasury_df: pd.DataFrame
+    :param swap_df: DataFrame containing the swap yield data
+    :type swap_df: pd.DataFrame
+
+    :return: The zero spreads
+    :rtype: pd.DataFrame
+    """
+    zero_df, forward_df = zero_forward_spreads(treasury_df, swap_df)
+    for kind, df in zip(KINDS, [zero_df, forward_df]):
+        save_frame(df, os.path.join(data_dir, 'calc_spread', f'{kind}_spreads.parquet'))
+    return zero_df